@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.DEBUG:
+    # serve the admin's static files in development, as runserver does
+    from django.contrib.staticfiles.handlers import (  # noqa: E402
+        ASGIStaticFilesHandler,
+    )
+    django_application = ASGIStaticFilesHandler(django_application)
+
+# each worker process listens for cache invalidations of the others
+from core.invalidation import start_listener  # noqa: E402
+from core.sse import EventStreamRouter  # noqa: E402
+
+start_listener()
+
+# change event streams are served outside django's request handling,
+# which would hold a thread per open stream
+application = EventStreamRouter(django_application)
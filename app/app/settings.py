@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # compression has to run on the final response body
+    # so it sits above everything that may change it
+    'core.middleware.CompressionMiddleware',
+    # api requests leave here for API_MIDDLEWARE, see below
+    'core.middleware.ApiFastPathMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,6 +62,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# token-authenticated api routes skip the session, csrf, auth, message
+# and clickjacking middleware above; admin and docs keep the full stack
+API_PREFIXES = ['/api/recipe/', '/api/user/', '/api/media/']
+API_MIDDLEWARE = [
+    'django.middleware.common.CommonMiddleware',
+]
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -91,6 +104,66 @@ DATABASES = {
     }
 }
 
+# read replicas, e.g. DB_REPLICA_HOSTS=db-replica-1,db-replica-2
+# every replica uses the same name and credentials as the primary
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',')
+    if host
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# reads stay on the primary this long after a user writes
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE = 'shared'
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+# 'default' stays per process (throttles, token lookups), 'shared' is
+# seen by every process, e.g. SHARED_CACHE_LOCATION=memcached:11211.
+# without a location a process local stand-in is used
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('SHARED_CACHE_LOCATION'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.environ['SHARED_CACHE_LOCATION'].split(','),
+        'OPTIONS': {'use_pooling': True},
+    }
+
+# see core.tiered_cache.TieredCache
+# L1 is each process' LRU, L2 the alias above
+TIERED_CACHE = {
+    'L2': 'shared',
+    'L1_TTL': 30,
+    'L1_MAX_ENTRIES': 10000,
+    'L1_MAX_BYTES': 64 * 1024 * 1024,
+    # > 1 refreshes earlier, < 1 later
+    'BETA': 1.0,
+}
+RECIPE_LIST_CACHE_SECONDS = 300
+USER_CACHE_SECONDS = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -111,6 +184,48 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# argon2 defaults follow the OWASP minimum (19 MiB, 2 passes, 1 lane)
+# the first hasher is used for new passwords, the others still verify
+# existing ones and get migrated to the first on the next login
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+
+PASSWORD_HASHERS = {
+    'argon2': 'core.hashers.TunedArgon2PasswordHasher',
+    'bcrypt_sha256': 'core.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2_sha256': 'core.hashers.TunedPBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHERS.pop(PASSWORD_HASHER)] + [
+    hasher for name, hasher in PASSWORD_HASHERS.items()
+    # bcrypt needs the optional bcrypt package
+    if name != 'bcrypt_sha256'
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+PASSWORD_HASHER_PARAMS = {
+    'argon2': {
+        'time_cost': int(os.environ.get('ARGON2_TIME_COST', 2)),
+        'memory_cost': int(os.environ.get('ARGON2_MEMORY_COST', 19456)),
+        'parallelism': int(os.environ.get('ARGON2_PARALLELISM', 1)),
+    },
+    'bcrypt_sha256': {
+        'rounds': int(os.environ.get('BCRYPT_ROUNDS', 12)),
+    },
+    'pbkdf2_sha256': {
+        'iterations': int(os.environ.get('PBKDF2_ITERATIONS', 260000)),
+    },
+}
+
+# hashing runs on a bounded thread pool, see core.hashers.HashPool
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+)
+PASSWORD_HASH_QUEUE_SIZE = 32
+PASSWORD_HASH_QUEUE_TIMEOUT = 2
+
+AUTHENTICATION_BACKENDS = ['core.backends.PooledModelBackend']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -130,11 +245,49 @@ USE_TZ = True
 
 # STATIC_URL = '/static/'
 STATIC_URL = '/static/static/'
-MEDIA_URL = '/static/media/'
+# media is served by core.media.MediaView, which checks ownership
+MEDIA_URL = '/api/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# 'content' stores recipe images under the sha256 of their content,
+# so identical uploads share one file; 'uuid' gives each its own
+IMAGE_STORAGE_MODE = os.environ.get('IMAGE_STORAGE_MODE', 'content')
+
+# 'local' keeps recipe images below MEDIA_ROOT, 'object' puts them in
+# an S3 compatible bucket (uuid names) so app containers share them.
+# OBJECT_STORAGE['CLIENT'] = 'local' swaps S3 for a directory based
+# stand-in; ENDPOINT_URL can point the s3 client at e.g. MinIO
+MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local')
+OBJECT_STORAGE = {
+    'CLIENT': os.environ.get('OBJECT_STORAGE_CLIENT', 's3'),
+    'BUCKET': os.environ.get('OBJECT_STORAGE_BUCKET', 'recipe-media'),
+    'ENDPOINT_URL': os.environ.get('OBJECT_STORAGE_ENDPOINT_URL', ''),
+    'REGION': os.environ.get('OBJECT_STORAGE_REGION', ''),
+    'ACCESS_KEY': os.environ.get('OBJECT_STORAGE_ACCESS_KEY', ''),
+    'SECRET_KEY': os.environ.get('OBJECT_STORAGE_SECRET_KEY', ''),
+    'LOCAL_ROOT': os.environ.get('OBJECT_STORAGE_LOCAL_ROOT', '/vol/web/s3'),
+    'MAX_CONNECTIONS': int(os.environ.get('OBJECT_STORAGE_CONNECTIONS', 10)),
+    'PART_SIZE': 8 * 1024 * 1024,
+    'PRESIGN_SECONDS': 300,
+}
+
+# how MediaView hands files over:
+#   'x-accel-redirect' nginx sends MEDIA_ACCEL_PREFIX + name, e.g.
+#       location /protected-media/ { internal; alias /vol/web/media/; }
+#   'x-sendfile' apache/lighttpd send the file at the path given
+#   'django' the wsgi server sends it, with sendfile() where it can
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# resumable image uploads, see core.uploads
+UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+# unfinished uploads are dropped by `manage.py gc_recipes`
+UPLOAD_SESSION_TTL = timedelta(days=1)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -142,10 +295,90 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'  # setting Auth_User_Model config
 
+# soft-deleted rows are removed by core.purge, in batches
+# from a background thread, or with `manage.py purge_deleted`
+PURGE_BATCH_SIZE = 500
+PURGE_IN_BACKGROUND = os.environ.get('PURGE_IN_BACKGROUND', '1') == '1'
+
+# `manage.py gc_recipes` leaves image files younger than this alone,
+# an upload is written before the row that references it is saved
+GC_IMAGE_MIN_AGE = timedelta(hours=1)
+
+# admin changelists of bigger unfiltered tables show pg_class.reltuples
+# instead of running COUNT(*), see core.admin.EstimatedCountPaginator
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# changes returned per /api/recipe/sync response
+SYNC_PAGE_SIZE = 500
+
+# recipes one /api/recipe/recipes/shopping-list/ request may combine
+SHOPPING_LIST_MAX_RECIPES = 100
+
+# ids one /api/recipe/recipes/batch/ request may ask for
+RECIPE_BATCH_MAX_IDS = 100
+
+# in-memory tag and ingredient index for pantry and similar-recipe
+# queries, see core.recipe_index. an index is rebuilt instead of
+# caught up past REBUILD_AFTER changes
+RECIPE_INDEX_MAX_USERS = 1000
+RECIPE_INDEX_MAX_RECIPES = 5000000
+RECIPE_INDEX_REBUILD_AFTER = 1000
+PANTRY_MAX_RESULTS = 100
+SIMILAR_MAX_RESULTS = 50
+
+# change event streams, see core.sse.EventStream
+# only served by the asgi application, e.g. uvicorn app.asgi:application
+SSE_PATH = '/api/recipe/events'
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 10000))
+# events a stream may fall behind before it catches up from the db
+SSE_QUEUE_SIZE = 100
+SSE_KEEPALIVE = 15
+SSE_RETRY_MS = 3000
+
+# cache invalidation between processes, see core.invalidation
+# events are sent over postgres NOTIFY, batched for BATCH_WINDOW seconds
+INVALIDATION_BUS = bool(int(os.environ.get('INVALIDATION_BUS', 1)))
+INVALIDATION_BATCH_WINDOW = 0.01
+INVALIDATION_KEEPALIVE = 30
+INVALIDATION_RECONNECT_DELAY = 1
+
+# api tokens, see core.models.AuthToken
+TOKEN_TTL = timedelta(days=int(os.environ.get('TOKEN_TTL_DAYS', 7)))
+TOKEN_CACHE_SECONDS = 60
+
+# signed access tokens, see core.signed_tokens
+ACCESS_TOKEN_TTL = timedelta(
+    seconds=int(os.environ.get('ACCESS_TOKEN_TTL_SECONDS', 300))
+)
+ACCESS_TOKEN_SIGNING_KEY = os.environ.get(
+    'ACCESS_TOKEN_SIGNING_KEY',
+    SECRET_KEY
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # token buckets, see core.throttling
+    # '600/min' allows bursts of 600 requests and refills 10 a second
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.environ.get('THROTTLE_USER_RATE', '600/min'),
+        'recipe-list': os.environ.get('THROTTLE_RECIPE_LIST_RATE', '120/min'),
+    },
 }
 
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# written by `manage.py build_schema`, served by /api/schema/
+SCHEMA_DIR = os.environ.get('SCHEMA_DIR', '/vol/web/schema')
+SCHEMA_CACHE_MAX_AGE = 60 * 5
+
+# Response compression
+# br and zstd are only offered when brotli / zstandard are installed
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_PREFERENCE = ['br', 'zstd', 'gzip']
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+# compressed variants of cacheable responses, shared by every process
+COMPRESSION_CACHE = 'shared'
+COMPRESSION_CACHE_TIMEOUT = 60 * 60
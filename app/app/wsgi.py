@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# each worker process listens for cache invalidations of the others
+from core.invalidation import start_listener  # noqa: E402
+
+start_listener()
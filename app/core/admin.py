@@ -3,11 +3,157 @@ django admin page customisation
 this seems to be updating/customising the admin page (like frontend)
 """
 
+from collections import defaultdict
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 # won't be used here but for the future (translation)
 from django.utils.translation import gettext_lazy as _
 from core import models
+from core.purge import schedule_purge
+
+
+def estimate_count(model):
+    # row count of model's table as estimated by postgres
+    # None on other databases or before the table was analyzed
+
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    # paginator that doesn't count big tables
+    #
+    # an unfiltered changelist would run COUNT(*) over the whole
+    # table on every page view. above ADMIN_ESTIMATED_COUNT_THRESHOLD
+    # rows the planner's estimate is used instead; filtered lists
+    # still get an exact count.
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset.model)
+            if estimate is not None and \
+                    estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+
+        return super().count
+
+
+class DeletedFilter(admin.SimpleListFilter):
+    # filter on the soft-delete flag
+
+    title = _('deleted')
+    parameter_name = 'deleted'
+
+    def lookups(self, request, model_admin):
+        return (('0', _('No')), ('1', _('Yes')))
+
+    def queryset(self, request, queryset):
+        if self.value() == '0':
+            return queryset.filter(deleted_at__isnull=True)
+        if self.value() == '1':
+            return queryset.filter(deleted_at__isnull=False)
+
+        return queryset
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    # admin for soft-deletable models with millions of rows
+    #
+    # every bulk action is a single UPDATE over the selection,
+    # and django's delete_selected, which loads each object and
+    # its relations for the confirmation page, is left out.
+
+    paginator = EstimatedCountPaginator
+    # "x of y" needs a second, unfiltered COUNT(*)
+    show_full_result_count = False
+    list_filter = [DeletedFilter]
+    ordering = ['-id']
+    raw_id_fields = ['user']
+    actions = ['soft_delete_selected', 'restore_selected']
+
+    def get_queryset(self, request):
+        # admins see flagged rows too, until the purge removes them
+        return self.model.all_objects.order_by(*self.get_ordering(request))
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+
+        return actions
+
+    def record_changes(self, rows, deleted=False):
+        # log (user id, object id) rows for sync, per owner
+        # the change kind is the model name, e.g. 'recipe'
+
+        object_ids = defaultdict(list)
+        for user_id, object_id in rows:
+            object_ids[user_id].append(object_id)
+        for user_id, ids in object_ids.items():
+            models.Change.objects.record(
+                user_id,
+                self.model._meta.model_name,
+                ids,
+                deleted=deleted,
+            )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.record_changes([(obj.user_id, obj.id)])
+
+    def get_deleted_objects(self, objs, request):
+        # deleting only flags the rows and nothing cascades,
+        # so the confirmation page doesn't walk the relations
+
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        # the delete button flags the row, like the bulk action
+        self.delete_queryset(request, self.model.all_objects.filter(
+            pk=obj.pk
+        ))
+
+    def delete_queryset(self, request, queryset):
+        # return the number of rows flagged
+        queryset = queryset.filter(deleted_at__isnull=True)
+        rows = list(queryset.values_list('user_id', 'id'))
+        count = queryset.soft_delete()
+        self.record_changes(rows, deleted=True)
+        schedule_purge()
+
+        return count
+
+    @admin.action(description=_('Delete selected %(verbose_name_plural)s'))
+    def soft_delete_selected(self, request, queryset):
+        count = self.delete_queryset(request, queryset)
+        self.message_user(request, _('%d deleted.') % count)
+
+    @admin.action(description=_('Restore selected %(verbose_name_plural)s'))
+    def restore_selected(self, request, queryset):
+        queryset = queryset.filter(deleted_at__isnull=False)
+        rows = list(queryset.values_list('user_id', 'id'))
+        count = queryset.update(deleted_at=None)
+        self.record_changes(rows)
+        self.message_user(request, _('%d restored.') % count)
 
 
 class UserAdmin(BaseUserAdmin):
@@ -51,7 +197,36 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class RecipeAdmin(SoftDeleteAdmin):
+    # define admin pages for recipes
+
+    list_display = ['id', 'title', 'user', 'price', 'time_minutes',
+                    'deleted_at']
+    list_select_related = ['user']
+    # '^' searches by prefix, which can use the upper(title) index
+    search_fields = ['^title']
+    # tags and ingredients are searched as you type instead of
+    # rendering every row of both tables into the form
+    autocomplete_fields = ['tags', 'ingredients']
+
+
+class RecipeAttrAdmin(SoftDeleteAdmin):
+    # define admin pages for tags and ingredients
+
+    list_display = ['id', 'name', 'user', 'deleted_at']
+    list_select_related = ['user']
+    search_fields = ['^name']
+
+    def get_search_results(self, request, queryset, search_term):
+        # recipes can't be linked to rows that are about to be purged
+        match = request.resolver_match
+        if match and match.url_name == 'autocomplete':
+            queryset = queryset.filter(deleted_at__isnull=True)
+
+        return super().get_search_results(request, queryset, search_term)
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
@@ -0,0 +1,150 @@
+"""
+authentication classes for the api
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from core.models import (
+    AuthToken,
+    token_cache_key,
+)
+from core.signed_tokens import (
+    InvalidAccessToken,
+    decode_access_token,
+)
+
+
+class TokenPrincipal:
+    # lightweight stand-in for the authenticated user
+    #
+    # carries what the api needs on every request: id, is_active
+    # and is_staff. anything else, e.g. `email` or `has_perm()`,
+    # loads the full User row on first access and is then served
+    # from it, so views that only filter by user id never query
+    # the user table.
+    # signed access tokens are only issued to active users and
+    # expire within minutes; token authentication passes is_active
+    # along with the token.
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, is_staff=None, is_active=True):
+        self.id = self.pk = user_id
+        self.is_active = is_active
+        if is_staff is not None:
+            # unknown is_staff is loaded with the user instead
+            self.is_staff = is_staff
+
+    def get_full_user(self):
+        # return the User row behind this principal, loading it once
+
+        user = self.__dict__.get('_user')
+        if user is None:
+            try:
+                user = get_user_model().objects.get(pk=self.id)
+            except get_user_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(
+                    _('User inactive or deleted.')
+                )
+            self.__dict__['_user'] = user
+
+        return user
+
+    def __getattr__(self, name):
+        # only called for attributes the principal doesn't carry
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return getattr(self.get_full_user(), name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk and \
+            getattr(other, 'is_authenticated', False)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'user {self.id}'
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    # `Authorization: Token <key>` against expiring AuthTokens
+    #
+    # a token is looked up by its primary key, joined to its user,
+    # and (user id, expiry, user is active) is cached for
+    # TOKEN_CACHE_SECONDS so repeated requests skip both tables.
+    # revoking tokens deletes the cached entries as well. a user
+    # deactivated without the post_save signal, e.g. through
+    # QuerySet.update(), is refused within TOKEN_CACHE_SECONDS.
+    # the user itself is only loaded if a view asks for more than
+    # its id, see TokenPrincipal.
+
+    model = AuthToken
+
+    def get_token(self, key):
+        # return (user_id, expires_at, is_active) for key
+
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        cached = AuthToken.objects.filter(key=key).values_list(
+            'user_id', 'expires_at', 'user__is_active'
+        ).first()
+        if cached is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        cache.set(cache_key, cached, settings.TOKEN_CACHE_SECONDS)
+
+        return cached
+
+    def authenticate_credentials(self, key):
+        user_id, expires_at, is_active = self.get_token(key)
+        if not is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        if expires_at <= timezone.now():
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        return (TokenPrincipal(user_id), key)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    # `Authorization: Bearer <access token>`
+    #
+    # access tokens are verified with hmac alone: no database or
+    # cache lookup happens. they are short-lived and get refreshed
+    # with a database-backed AuthToken through token/access/.
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid bearer header.')
+            )
+
+        try:
+            claims = decode_access_token(auth[1].decode())
+        except (InvalidAccessToken, UnicodeError) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+
+        return (TokenPrincipal(claims['uid'], claims['stf']), claims)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,48 @@
+"""
+authentication backends
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password
+from core.hashers import run_hashing
+
+
+class PooledModelBackend(ModelBackend):
+    # ModelBackend that verifies passwords on the hash pool
+    #
+    # the user lookup and the save after a rehash stay on the
+    # request thread, which owns the database connection;
+    # only the hashing itself moves to the pool.
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user_model = get_user_model()
+        if username is None:
+            username = kwargs.get(user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+
+        try:
+            user = user_model._default_manager.get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            # hash once anyway so unknown users take as long as known ones
+            run_hashing(user_model().set_password, password)
+            return
+
+        outdated = []
+        is_correct = run_hashing(
+            check_password,
+            password,
+            user.password,
+            outdated.append,
+        )
+        if not is_correct or not self.user_can_authenticate(user):
+            return
+
+        if outdated:
+            # transparently move the hash to the preferred hasher
+            # or to the current work factors
+            run_hashing(user.set_password, password)
+            user.save(update_fields=['password'])
+
+        return user
@@ -0,0 +1,138 @@
+"""
+content-encoding helpers shared by the compression middleware
+and its benchmark
+"""
+
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+class GzipCodec:
+    name = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def compressor(self):
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+
+class BrotliCodec:
+    name = 'br'
+
+    def __init__(self, level=5):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compressor(self):
+        return _BrotliStream(brotli.Compressor(quality=self.level))
+
+
+class _BrotliStream:
+    # give brotli the same compress/flush interface as zlib
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=None):
+        if mode == zlib.Z_SYNC_FLUSH:
+            return self._compressor.flush()
+        return self._compressor.finish()
+
+
+class ZstdCodec:
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def compressor(self):
+        return _ZstdStream(
+            zstandard.ZstdCompressor(level=self.level).compressobj()
+        )
+
+
+class _ZstdStream:
+    # give zstandard the same compress/flush interface as zlib
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self, mode=None):
+        if mode == zlib.Z_SYNC_FLUSH:
+            return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.flush()
+
+
+def available_codecs(levels=None):
+    # return {encoding: codec} for every installed codec
+
+    levels = levels or {}
+    codecs = {'gzip': GzipCodec(levels.get('gzip', 6))}
+    if brotli is not None:
+        codecs['br'] = BrotliCodec(levels.get('br', 5))
+    if zstandard is not None:
+        codecs['zstd'] = ZstdCodec(levels.get('zstd', 3))
+
+    return codecs
+
+
+def parse_accept_encoding(header):
+    # return {encoding: q} from an Accept-Encoding header
+
+    accepted = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        encoding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[encoding.strip().lower()] = q
+
+    return accepted
+
+
+def negotiate(header, preference):
+    # pick the first preferred encoding the client accepts
+
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best = None
+    best_q = 0.0
+    for encoding in preference:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+
+    return best
@@ -0,0 +1,160 @@
+"""
+database router for read replicas
+"""
+
+import contextvars
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.db import (
+    DatabaseError,
+    connections,
+)
+
+logger = logging.getLogger(__name__)
+
+# set while a safe, replica-tolerant request is being handled
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+# caught up replicas report 0, otherwise seconds since the last replay
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()),
+            0
+        )
+    END
+"""
+
+
+def start_replica_reads():
+    # route reads in the current context to a replica
+    return _replica_reads.set(True)
+
+
+def stop_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    token = start_replica_reads()
+    try:
+        yield
+    finally:
+        stop_replica_reads(token)
+
+
+@contextmanager
+def primary_reads():
+    # read from the primary, even within a replica-tolerant request
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    # keep a user on the primary for a while after they wrote
+    # so they always read their own writes
+    #
+    # the pin is kept in a cache every process sees, the user's next
+    # request may well be served by another worker
+    caches[settings.REPLICA_PIN_CACHE].set(
+        _pin_key(user_id),
+        True,
+        settings.REPLICA_PIN_SECONDS,
+    )
+
+
+def is_pinned(user_id):
+    return caches[settings.REPLICA_PIN_CACHE].get(_pin_key(user_id), False)
+
+
+class ReplicaPool:
+    # round robin over the replicas that passed their last health check
+    #
+    # a replica is checked at most once per
+    # REPLICA_HEALTH_CHECK_INTERVAL seconds and left out of the
+    # rotation while it is unreachable or lags behind the primary
+    # by more than REPLICA_MAX_LAG_SECONDS.
+
+    def __init__(self):
+        self._checked = {}
+        self._counter = itertools.count()
+
+    def lag(self, alias):
+        # return replication lag in seconds for alias
+
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            # sqlite stand-ins have nothing to replay
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        interval = settings.REPLICA_HEALTH_CHECK_INTERVAL
+        checked = self._checked.get(alias)
+        if checked and now - checked[0] < interval:
+            return checked[1]
+
+        try:
+            healthy = self.lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+        except DatabaseError:
+            logger.warning('replica %s is unreachable', alias)
+            healthy = False
+        self._checked[alias] = (now, healthy)
+
+        return healthy
+
+    def choose(self):
+        # return a healthy replica alias, or None
+
+        healthy = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self.is_healthy(alias)
+        ]
+        if not healthy:
+            return None
+
+        return healthy[next(self._counter) % len(healthy)]
+
+    def reset(self):
+        self._checked.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    # send replica-tolerant reads to a replica, everything else to default
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+
+        return replica_pool.choose()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        return db == 'default'
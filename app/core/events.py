@@ -0,0 +1,117 @@
+"""
+in-process pub/sub of recipe library changes, for event streams
+"""
+
+import asyncio
+import threading
+from collections import (
+    defaultdict,
+    namedtuple,
+)
+from core import invalidation
+
+# one Change row as it is streamed
+ChangeEvent = namedtuple('ChangeEvent', ['seq', 'kind', 'id', 'deleted'])
+
+
+def encode_event(user_id, event):
+    # bus key for an event, see Change.objects.record
+    return f'{user_id}:{event.seq}:{event.kind}:{event.id}:{event.deleted:d}'
+
+
+def decode_event(key):
+    # (user_id, ChangeEvent) of a bus key
+
+    user_id, seq, kind, object_id, deleted = key.split(':')
+    return int(user_id), ChangeEvent(
+        int(seq), kind, int(object_id), deleted == '1'
+    )
+
+
+class Subscription:
+    # queue of one stream, filled from any thread
+    #
+    # the queue is bounded; a stream that falls behind loses events
+    # and is flagged as overflowed, it then catches up from the
+    # change log instead.
+
+    def __init__(self, user_id, maxsize, loop=None):
+        self.user_id = user_id
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    def drain(self):
+        # events queued right now, without waiting
+
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+
+        return events
+
+
+class ChangeBroker:
+    # hands a user's change events to the user's open streams
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, user_id, maxsize, loop=None):
+        subscription = Subscription(user_id, maxsize, loop)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+            self._count += 1
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id, events):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            for event in events:
+                subscription.push(event)
+
+
+broker = ChangeBroker()
+
+
+def _dispatch(keys):
+    # 'changes' events, from this process on commit and from others
+    # through the invalidation bus when it is enabled
+
+    events = defaultdict(list)
+    for key in keys:
+        user_id, event = decode_event(key)
+        events[user_id].append(event)
+    for user_id, user_events in events.items():
+        broker.publish(user_id, sorted(user_events))
+
+
+invalidation.subscribe('changes', _dispatch)
@@ -0,0 +1,235 @@
+"""
+garbage collection of orphaned tags, ingredients, images and uploads
+"""
+
+import os
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Exists,
+    OuterRef,
+)
+from django.utils import timezone
+from core.models import (
+    RECIPE_IMAGE_DIR,
+    UPLOAD_STAGING_DIR,
+    Change,
+    ImageBlob,
+    ImageUpload,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from core.uploads import discard_upload
+
+
+def _unreferenced(model, field_name, column):
+    # rows of model that no recipe links to
+    # NOT EXISTS lets the database run a single anti-join
+    # instead of one lookup per row
+
+    through = getattr(Recipe, field_name).through
+    links = through.objects.filter(**{f'{column}_id': OuterRef('pk')})
+
+    return model.all_objects.filter(~Exists(links))
+
+
+def collect_attrs(model, field_name, column, batch_size, dry_run=False):
+    # delete tags or ingredients that no recipe uses, batch_size at a time
+    # return the number of rows found
+
+    orphans = _unreferenced(model, field_name, column)
+    if dry_run:
+        return orphans.count()
+
+    deleted = 0
+    while True:
+        ids = list(orphans.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            # the anti-join is checked again, a recipe may have been
+            # linked to one of the rows since the batch was read. the
+            # row locks keep new links out until the rows are gone.
+            batch = orphans.filter(id__in=ids).select_for_update()
+            rows = list(batch.values_list('user_id', 'id', 'deleted_at'))
+            count, _ = model.all_objects.filter(
+                id__in=[object_id for _, object_id, _ in rows]
+            ).delete()
+            # clients still holding live rows are told they are gone,
+            # soft-deleted ones have their tombstones already
+            live = defaultdict(list)
+            for user_id, object_id, deleted_at in rows:
+                if deleted_at is None:
+                    live[user_id].append(object_id)
+            for user_id, object_ids in live.items():
+                Change.objects.record(
+                    user_id,
+                    model._meta.model_name,
+                    object_ids,
+                    deleted=True,
+                )
+        deleted += count
+        if len(ids) < batch_size:
+            return deleted
+
+
+def _referenced_images():
+    # names of every image a recipe row points at, soft-deleted or not
+
+    names = Recipe.all_objects.exclude(image='').exclude(
+        image__isnull=True
+    ).values_list('image', flat=True)
+
+    return {os.path.basename(name) for name in names.iterator()}
+
+
+def _scan_directory(directory):
+    # yield (file name, size, mtime) of the files in a local directory
+    # os.scandir reads size and mtime with the call listing the entry
+
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield entry.name, stat.st_size, stat.st_mtime
+
+
+def _image_files(storage):
+    # stream the files in the recipe image directory of storage
+
+    if hasattr(storage, 'list_files'):
+        # object storage lists keys page by page
+        for name, size, modified in storage.list_files(RECIPE_IMAGE_DIR):
+            if '/' not in name:
+                yield name, size, modified.timestamp()
+    else:
+        yield from _scan_directory(
+            os.path.join(settings.MEDIA_ROOT, RECIPE_IMAGE_DIR)
+        )
+
+
+def _delete_images(storage, files):
+    # delete [(name, size)] of the image directory
+    # return the sizes of the files deleted
+    #
+    # an identical upload may have adopted one of the files since the
+    # references were read. the exclusive lock waits for uploads in
+    # flight and keeps new ones out, so references are checked again
+    # under it, as ImageBlobManager._delete_files does.
+
+    paths = {f'{RECIPE_IMAGE_DIR}/{name}': size for name, size in files}
+    with transaction.atomic():
+        ImageBlob.objects.lock_files(exclusive=True)
+        used = set(ImageBlob.objects.filter(
+            name__in=paths
+        ).values_list('name', flat=True))
+        used.update(Recipe.all_objects.filter(
+            image__in=paths
+        ).values_list('image', flat=True))
+        freed = []
+        for path, size in paths.items():
+            if path not in used:
+                storage.delete(path)
+                freed.append(size)
+
+    return freed
+
+
+def collect_images(min_age=None, dry_run=False, batch_size=None):
+    # remove files in the recipe image directory no row refers to
+    # return (files found, bytes reclaimed)
+
+    if min_age is None:
+        min_age = settings.GC_IMAGE_MIN_AGE
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    cutoff = time.time() - min_age.total_seconds()
+    referenced = _referenced_images()
+    storage = Recipe._meta.get_field('image').storage
+
+    found = reclaimed = 0
+    batch = []
+    for name, size, modified in _image_files(storage):
+        if name in referenced:
+            continue
+        if modified > cutoff:
+            # may belong to an upload still in flight
+            continue
+        if dry_run:
+            found += 1
+            reclaimed += size
+            continue
+        batch.append((name, size))
+        if len(batch) == batch_size:
+            freed = _delete_images(storage, batch)
+            found += len(freed)
+            reclaimed += sum(freed)
+            batch = []
+    if batch:
+        freed = _delete_images(storage, batch)
+        found += len(freed)
+        reclaimed += sum(freed)
+
+    return found, reclaimed
+
+
+def collect_uploads(dry_run=False):
+    # drop resumable uploads abandoned for longer than UPLOAD_SESSION_TTL
+    # and staging files of that age no upload owns any more
+    # return (uploads and files found, staged bytes reclaimed)
+
+    cutoff = timezone.now() - settings.UPLOAD_SESSION_TTL
+    # read before stale uploads go, their files are counted with them
+    owned = {
+        os.path.basename(upload.staging_path)
+        for upload in ImageUpload.objects.only('id').iterator()
+    }
+    stale = ImageUpload.objects.filter(created__lt=cutoff)
+    found = reclaimed = 0
+    for upload in stale.iterator():
+        found += 1
+        reclaimed += upload.offset
+        if not dry_run:
+            discard_upload(upload)
+
+    directory = os.path.join(settings.MEDIA_ROOT, UPLOAD_STAGING_DIR)
+    for name, size, modified in _scan_directory(directory):
+        # younger files may belong to an upload being started or
+        # to a chunk being received
+        if name in owned or modified > cutoff.timestamp():
+            continue
+        if not dry_run:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+        found += 1
+        reclaimed += size
+
+    return found, reclaimed
+
+
+def collect_garbage(batch_size=None, min_age=None, dry_run=False):
+    # remove everything no recipe refers to
+    # return ({kind: items}, bytes of files reclaimed)
+
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    found = {
+        'tags': collect_attrs(Tag, 'tags', 'tag', batch_size, dry_run),
+        'ingredients': collect_attrs(
+            Ingredient, 'ingredients', 'ingredient', batch_size, dry_run
+        ),
+    }
+    found['images'], image_bytes = collect_images(
+        min_age, dry_run, batch_size
+    )
+    found['uploads'], upload_bytes = collect_uploads(dry_run)
+
+    return found, image_bytes + upload_bytes
@@ -0,0 +1,109 @@
+"""
+tunable password hashers and a bounded pool to run them in
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BCryptSHA256PasswordHasher,
+    PBKDF2PasswordHasher,
+)
+
+
+def _param(algorithm, name, default):
+    # read a work factor from PASSWORD_HASHER_PARAMS
+
+    params = getattr(settings, 'PASSWORD_HASHER_PARAMS', {})
+    return params.get(algorithm, {}).get(name, default)
+
+
+# the work factors are read from settings on every access,
+# so changing them makes check_password() rehash stored passwords
+# with the new parameters on the next successful login
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+
+    @property
+    def time_cost(self):
+        return _param('argon2', 'time_cost', 2)
+
+    @property
+    def memory_cost(self):
+        return _param('argon2', 'memory_cost', 19456)
+
+    @property
+    def parallelism(self):
+        return _param('argon2', 'parallelism', 1)
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+
+    @property
+    def rounds(self):
+        return _param('bcrypt_sha256', 'rounds', 12)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return _param('pbkdf2_sha256', 'iterations', 260000)
+
+
+class HashPoolBusy(Exception):
+    # raised when too many hashes are already queued
+    pass
+
+
+class HashPool:
+    # run password hashing on a small, bounded thread pool
+    #
+    # argon2 and bcrypt release the GIL while hashing, so hashes
+    # run in parallel with the request threads instead of blocking
+    # them. at most `workers` hashes run at once and `workers +
+    # queue_size` may be in flight; past that, callers wait
+    # `timeout` seconds for a slot and then get HashPoolBusy
+    # so a login storm can't tie up every request worker.
+
+    def __init__(self, workers, queue_size, timeout):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='password-hash',
+        )
+
+    def run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashPoolBusy()
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashPool(
+                    workers=settings.PASSWORD_HASH_WORKERS,
+                    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+                    timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT,
+                )
+
+    return _pool
+
+
+def run_hashing(fn, *args, **kwargs):
+    # run fn, which hashes a password, on the shared pool
+    return get_hash_pool().run(fn, *args, **kwargs)
@@ -0,0 +1,263 @@
+"""
+cross-process cache invalidation over postgres LISTEN/NOTIFY
+"""
+
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import defaultdict
+import psycopg2
+from django.conf import settings
+from django.db import (
+    close_old_connections,
+    connection,
+    transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache_invalidation'
+# postgres refuses NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7500
+
+
+def encode_batches(origin, events):
+    # split {topic: keys} into NOTIFY payloads below MAX_PAYLOAD
+    # a payload is {"o": origin, "e": {topic: [key, ...]}}
+
+    payloads = []
+    batch = {}
+    size = 0
+    overhead = len(json.dumps({'o': origin, 'e': {}}))
+    for topic, keys in sorted(events.items()):
+        for key in sorted(keys):
+            cost = len(json.dumps(key)) + len(json.dumps(topic)) + 4
+            if batch and overhead + size + cost > MAX_PAYLOAD:
+                payloads.append(json.dumps({'o': origin, 'e': batch}))
+                batch, size = {}, 0
+            batch.setdefault(topic, []).append(key)
+            size += cost
+    if batch:
+        payloads.append(json.dumps({'o': origin, 'e': batch}))
+
+    return payloads
+
+
+def decode_batches(payloads, skip_origin=None):
+    # merge payloads into {topic: keys}, ignoring skip_origin's own
+
+    events = defaultdict(set)
+    for payload in payloads:
+        try:
+            message = json.loads(payload)
+            if message['o'] == skip_origin:
+                continue
+            for topic, keys in message['e'].items():
+                events[topic].update(keys)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.warning('ignoring malformed invalidation %r', payload)
+
+    return events
+
+
+class InvalidationBus:
+    # publishes invalidations to every app process
+    #
+    # writers call publish(topic, key). once their transaction commits,
+    # subscribers in this process run straight away, and the event is
+    # queued for a sender thread. the sender waits BATCH_WINDOW for
+    # more events, drops duplicates and sends them in as few NOTIFYs as
+    # possible. a listener thread per process LISTENs on its own
+    # connection and hands other processes' events to subscribers,
+    # one call per topic and batch. events sent before the first
+    # LISTEN or while reconnecting are lost, so reset handlers rebuild
+    # or drop whatever they cache each time the listener connects.
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._subscribers = defaultdict(list)
+        self._publish_handlers = defaultdict(list)
+        self._reset_handlers = []
+        self._outbox = queue.Queue()
+        self._lock = threading.Lock()
+        self._sender = None
+        self._listener = None
+        self._stopping = threading.Event()
+
+    def subscribe(self, topic, handler):
+        # handler(keys) is called with a set of invalidated keys
+        self._subscribers[topic].append(handler)
+
+    def on_publish(self, topic, handler):
+        # handler(keys) is called in the publishing process only,
+        # after commit and before other processes are told
+        self._publish_handlers[topic].append(handler)
+
+    def on_reset(self, handler):
+        # handler() is called when events may have been missed
+        self._reset_handlers.append(handler)
+
+    def publish(self, topic, key):
+        # invalidate key of topic everywhere once the transaction commits
+        transaction.on_commit(lambda: self._committed(topic, str(key)))
+
+    def _committed(self, topic, key):
+        self._run(self._publish_handlers, {topic: {key}})
+        self.apply({topic: {key}})
+        if self._enabled():
+            self._outbox.put((topic, key))
+            self._ensure_sender()
+
+    def apply(self, events):
+        # run subscribers for {topic: keys}
+        self._run(self._subscribers, events)
+
+    def _run(self, handlers, events):
+        for topic, keys in events.items():
+            for handler in handlers.get(topic, ()):
+                try:
+                    handler(set(keys))
+                except Exception:
+                    logger.exception('invalidation handler for %s failed',
+                                     topic)
+
+    def reset(self):
+        for handler in self._reset_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception('invalidation reset handler failed')
+
+    def _enabled(self):
+        return settings.INVALIDATION_BUS and \
+            connection.vendor == 'postgresql'
+
+    def _ensure_sender(self):
+        with self._lock:
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(
+                    target=self._send_loop,
+                    name='invalidation-sender',
+                    daemon=True,
+                )
+                self._sender.start()
+
+    def _take_batch(self):
+        # block for one event, then gather what arrives within the window
+
+        events = defaultdict(set)
+        topic, key = self._outbox.get()
+        events[topic].add(key)
+        deadline = time.monotonic() + settings.INVALIDATION_BATCH_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return events
+            try:
+                topic, key = self._outbox.get(timeout=remaining)
+            except queue.Empty:
+                return events
+            events[topic].add(key)
+
+    def _send_loop(self):
+        while not self._stopping.is_set():
+            events = self._take_batch()
+            try:
+                close_old_connections()
+                with connection.cursor() as cursor:
+                    for payload in encode_batches(self.origin, events):
+                        cursor.execute(
+                            'SELECT pg_notify(%s, %s)',
+                            [CHANNEL, payload],
+                        )
+            except Exception:
+                # listeners can't tell, the caches expire on their own
+                logger.exception('sending invalidations failed')
+            finally:
+                close_old_connections()
+
+    def start_listener(self):
+        # listen for other processes' events on a background thread
+
+        if not self._enabled():
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen_loop,
+                    name='invalidation-listener',
+                    daemon=True,
+                )
+                self._listener.start()
+
+    def _connect(self):
+        db = settings.DATABASES['default']
+        conn = psycopg2.connect(
+            host=db.get('HOST') or None,
+            port=db.get('PORT') or None,
+            dbname=db['NAME'],
+            user=db.get('USER') or None,
+            password=db.get('PASSWORD') or None,
+            application_name='invalidation-listener',
+        )
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+        )
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+
+        return conn
+
+    def _listen_loop(self):
+        delay = settings.INVALIDATION_RECONNECT_DELAY
+        while not self._stopping.is_set():
+            try:
+                conn = self._connect()
+            except psycopg2.Error:
+                logger.warning('invalidation listener can not connect')
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            delay = settings.INVALIDATION_RECONNECT_DELAY
+            # whatever was sent before LISTEN took effect is lost,
+            # at startup as much as after a reconnect
+            self.reset()
+            try:
+                self._listen(conn)
+            except psycopg2.Error:
+                logger.warning('invalidation listener lost its connection')
+            finally:
+                conn.close()
+
+    def _listen(self, conn):
+        keepalive = settings.INVALIDATION_KEEPALIVE
+        while not self._stopping.is_set():
+            readable, _, _ = select.select([conn], [], [], keepalive)
+            if not readable:
+                # notices a dead connection, so the loop reconnects
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                continue
+
+            conn.poll()
+            payloads = [notify.payload for notify in conn.notifies]
+            conn.notifies.clear()
+            events = decode_batches(payloads, skip_origin=self.origin)
+            if events:
+                self.apply(events)
+
+    def stop(self):
+        self._stopping.set()
+
+
+bus = InvalidationBus()
+subscribe = bus.subscribe
+on_publish = bus.on_publish
+on_reset = bus.on_reset
+publish = bus.publish
+start_listener = bus.start_listener
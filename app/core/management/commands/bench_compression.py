@@ -0,0 +1,63 @@
+"""
+Django command to benchmark response compression.
+"""
+
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.compression import available_codecs
+
+
+def sample_recipe_list(count):
+    # build a recipe list payload shaped like /api/recipe/recipes/
+
+    return json.dumps([
+        {
+            'id': i,
+            'title': f'Sample recipe {i}',
+            'time_minutes': 10 + i % 50,
+            'price': f'{i % 20}.99',
+            'link': f'https://example.com/recipes/{i}',
+            'tags': [
+                {'id': i % 7, 'name': f'Tag {i % 7}'},
+                {'id': 7 + i % 3, 'name': f'Tag {7 + i % 3}'},
+            ],
+            'ingredients': [
+                {'id': i % 31, 'name': f'Ingredient {i % 31}'},
+            ],
+        }
+        for i in range(count)
+    ]).encode()
+
+
+class Command(BaseCommand):
+    help = 'Report bytes saved and CPU time per request for each encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        body = sample_recipe_list(options['recipes'])
+        iterations = options['iterations']
+        codecs = available_codecs(
+            getattr(settings, 'COMPRESSION_LEVELS', None)
+        )
+
+        self.stdout.write(
+            f'payload: {len(body)} bytes, {iterations} iterations'
+        )
+        for encoding, codec in codecs.items():
+            start = time.process_time()
+            for _ in range(iterations):
+                compressed = codec.compress(body)
+            cpu_ms = (time.process_time() - start) * 1000 / iterations
+            saved = len(body) - len(compressed)
+
+            self.stdout.write(
+                f'{encoding:>5}: {len(compressed):>9} bytes '
+                f'({saved / len(body):6.1%} saved), '
+                f'{cpu_ms:8.3f} ms cpu/request'
+            )
@@ -0,0 +1,41 @@
+"""
+Django command to benchmark password verification throughput.
+"""
+
+import time
+from django.contrib.auth.hashers import (
+    check_password,
+    get_hashers,
+)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Report logins per second per core for each password hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        password = 'benchmark-password'
+
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as e:
+                # e.g. the optional bcrypt package is missing
+                self.stdout.write(f'{hasher.algorithm:>16}: skipped ({e})')
+                continue
+
+            logins = 0
+            start = time.process_time()
+            while time.process_time() - start < options['seconds']:
+                check_password(password, encoded)
+                logins += 1
+            elapsed = time.process_time() - start
+
+            self.stdout.write(
+                f'{hasher.algorithm:>16}: {logins / elapsed:8.1f} '
+                f'logins/s/core ({elapsed * 1000 / logins:.1f} ms each)'
+            )
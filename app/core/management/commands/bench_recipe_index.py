@@ -0,0 +1,119 @@
+"""
+Django command to benchmark pantry and similar-recipe queries.
+"""
+
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from core import recipe_index
+from core.models import Change
+from core.recipe_index import RecipeIndex
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (
+        f'p50 {statistics.median(timings) * 1000:.2f} ms, '
+        f'p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms'
+    )
+
+
+class Command(BaseCommand):
+    help = 'Time the recipe index of one large, made up user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=3000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        rng = random.Random(options['seed'])
+        index = RecipeIndex(user_id=0)
+
+        # a few tags and ingredients are in most recipes, as in
+        # real collections: pick them with zipf-like weights
+        features = [
+            (Change.TAG, n) for n in range(options['tags'])
+        ] + [
+            (Change.INGREDIENT, n) for n in range(options['ingredients'])
+        ]
+        ingredients = features[options['tags']:]
+        cum_weights = list(itertools.accumulate(
+            1 / (rank + 1) for rank in range(len(ingredients))
+        ))
+
+        def random_mask():
+            tags = rng.sample(features[:options['tags']], 3)
+            picked = rng.choices(
+                ingredients,
+                cum_weights=cum_weights,
+                k=rng.randint(5, 15),
+            )
+            mask = 0
+            for key in tags + picked:
+                mask |= 1 << index._bit(key)
+            return mask
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for recipe_id in range(1, options['recipes'] + 1):
+            index.set_recipe(recipe_id, random_mask())
+        built = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{len(index)} recipes indexed in {built:.2f}s, '
+            f'{memory / 2 ** 20:.1f} MiB'
+        )
+
+        recipe_ids = rng.sample(
+            range(1, options['recipes'] + 1),
+            options['queries'],
+        )
+        numpy = recipe_index.numpy
+        if numpy is None:
+            self.stdout.write('numpy is not installed')
+        try:
+            for backend, module in (('numpy', numpy), ('python', None)):
+                if backend == 'numpy' and numpy is None:
+                    continue
+                recipe_index.numpy = module
+                for metric in (recipe_index.JACCARD, recipe_index.COSINE):
+                    timings = []
+                    for recipe_id in recipe_ids:
+                        start = time.perf_counter()
+                        index.similar(recipe_id, 10, metric)
+                        timings.append(time.perf_counter() - start)
+                    self.stdout.write(
+                        f'similar ({backend}, {metric}): '
+                        f'{percentiles(timings)}'
+                    )
+        finally:
+            recipe_index.numpy = numpy
+
+        for max_missing in (0, 2):
+            timings = []
+            for _ in range(options['queries']):
+                pantry = [
+                    object_id
+                    for _, object_id in rng.sample(ingredients, 40)
+                ]
+                start = time.perf_counter()
+                index.pantry(pantry, max_missing, 50)
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f'pantry (max_missing={max_missing}): {percentiles(timings)}'
+            )
+
+        timings = []
+        for recipe_id in recipe_ids:
+            start = time.perf_counter()
+            index.set_recipe(recipe_id, random_mask())
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(f'recipe update: {percentiles(timings)}')
@@ -0,0 +1,144 @@
+"""
+Django command to load test idle change event streams.
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from core.events import (
+    ChangeEvent,
+    broker,
+)
+from core.signed_tokens import encode_access_token
+from core.sse import EventStream
+
+# user ids far above real ones, the benchmark never touches the db
+FIRST_USER_ID = 10 ** 9
+
+
+class BenchClient:
+    # one streaming client, speaking ASGI to the app directly
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.status = None
+        self.events = 0
+        self.expected = 0
+        self.done = asyncio.Event()
+        self.done_at = None
+
+    async def receive(self):
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            self.started.set()
+            return
+        self.events += message.get('body', b'').count(b'event: change')
+        if self.expected and self.events >= self.expected:
+            self.done_at = time.perf_counter()
+            self.done.set()
+
+
+class Command(BaseCommand):
+    help = 'Open many idle event streams in one process and fan out events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=5000)
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=None,
+            help='Users the streams belong to, default one per stream',
+        )
+        parser.add_argument('--events', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        asyncio.run(self.run(
+            options['streams'],
+            options['users'] or options['streams'],
+            options['events'],
+        ))
+
+    def scope(self, user_id):
+        token = encode_access_token(user_id, 0)
+        return {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/',
+            'query_string': b'',
+            'headers': [(b'authorization', f'Bearer {token}'.encode())],
+        }
+
+    async def run(self, streams, users, rounds):
+        app = EventStream()
+        user_ids = [FIRST_USER_ID + n % users for n in range(streams)]
+        clients = [BenchClient() for _ in range(streams)]
+        threads = threading.active_count()
+
+        tracemalloc.start()
+        memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(
+                app(self.scope(user_id), client.receive, client.send)
+            )
+            for user_id, client in zip(user_ids, clients)
+        ]
+        await asyncio.gather(*(client.started.wait() for client in clients))
+        opened = time.perf_counter() - start
+        # let every stream reach its idle wait
+        await asyncio.sleep(0.1)
+        per_stream = (tracemalloc.get_traced_memory()[0] - memory) / streams
+        tracemalloc.stop()
+        refused = sum(client.status != 200 for client in clients)
+
+        self.stdout.write(
+            f'{streams} streams for {users} users opened in '
+            f'{opened:.2f}s, {refused} refused'
+        )
+        self.stdout.write(
+            f'threads: {threads} before, {threading.active_count()} '
+            f'with the streams open'
+        )
+        self.stdout.write(f'memory: {per_stream / 1024:.1f} KiB per stream')
+
+        loop = asyncio.get_running_loop()
+        latencies = []
+        for seq in range(1, rounds + 1):
+            for client in clients:
+                client.expected = seq
+                client.done.clear()
+
+            def publish():
+                # as a committing request thread would
+                for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+                    broker.publish(
+                        user_id,
+                        [ChangeEvent(seq, 'recipe', 1, False)],
+                    )
+
+            start = time.perf_counter()
+            await loop.run_in_executor(None, publish)
+            await asyncio.gather(*(client.done.wait() for client in clients))
+            latencies.extend(client.done_at - start for client in clients)
+
+        latencies.sort()
+        self.stdout.write(
+            f'fan-out of {rounds} events to every stream: '
+            f'p50 {statistics.median(latencies) * 1000:.1f} ms, '
+            f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, '
+            f'max {latencies[-1] * 1000:.1f} ms'
+        )
+
+        for client in clients:
+            client.closed.set()
+        await asyncio.gather(*tasks)
+        self.stdout.write(f'{len(broker)} streams left after disconnect')
@@ -0,0 +1,28 @@
+"""
+Django command to generate and store the OpenAPI schema.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.schema import write_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema served at /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default=None,
+            help='Where to store the schema, defaults to SCHEMA_DIR',
+        )
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        directory = options['directory'] or settings.SCHEMA_DIR
+        self.stdout.write(f'Building schema in {directory} -')
+
+        for path in write_schema(directory):
+            self.stdout.write(f'wrote {path}')
+
+        self.stdout.write(self.style.SUCCESS('Schema is ready'))
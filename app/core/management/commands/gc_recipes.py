@@ -0,0 +1,57 @@
+"""
+Django command to remove tags, ingredients and images nothing uses.
+"""
+
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from core.garbage import collect_garbage
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+
+    return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned tags, ingredients and recipe image files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=None,
+            help='Keep image files younger than this many seconds',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting it',
+        )
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        min_age = options['min_age']
+        if min_age is not None:
+            min_age = timedelta(seconds=min_age)
+        dry_run = options['dry_run']
+
+        found, reclaimed = collect_garbage(
+            batch_size=options['batch_size'],
+            min_age=min_age,
+            dry_run=dry_run,
+        )
+
+        verb = 'would be deleted' if dry_run else 'deleted'
+        for kind, count in found.items():
+            self.stdout.write(f'{kind}: {count} {verb}')
+        self.stdout.write(self.style.SUCCESS(
+            'Reclaimed {}{}'.format(
+                format_size(reclaimed),
+                ' (dry run)' if dry_run else '',
+            )
+        ))
@@ -0,0 +1,21 @@
+"""
+Django command to remove soft-deleted rows for good.
+"""
+
+from django.core.management.base import BaseCommand
+from core.purge import purge_deleted
+
+
+class Command(BaseCommand):
+    help = 'Delete soft-deleted recipes, tags, ingredients and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        deleted = purge_deleted(options['batch_size'])
+
+        for kind, count in deleted.items():
+            self.stdout.write(f'{kind}: {count} deleted')
+        self.stdout.write(self.style.SUCCESS('Purge finished'))
@@ -0,0 +1,21 @@
+"""
+Django command to delete expired auth tokens.
+"""
+
+from django.core.management.base import BaseCommand
+from core.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired auth tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # entrypoint for command
+        deleted = AuthToken.objects.purge_expired(options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} expired tokens')
+        )
@@ -0,0 +1,198 @@
+"""
+authenticated media serving
+"""
+
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core.models import Recipe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# bytes per read when streaming a byte range
+COPY_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    # return (first, last) byte of a single range header, both inclusive
+    # None when the header should be ignored, ValueError when it can't
+    # be satisfied. multiple ranges are ignored, the whole file is sent
+
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last n bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        raise ValueError(header)
+
+    return first, last
+
+
+def _read_range(path, first, length):
+    with open(path, 'rb') as f:
+        f.seek(first)
+        while length > 0:
+            data = f.read(min(COPY_SIZE, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+
+
+def _etag(name, stat):
+    # content-addressed names already are a hash of the content
+    if settings.IMAGE_STORAGE_MODE == 'content':
+        return '"{}"'.format(os.path.splitext(os.path.basename(name))[0])
+
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    # files are sent as they are whatever the client accepts,
+    # renderers are only used for error responses
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class MediaView(APIView):
+    # serve recipe images to the users owning the recipe
+    #
+    # the view only checks access. images in object storage are
+    # redirected to a presigned url. with MEDIA_DELIVERY set to
+    # x-accel-redirect (nginx) or x-sendfile (apache, lighttpd)
+    # the proxy sends the bytes and handles ranges; otherwise a
+    # FileResponse lets the wsgi server use sendfile() for full
+    # files, and byte ranges are streamed from here.
+
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreAcceptNegotiation
+    # raw files, not part of the api schema
+    schema = None
+
+    def get(self, request, name):
+        owned = Recipe.objects.filter(
+            user_id=request.user.id,
+            image=name,
+        ).exists()
+        if not owned:
+            raise Http404
+
+        storage = Recipe._meta.get_field('image').storage
+        if hasattr(storage, 'presigned_url'):
+            return self._redirect(storage, name)
+
+        path = storage.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise Http404
+
+        etag = _etag(name, stat)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self._deliver(request, name, path, stat, etag)
+        response['ETag'] = etag
+        # content never changes under a name, so clients keep it for good
+        response['Cache-Control'] = 'private, max-age={}, immutable'.format(
+            settings.MEDIA_CACHE_MAX_AGE
+        )
+
+        return response
+
+    def _redirect(self, storage, name):
+        # send the client straight to the object store
+        # it transfers the bytes and answers range requests itself
+
+        expires_in = settings.OBJECT_STORAGE.get('PRESIGN_SECONDS', 300)
+        response = HttpResponseRedirect(
+            storage.presigned_url(name, expires_in)
+        )
+        # the redirect must not be reused after the signature expires
+        response['Cache-Control'] = f'private, max-age={expires_in // 2}'
+
+        return response
+
+    def _deliver(self, request, name, path, stat, etag):
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+        delivery = settings.MEDIA_DELIVERY
+
+        if delivery == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+            return response
+        if delivery == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+            return response
+
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if range_header and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(
+                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+                )
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(
+                open(path, 'rb'),
+                content_type=content_type,
+            )
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                _read_range(path, first, last - first + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = (
+                f'bytes {first}-{last}/{stat.st_size}'
+            )
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+
+        return response
@@ -0,0 +1,208 @@
+"""
+custom middleware
+"""
+
+import hashlib
+import zlib
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+from django.utils.cache import patch_vary_headers
+from core.compression import (
+    available_codecs,
+    negotiate,
+)
+
+
+class CompressionMiddleware:
+    # negotiated gzip/brotli/zstd response compression
+    #
+    # works like django's GZipMiddleware but picks the best encoding
+    # the client accepts, skips bodies below COMPRESSION_MIN_SIZE
+    # and compresses streaming responses chunk by chunk.
+    # compressed variants of cacheable responses are kept in the
+    # shared cache under the path, content type and a digest of the
+    # body, so a hot response is only compressed once.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.codecs = available_codecs(
+            getattr(settings, 'COMPRESSION_LEVELS', None)
+        )
+        self.preference = [
+            encoding
+            for encoding in getattr(
+                settings,
+                'COMPRESSION_PREFERENCE',
+                ['br', 'zstd', 'gzip'],
+            )
+            if encoding in self.codecs
+        ]
+        self.cache_alias = getattr(settings, 'COMPRESSION_CACHE', 'default')
+        self.cache_timeout = getattr(
+            settings,
+            'COMPRESSION_CACHE_TIMEOUT',
+            60 * 60,
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('Content-Encoding') or \
+                response.status_code == 206 or \
+                not self._is_compressible(response):
+            # partial content is sliced from the uncompressed bytes
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            self.preference,
+        )
+        if encoding is None:
+            return response
+
+        codec = self.codecs[encoding]
+        if response.streaming:
+            response.streaming_content = self._compress_stream(
+                codec,
+                response.streaming_content,
+            )
+            del response['Content-Length']
+        else:
+            compressed = self._compress_body(codec, request, response)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # a compressed body is not byte-for-byte the original
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+    def _is_compressible(self, response):
+        # images other than svg, audio and video are compressed already
+
+        content_type = response.get('Content-Type', '').split(';')[0]
+        major = content_type.split('/')[0]
+        return content_type == 'image/svg+xml' or \
+            major not in ('image', 'audio', 'video')
+
+    def _is_cacheable(self, response):
+        # only shared, successful responses are worth keeping
+
+        cache_control = response.get('Cache-Control', '')
+        return (
+            response.status_code == 200
+            and 'no-store' not in cache_control
+            and 'private' not in cache_control
+            and (response.has_header('ETag') or 'public' in cache_control)
+        )
+
+    def _compress_body(self, codec, request, response):
+        # compress a body, reusing a stored variant when possible
+        #
+        # ETags can't key the variant, two resources may share one;
+        # hashing the body is still far cheaper than compressing it
+
+        if not self._is_cacheable(response):
+            return codec.compress(response.content)
+
+        variant = hashlib.sha1()
+        for part in (
+            request.path.encode(),
+            response.get('Content-Type', '').encode(),
+            response.content,
+        ):
+            variant.update(part)
+            variant.update(b'\0')
+        key = f'compressed:{codec.name}:{variant.hexdigest()}'
+        cache = caches[self.cache_alias]
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = codec.compress(response.content)
+            cache.set(key, compressed, self.cache_timeout)
+
+        return compressed
+
+    def _compress_stream(self, codec, chunks):
+        # flush after every chunk so streamed data still flows
+
+        compressor = codec.compressor()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class MiddlewareStack(BaseHandler):
+    # a request handler running its own list of middleware
+    # instead of settings.MIDDLEWARE, for synchronous requests
+
+    def __init__(self, middleware):
+        super().__init__()
+        self.middleware = list(middleware)
+        self.load_middleware()
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(self.middleware):
+            try:
+                instance = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+
+            if hasattr(instance, 'process_view'):
+                self._view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self._template_response_middleware.append(
+                    instance.process_template_response
+                )
+            if hasattr(instance, 'process_exception'):
+                self._exception_middleware.append(instance.process_exception)
+
+            handler = convert_exception_to_response(instance)
+
+        self._middleware_chain = handler
+
+
+class ApiFastPathMiddleware:
+    # route token-authenticated api requests around the site middleware
+    #
+    # sessions, csrf, auth and messages are only used by the admin
+    # and the browsable docs; api views authenticate with tokens in
+    # rest_framework. requests below API_PREFIXES leave the chain here
+    # and run through API_MIDDLEWARE only, everything else carries on
+    # through the rest of MIDDLEWARE.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(getattr(settings, 'API_PREFIXES', ()))
+        if not self.prefixes:
+            raise MiddlewareNotUsed('API_PREFIXES is empty')
+        self.api_stack = MiddlewareStack(
+            getattr(settings, 'API_MIDDLEWARE', ())
+        )
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefixes):
+            return self.api_stack._middleware_chain(request)
+
+        return self.get_response(request)
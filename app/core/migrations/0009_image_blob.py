@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 02:27
+
+import core.models
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_images(apps, schema_editor):
+    # existing images start with one reference per recipe using them
+    Recipe = apps.get_model('core', 'Recipe')
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+    counts = Recipe.objects.exclude(image='').exclude(
+        image__isnull=True
+    ).values('image').annotate(refcount=Count('id'))
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=row['image'], refcount=row['refcount'])
+        for row in counts.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refcount', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.select_image_storage, upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.RunPython(count_images, migrations.RunPython.noop),
+    ]
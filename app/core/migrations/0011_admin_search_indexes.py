@@ -0,0 +1,54 @@
+# indexes for the admin's prefix searches (search_fields = ['^name'])
+# istartswith compiles to UPPER(col::text) LIKE UPPER('term%'),
+# which only a text_pattern_ops index on that expression can serve
+
+from django.db import migrations
+
+INDEXES = [
+    ('core_recipe_title_upper_idx', 'core_recipe', 'title'),
+    ('core_tag_name_upper_idx', 'core_tag', 'name'),
+    ('core_ingredient_name_upper_idx', 'core_ingredient', 'name'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    # CONCURRENTLY keeps the tables writable during the build, and
+    # can't run inside a transaction, hence atomic = False below
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        # a build that failed half way leaves an invalid index behind,
+        # which IF NOT EXISTS would take for a finished one
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT NOT indisvalid FROM pg_index '
+                'WHERE indexrelid = to_regclass(%s)',
+                [name],
+            )
+            row = cursor.fetchone()
+        if row and row[0]:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY {name}')
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} '
+            f'(UPPER({column}::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_image_upload'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
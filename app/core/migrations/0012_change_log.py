@@ -0,0 +1,69 @@
+# Generated by Django 3.2.25 on 2026-10-19 02:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_changes(apps, schema_editor):
+    # existing objects count as changed, so a first sync returns them
+
+    User = apps.get_model('core', 'User')
+    Change = apps.get_model('core', 'Change')
+    kinds = [
+        ('recipe', apps.get_model('core', 'Recipe')),
+        ('tag', apps.get_model('core', 'Tag')),
+        ('ingredient', apps.get_model('core', 'Ingredient')),
+    ]
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        changes = []
+        for kind, model in kinds:
+            object_ids = model.objects.filter(
+                user_id=user_id,
+                deleted_at__isnull=True,
+            ).values_list('id', flat=True)
+            for object_id in object_ids.iterator():
+                changes.append(Change(
+                    user_id=user_id,
+                    seq=len(changes) + 1,
+                    kind=kind,
+                    object_id=object_id,
+                ))
+        if changes:
+            Change.objects.bulk_create(changes, batch_size=1000)
+            User.objects.filter(pk=user_id).update(change_seq=len(changes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('recipe', 'Recipe'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'seq'], name='change_user_seq_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'object_id'), name='change_object_uniq'),
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -2,15 +2,42 @@
 DB models
 """
 
+import binascii
+import logging
 import uuid
 import os
+from collections import Counter
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.db import (
+    connections,
+    models,
+    transaction,
+)
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin
 )
+from core import invalidation
+from core.events import (
+    ChangeEvent,
+    encode_event,
+)
+from core.hashers import run_hashing
+from core.storage import select_image_storage
+
+logger = logging.getLogger(__name__)
+
+# postgres advisory lock serialising image writers and the file deleter
+IMAGE_FILES_LOCK = 0x696d616765
+
+# recipe images are stored below MEDIA_ROOT in this directory
+RECIPE_IMAGE_DIR = os.path.join('uploads', 'recipe')
+# chunked uploads are assembled here, on the same filesystem,
+# so finished files can be renamed into place
+UPLOAD_STAGING_DIR = os.path.join('uploads', 'staging')
 
 
 def recipe_image_file_path(instance, filename):
@@ -19,7 +46,41 @@ def recipe_image_file_path(instance, filename):
     file_extension = os.path.splitext(filename)[1]
     filename = f'{uuid.uuid4()}{file_extension}'
 
-    return os.path.join('uploads', 'recipe', filename)
+    return os.path.join(RECIPE_IMAGE_DIR, filename)
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    # queryset for models with a deleted_at flag
+
+    def soft_delete(self):
+        # flag rows as deleted in one statement
+        # the purge job removes them for good later on
+        return self.update(deleted_at=timezone.now())
+
+
+class LiveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    # default manager, hides soft-deleted rows
+    # related managers (recipe.tags etc.) are built from it too
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class SoftDeleteModel(models.Model):
+    # abstract base for soft-deletable models
+
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    # includes soft-deleted rows, used by the purge job
+    all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()
+
+    class Meta:
+        abstract = True
+
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
 
 
 class UserManager(BaseUserManager):
@@ -32,7 +93,8 @@ class UserManager(BaseUserManager):
         if not email:
             raise ValueError('Email is required')
         user = self.model(email=self.normalize_email(email), **extra_fields)
-        user.set_password(password)  # creates an encrypted password
+        # creates an encrypted password, on the hash pool
+        run_hashing(user.set_password, password)
         user.save(using=self._db)  # can also save this data to multiple DBs
 
         return user
@@ -55,6 +117,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)  # sign in with django admin
+    # bumped to invalidate every signed access token issued so far
+    token_version = models.PositiveIntegerField(default=0)
+    # last Change.seq of the user's recipes, tags and ingredients
+    change_seq = models.PositiveBigIntegerField(default=0)
+    # set when the account is deleted, the purge job removes it later
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()  # assigning the manager
 
@@ -62,11 +130,111 @@ class User(AbstractBaseUser, PermissionsMixin):
     #   (which is originally username)
     USERNAME_FIELD = 'email'
 
+    def soft_delete(self):
+        # deactivate the account and flag everything it owns as deleted
+        # one UPDATE per table, whatever the size of the account
+
+        now = timezone.now()
+        for model in (Recipe, Tag, Ingredient):
+            model.objects.filter(user_id=self.pk).update(deleted_at=now)
+        self.is_active = False
+        self.deleted_at = now
+        self.save(update_fields=['is_active', 'deleted_at'])
+
 # models.Model is the base class provided by django
 # which means it's just using the default format
 
 
-class Recipe(models.Model):
+# partial indexes only cover rows that haven't been soft-deleted,
+# the ones every api query asks for
+LIVE = models.Q(deleted_at__isnull=True)
+DELETED = models.Q(deleted_at__isnull=False)
+
+
+class ImageBlobManager(models.Manager):
+    # reference counting for stored images
+
+    def lock_files(self, exclusive=False):
+        # held until the end of the transaction; writers of image files
+        # share it, deleting unused files takes it alone, so a file is
+        # never removed between an upload writing it and acquire()
+        # committing the reference
+
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            # sqlite stand-ins serialise all writes anyway
+            return
+        function = (
+            'pg_advisory_xact_lock' if exclusive
+            else 'pg_advisory_xact_lock_shared'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {function}(%s)', [IMAGE_FILES_LOCK])
+
+    def acquire(self, name):
+        # count one more row using the file name
+
+        _, created = self.get_or_create(name=name)
+        if not created:
+            self.filter(name=name).update(refcount=models.F('refcount') + 1)
+
+    def release(self, names):
+        # count one row less for each name
+        # files nothing refers to any more are deleted after commit
+
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return []
+
+        with transaction.atomic():
+            for name, count in counts.items():
+                self.filter(name=name).update(
+                    refcount=models.F('refcount') - count
+                )
+            unused = list(
+                self.filter(
+                    name__in=counts,
+                    refcount__lte=0,
+                ).values_list('name', flat=True)
+            )
+            self.filter(name__in=unused, refcount__lte=0).delete()
+            transaction.on_commit(lambda: self._delete_files(unused))
+
+        return unused
+
+    def _delete_files(self, names):
+        storage = Recipe._meta.get_field('image').storage
+        with transaction.atomic():
+            self.lock_files(exclusive=True)
+            for name in names:
+                # an identical upload may have claimed the file again
+                if self.filter(name=name).exists():
+                    continue
+                try:
+                    storage.delete(name)
+                except OSError:
+                    logger.warning('could not delete image %s', name)
+
+
+class ImageBlob(models.Model):
+    # a stored image file and the number of recipes using it
+    # with content-addressed storage identical uploads share a file,
+    # so it can only be deleted once the last reference is gone
+
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=1)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.name
+
+
+# marks an image column that wasn't loaded from the database
+NOT_LOADED = object()
+
+
+class Recipe(SoftDeleteModel):
     # recipe object
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -87,13 +255,64 @@ class Recipe(models.Model):
 
     # not calling the function here
     # just passing it as a ref
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=select_image_storage,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='recipe_live_user_idx',
+                condition=LIVE,
+            ),
+            models.Index(
+                fields=['deleted_at'],
+                name='recipe_deleted_idx',
+                condition=DELETED,
+            ),
+        ]
+
+    # image name as stored in the database, None for new rows
+    _saved_image = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in instance.__dict__:
+            instance._saved_image = instance.image.name or None
+        else:
+            instance._saved_image = NOT_LOADED
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        # keep ImageBlob reference counts in step with the image column
+
+        with transaction.atomic():
+            if not getattr(self.image, '_committed', True):
+                # the file is written by super().save()
+                ImageBlob.objects.lock_files()
+            super().save(*args, **kwargs)
+            update_fields = kwargs.get('update_fields')
+            if self._saved_image is NOT_LOADED or (
+                update_fields is not None and 'image' not in update_fields
+            ):
+                return
+            image = self.image.name or None
+            if image != self._saved_image:
+                if image:
+                    ImageBlob.objects.acquire(image)
+                ImageBlob.objects.release([self._saved_image])
+                self._saved_image = image
 
     def __str__(self):
         return self.title
 
 
-class Tag(models.Model):
+class Tag(SoftDeleteModel):
     # tag for filtering recipes
 
     name = models.CharField(max_length=255)
@@ -102,13 +321,27 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name'],
+                name='tag_live_user_idx',
+                condition=LIVE,
+            ),
+            models.Index(
+                fields=['deleted_at'],
+                name='tag_deleted_idx',
+                condition=DELETED,
+            ),
+        ]
+
     # returns the string representation
     # that we're checking for in the test
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(SoftDeleteModel):
     # ingredient for recipes
 
     name = models.CharField(max_length=255)
@@ -117,5 +350,237 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name'],
+                name='ingredient_live_user_idx',
+                condition=LIVE,
+            ),
+            models.Index(
+                fields=['deleted_at'],
+                name='ingredient_deleted_idx',
+                condition=DELETED,
+            ),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class ImageUpload(models.Model):
+    # a resumable recipe image upload in progress
+    # chunks are appended to staging_path until offset reaches size
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='image_uploads',
+        on_delete=models.CASCADE,
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @property
+    def staging_path(self):
+        return os.path.join(
+            settings.MEDIA_ROOT,
+            UPLOAD_STAGING_DIR,
+            f'{self.id}.part',
+        )
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+
+class ChangeManager(models.Manager):
+    # manager for the sync change log
+
+    def record(self, user_id, kind, object_ids, deleted=False):
+        # log that objects of a user changed, or were deleted, and
+        # invalidate the user's cached copies once committed
+        #
+        # the sequence numbers come from the user's change_seq. its
+        # row stays locked until commit, so writers of one user take
+        # turns and a sync never skips a change that commits late.
+
+        object_ids = sorted(set(object_ids))
+        if not object_ids:
+            return
+        with transaction.atomic():
+            users = User.objects.filter(pk=user_id)
+            users.update(change_seq=models.F('change_seq') + len(object_ids))
+            first = users.values_list('change_seq', flat=True)[0] - \
+                len(object_ids) + 1
+            # only the latest change of an object is kept
+            self.filter(
+                user_id=user_id,
+                kind=kind,
+                object_id__in=object_ids,
+            ).delete()
+            self.bulk_create([
+                Change(
+                    user_id=user_id,
+                    seq=seq,
+                    kind=kind,
+                    object_id=object_id,
+                    deleted=deleted,
+                )
+                for seq, object_id in enumerate(object_ids, start=first)
+            ])
+        invalidation.publish(f'{kind}s', user_id)
+        # for open event streams, see core.sse
+        for seq, object_id in enumerate(object_ids, start=first):
+            invalidation.publish('changes', encode_event(
+                user_id,
+                ChangeEvent(seq, kind, object_id, deleted),
+            ))
+
+
+class Change(models.Model):
+    # latest change to a recipe, tag or ingredient, for delta sync
+    # deletes are kept as tombstones after the object is purged
+
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    KINDS = [
+        (RECIPE, 'Recipe'),
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='changes',
+        on_delete=models.CASCADE,
+    )
+    seq = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    objects = ChangeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'kind', 'object_id'],
+                name='change_object_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='change_user_seq_idx'),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f'{self.kind} {self.object_id} {action} ({self.seq})'
+
+
+def generate_token_key():
+    # 40 hex characters, same format as rest_framework's Token
+
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+# part of every cached token's key; a new generation leaves the
+# tokens cached so far to expire unread, without touching anything
+# else in the cache
+_token_generation = 0
+
+
+def token_cache_key(key):
+    return f'auth-token:{_token_generation}:{key}'
+
+
+def forget_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def forget_all_tokens():
+    global _token_generation
+    _token_generation += 1
+
+
+# other processes drop their cached copies of revoked tokens
+invalidation.subscribe('auth-token', forget_tokens)
+invalidation.on_reset(forget_all_tokens)
+
+
+class AuthTokenManager(models.Manager):
+    # manager for auth tokens
+
+    def issue(self, user):
+        # create and return a new token for user
+
+        return self.create(
+            user_id=user.pk,
+            expires_at=timezone.now() + settings.TOKEN_TTL,
+        )
+
+    def revoke(self, keys):
+        # delete the given tokens and forget any cached copies
+
+        keys = list(keys)
+        self.filter(key__in=keys).delete()
+        forget_tokens(keys)
+        for key in keys:
+            invalidation.publish('auth-token', key)
+
+    def revoke_for_user(self, user_id):
+        # revoke every token of a user
+
+        self.revoke(
+            self.filter(user_id=user_id).values_list('key', flat=True)
+        )
+
+    def purge_expired(self, batch_size=1000):
+        # delete expired tokens in batches, return how many were deleted
+        # each batch is a short statement on the expires_at index
+        # so the table is never locked for long
+
+        deleted = 0
+        while True:
+            keys = list(
+                self.filter(
+                    expires_at__lte=timezone.now()
+                ).values_list('key', flat=True)[:batch_size]
+            )
+            if not keys:
+                return deleted
+            deleted += self.filter(key__in=keys).delete()[0]
+
+
+class AuthToken(models.Model):
+    # expiring api token
+    # replaces the permanent rest_framework.authtoken Token
+
+    key = models.CharField(
+        max_length=40,
+        primary_key=True,
+        default=generate_token_key,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='auth_tokens',
+        on_delete=models.CASCADE,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = AuthTokenManager()
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return self.key
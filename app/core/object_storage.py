@@ -0,0 +1,388 @@
+"""
+media storage in an S3 compatible object store
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import (
+    datetime,
+    timezone,
+)
+from urllib.parse import (
+    quote,
+    urlencode,
+)
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency
+    boto3 = None
+
+# S3 refuses multipart parts below 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class S3Client:
+    # thin wrapper around a boto3 s3 client
+    #
+    # boto3 clients are thread safe and keep a pool of http
+    # connections, so one client per process is shared by every
+    # storage instance, see get_client().
+
+    def __init__(self, options):
+        if boto3 is None:
+            raise RuntimeError('boto3 is required for MEDIA_STORAGE=s3')
+        self.bucket = options['BUCKET']
+        self._client = boto3.client(
+            's3',
+            endpoint_url=options.get('ENDPOINT_URL') or None,
+            region_name=options.get('REGION') or None,
+            aws_access_key_id=options.get('ACCESS_KEY') or None,
+            aws_secret_access_key=options.get('SECRET_KEY') or None,
+            config=Config(
+                max_pool_connections=options.get('MAX_CONNECTIONS', 10),
+                retries={'max_attempts': 3, 'mode': 'standard'},
+                signature_version='s3v4',
+            ),
+        )
+
+    def put(self, key, data, content_type):
+        self._client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+        )
+
+    def start_multipart(self, key, content_type):
+        return self._client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            ContentType=content_type,
+        )['UploadId']
+
+    def upload_part(self, key, upload_id, number, data):
+        return self._client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=data,
+        )['ETag']
+
+    def complete_multipart(self, key, upload_id, etags):
+        self._client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': number, 'ETag': etag}
+                for number, etag in enumerate(etags, start=1)
+            ]},
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self._client.abort_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+        )
+
+    def open(self, key):
+        return self._client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def stat(self, key):
+        # return (size, last modified) or None for a missing key
+
+        try:
+            head = self._client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+        return head['ContentLength'], head['LastModified']
+
+    def delete(self, key):
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        # yield (key, size, last modified), one page at a time
+
+        pages = self._client.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket,
+            Prefix=prefix,
+        )
+        for page in pages:
+            for item in page.get('Contents', ()):
+                yield item['Key'], item['Size'], item['LastModified']
+
+    def presign(self, key, expires_in):
+        return self._client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=expires_in,
+        )
+
+
+class LocalObjectClient:
+    # stand-in for S3Client that keeps objects in a local directory
+    #
+    # it follows the same put / multipart / presign protocol, so the
+    # storage can be exercised without a network or credentials.
+    # presigned urls carry an HMAC that verify_presigned() checks.
+
+    def __init__(self, options):
+        self.bucket = options['BUCKET']
+        self.root = options['LOCAL_ROOT']
+        self.endpoint = options.get('ENDPOINT_URL') or 'http://localhost:9000'
+        self.secret = (options.get('SECRET_KEY') or 'local').encode()
+
+    def _path(self, key):
+        return os.path.join(self.root, self.bucket, *key.split('/'))
+
+    def _parts(self, upload_id):
+        return os.path.join(self.root, '.multipart', upload_id)
+
+    def put(self, key, data, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def start_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._parts(upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, number, data):
+        path = os.path.join(self._parts(upload_id), str(number))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, key, upload_id, etags):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for number in range(1, len(etags) + 1):
+                part = os.path.join(self._parts(upload_id), str(number))
+                with open(part, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, f)
+        shutil.rmtree(self._parts(upload_id))
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._parts(upload_id), ignore_errors=True)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+
+        modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        return stat.st_size, modified
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        base = os.path.join(self.root, self.bucket)
+        for directory, _, files in os.walk(base):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, base).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    size, modified = self.stat(key)
+                    yield key, size, modified
+
+    def _signature(self, key, expires):
+        message = f'{self.bucket}/{key}:{expires}'.encode()
+        digest = hmac.new(self.secret, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def presign(self, key, expires_in):
+        expires = int(time.time()) + expires_in
+        query = urlencode({
+            'Expires': expires,
+            'Signature': self._signature(key, expires),
+        })
+        return f'{self.endpoint}/{self.bucket}/{quote(key)}?{query}'
+
+    def verify_presigned(self, key, expires, signature, now=None):
+        now = time.time() if now is None else now
+        return int(expires) > now and hmac.compare_digest(
+            signature,
+            self._signature(key, int(expires)),
+        )
+
+
+CLIENT_CLASSES = {
+    's3': S3Client,
+    'local': LocalObjectClient,
+}
+
+
+def get_client(options=None):
+    # one client per configuration and process, shared across threads
+
+    options = options or settings.OBJECT_STORAGE
+    key = tuple(sorted(options.items()))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client_class = CLIENT_CLASSES[options.get('CLIENT', 's3')]
+            client = _clients[key] = client_class(options)
+
+    return client
+
+
+@deconstructible
+class ObjectStorage(Storage):
+    # django storage backed by an S3 compatible bucket
+    #
+    # files larger than one part are sent as a multipart upload while
+    # they are read, so no more than PART_SIZE bytes are in memory.
+    # url() still points at MEDIA_URL, where core.media.MediaView
+    # checks access and redirects to a short-lived presigned url.
+
+    def __init__(self, options=None):
+        self._options = options
+
+    @cached_property
+    def options(self):
+        return self._options or settings.OBJECT_STORAGE
+
+    @property
+    def client(self):
+        return get_client(self.options)
+
+    @property
+    def part_size(self):
+        return max(self.options.get('PART_SIZE', MIN_PART_SIZE), 1)
+
+    def _key(self, name):
+        prefix = self.options.get('PREFIX', '')
+        return prefix + name.replace('\\', '/').lstrip('/')
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode:
+            raise ValueError('Object storage files are read only.')
+        return File(self.client.open(self._key(name)), name=name)
+
+    def _save(self, name, content):
+        key = self._key(name)
+        content_type = getattr(content, 'content_type', None) or \
+            'application/octet-stream'
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        part_size = self.part_size
+        buffer = bytearray()
+        upload_id = None
+        etags = []
+        try:
+            for chunk in content.chunks():
+                buffer += chunk
+                while len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = self.client.start_multipart(
+                            key,
+                            content_type,
+                        )
+                    etags.append(self.client.upload_part(
+                        key, upload_id, len(etags) + 1,
+                        bytes(buffer[:part_size]),
+                    ))
+                    del buffer[:part_size]
+
+            if upload_id is None:
+                self.client.put(key, bytes(buffer), content_type)
+            else:
+                if buffer:
+                    etags.append(self.client.upload_part(
+                        key, upload_id, len(etags) + 1, bytes(buffer)
+                    ))
+                self.client.complete_multipart(key, upload_id, etags)
+        except BaseException:
+            if upload_id is not None:
+                self.client.abort_multipart(key, upload_id)
+            raise
+
+        return name
+
+    def adopt(self, path, name, digest):
+        # upload a finished local file, then remove it
+
+        with open(path, 'rb') as f:
+            name = self.save(name, File(f, name=name))
+        os.unlink(path)
+
+        return name
+
+    def exists(self, name):
+        return self.client.stat(self._key(name)) is not None
+
+    def delete(self, name):
+        self.client.delete(self._key(name))
+
+    def size(self, name):
+        stat = self.client.stat(self._key(name))
+        if stat is None:
+            raise FileNotFoundError(name)
+        return stat[0]
+
+    def get_modified_time(self, name):
+        stat = self.client.stat(self._key(name))
+        if stat is None:
+            raise FileNotFoundError(name)
+        return stat[1]
+
+    def listdir(self, path):
+        prefix = self._key(path.rstrip('/') + '/') if path else self._key('')
+        directories, files = set(), []
+        for key, _, _ in self.client.list(prefix):
+            rest = key[len(prefix):]
+            if '/' in rest:
+                directories.add(rest.split('/', 1)[0])
+            else:
+                files.append(rest)
+
+        return sorted(directories), files
+
+    def list_files(self, path):
+        # yield (basename, size, last modified) for files below path
+
+        prefix = self._key(path.rstrip('/') + '/')
+        for key, size, modified in self.client.list(prefix):
+            yield key[len(prefix):], size, modified
+
+    def url(self, name):
+        return settings.MEDIA_URL + quote(name.replace('\\', '/'))
+
+    def presigned_url(self, name, expires_in=None):
+        if expires_in is None:
+            expires_in = self.options.get('PRESIGN_SECONDS', 300)
+        return self.client.presign(self._key(name), expires_in)
@@ -0,0 +1,160 @@
+"""
+physical deletion of soft-deleted rows
+"""
+
+import logging
+import threading
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import (
+    close_old_connections,
+    transaction,
+)
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_m2m_links(model, field_name, column, ids):
+    # delete the through rows of a many-to-many field in one statement
+
+    through = getattr(model, field_name).through
+    through.objects.filter(**{f'{column}__in': ids}).delete()
+
+
+def _purge_recipes(batch_size):
+    # hard delete one batch of soft-deleted recipes
+    # return the number of recipes deleted
+
+    ids = list(
+        Recipe.all_objects.filter(
+            deleted_at__isnull=False
+        ).values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+
+    with transaction.atomic():
+        _delete_m2m_links(Recipe, 'tags', 'recipe', ids)
+        _delete_m2m_links(Recipe, 'ingredients', 'recipe', ids)
+        # images may be shared, the post_delete handler releases them
+        # and files go once their last user is gone
+        Recipe.all_objects.filter(id__in=ids).delete()
+
+    return len(ids)
+
+
+def _purge_attrs(model, field_name, column, batch_size):
+    # hard delete one batch of soft-deleted tags or ingredients
+
+    ids = list(
+        model.all_objects.filter(
+            deleted_at__isnull=False
+        ).values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+
+    with transaction.atomic():
+        _delete_m2m_links(Recipe, field_name, column, ids)
+        model.all_objects.filter(id__in=ids).delete()
+
+    return len(ids)
+
+
+def _purge_users(batch_size):
+    # hard delete soft-deleted users that own nothing any more
+
+    user_model = get_user_model()
+    ids = list(
+        user_model.objects.filter(deleted_at__isnull=False).exclude(
+            id__in=Recipe.all_objects.values('user_id')
+        ).exclude(
+            id__in=Tag.all_objects.values('user_id')
+        ).exclude(
+            id__in=Ingredient.all_objects.values('user_id')
+        ).values_list('id', flat=True)[:batch_size]
+    )
+    for user in user_model.objects.filter(id__in=ids):
+        # tokens and permissions are small, let django cascade them
+        user.delete()
+
+    return len(ids)
+
+
+def purge_deleted(batch_size=None):
+    # delete every soft-deleted row, batch_size rows per statement
+    # return {kind: rows deleted}
+    #
+    # each batch runs in its own short transaction, so locks are
+    # held briefly and the purge can be interrupted at any point.
+
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    purges = {
+        'recipes': lambda: _purge_recipes(batch_size),
+        'tags': lambda: _purge_attrs(Tag, 'tags', 'tag', batch_size),
+        'ingredients': lambda: _purge_attrs(
+            Ingredient, 'ingredients', 'ingredient', batch_size
+        ),
+        'users': lambda: _purge_users(batch_size),
+    }
+
+    deleted = {}
+    for kind, purge in purges.items():
+        deleted[kind] = 0
+        while True:
+            count = purge()
+            deleted[kind] += count
+            if count < batch_size:
+                break
+
+    return deleted
+
+
+class PurgeWorker:
+    # runs purge_deleted() on one background thread per process
+    #
+    # requests only flag rows as deleted and wake the worker,
+    # so deletes return immediately however much the flag hides.
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def schedule(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='purge-worker',
+                    daemon=True,
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                close_old_connections()
+                purge_deleted()
+            except Exception:
+                logger.exception('purging deleted rows failed')
+            finally:
+                close_old_connections()
+
+
+purge_worker = PurgeWorker()
+
+
+def schedule_purge():
+    # wake the background purge once the current transaction commits
+
+    if settings.PURGE_IN_BACKGROUND:
+        transaction.on_commit(purge_worker.schedule)
@@ -0,0 +1,357 @@
+"""
+per-user in-memory index of recipe tags and ingredients,
+for pantry and similar-recipe queries
+"""
+
+import heapq
+import math
+import threading
+from array import array
+from collections import (
+    Counter,
+    defaultdict,
+)
+from django.conf import settings
+from core.models import (
+    Change,
+    Recipe,
+    User,
+)
+from core.singleflight import SingleFlight
+from core.tiered_cache import LocalLRU
+
+try:
+    import numpy
+except ImportError:  # optional dependency
+    numpy = None
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    # python < 3.10
+    def popcount(n):
+        return bin(n).count('1')
+
+
+JACCARD = 'jaccard'
+COSINE = 'cosine'
+
+
+def bit_positions(mask):
+    # positions of the set bits of mask, lowest first
+
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class RecipeIndex:
+    # tags and ingredients of one user's live recipes
+    #
+    # every tag and ingredient is a feature with a bit, and a recipe
+    # is the int of its features' bits (masks). a pantry is an int
+    # too, so the ingredients a recipe misses are mask & ~pantry and
+    # a pantry query is one pass of integer ops without a join.
+    #
+    # for similarity the same recipe x feature matrix is also kept
+    # by column: each recipe has a slot, each feature an array of the
+    # slots using it. the features a recipe shares with every other
+    # one are then a bincount over a few columns, see similar(). a
+    # changed recipe gets a new slot and its old one is zeroed in
+    # sizes, so columns are only appended to; compact() drops the
+    # stale slots once they outnumber the live ones.
+    #
+    # recipes without tags or ingredients are left out. the index
+    # remembers the change_seq it is current to and catches up from
+    # the change log before each query, see refresh().
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.reset()
+
+    def __len__(self):
+        return len(self.masks)
+
+    def reset(self):
+        self.seq = 0
+        # (kind, id) -> bit
+        self.bits = {}
+        self.ingredient_bits = 0
+        self.masks = {}
+        # deleted tags and ingredients whose bits were cleared
+        self.dropped = set()
+        self.slots = {}
+        self.recipe_ids = array('q')
+        self.sizes = array('i')
+        self.columns = defaultdict(lambda: array('i'))
+
+    def build(self):
+        # the sequence is read first, so changes committing while the
+        # rows load are applied again by the next refresh()
+
+        self.reset()
+        self.seq = User.objects.filter(pk=self.user_id).values_list(
+            'change_seq', flat=True
+        ).first() or 0
+        self._load()
+
+    def refresh(self):
+        # apply the changes logged since the index was current
+        #
+        # changed recipes are reloaded, a deleted tag or ingredient
+        # has its bit cleared. more than RECIPE_INDEX_REBUILD_AFTER
+        # changes, or a deleted one coming back, rebuild the index.
+
+        limit = settings.RECIPE_INDEX_REBUILD_AFTER
+        changes = list(Change.objects.filter(
+            user_id=self.user_id,
+            seq__gt=self.seq,
+        ).order_by('seq').values_list(
+            'seq', 'kind', 'object_id', 'deleted'
+        )[:limit + 1])
+        if not changes:
+            return
+        if len(changes) > limit:
+            self.build()
+            return
+
+        recipe_ids = set()
+        for _, kind, object_id, deleted in changes:
+            if kind == Change.RECIPE:
+                recipe_ids.add(object_id)
+            elif deleted:
+                self._drop((kind, object_id))
+            elif (kind, object_id) in self.dropped:
+                self.build()
+                return
+        if recipe_ids:
+            self._load(recipe_ids)
+        self.seq = changes[-1][0]
+
+    def set_recipe(self, recipe_id, mask):
+        # replace the features of a recipe, a 0 mask removes it
+
+        slot = self.slots.pop(recipe_id, None)
+        if slot is not None:
+            self.sizes[slot] = 0
+            del self.masks[recipe_id]
+        if not mask:
+            return
+
+        slot = len(self.recipe_ids)
+        self.masks[recipe_id] = mask
+        self.slots[recipe_id] = slot
+        self.recipe_ids.append(recipe_id)
+        self.sizes.append(popcount(mask))
+        for bit in bit_positions(mask):
+            self.columns[bit].append(slot)
+
+    def compact(self):
+        # renumber the slots, leaving out the stale ones
+
+        masks = self.masks
+        self.masks = {}
+        self.slots = {}
+        self.recipe_ids = array('q')
+        self.sizes = array('i')
+        self.columns = defaultdict(lambda: array('i'))
+        for recipe_id, mask in masks.items():
+            self.set_recipe(recipe_id, mask)
+
+    def pantry(self, ingredient_ids, max_missing=0, limit=None):
+        # [(recipe id, missing)] of the recipes using at least one of
+        # ingredient_ids and missing at most max_missing others,
+        # fewest missing first, then newest first
+
+        pantry = 0
+        for ingredient_id in ingredient_ids:
+            bit = self.bits.get((Change.INGREDIENT, ingredient_id))
+            if bit is not None:
+                pantry |= 1 << bit
+        absent = self.ingredient_bits & ~pantry
+
+        if not max_missing:
+            found = [
+                (0, -recipe_id) for recipe_id, mask in self.masks.items()
+                if not mask & absent and mask & pantry
+            ]
+        else:
+            found = []
+            for recipe_id, mask in self.masks.items():
+                if not mask & pantry:
+                    continue
+                missing = popcount(mask & absent)
+                if missing <= max_missing:
+                    found.append((missing, -recipe_id))
+        if limit is not None:
+            found = heapq.nsmallest(limit, found)
+        else:
+            found.sort()
+
+        return [(-recipe_id, missing) for missing, recipe_id in found]
+
+    def similar(self, recipe_id, limit, metric=JACCARD):
+        # [(recipe id, similarity)] of the limit recipes sharing the
+        # most tags and ingredients with recipe_id, by jaccard
+        # (|a & b| / |a | b|) or cosine (|a & b| / sqrt(|a||b|)),
+        # most similar first, then newest first
+
+        mask = self.masks.get(recipe_id)
+        if not mask or limit <= 0:
+            return []
+        features = list(bit_positions(mask))
+        own = self.slots[recipe_id]
+        if numpy is None:
+            return self._similar_python(features, own, limit, metric)
+
+        # shared features of every slot, in one pass over the columns
+        shared = numpy.bincount(
+            numpy.concatenate([
+                numpy.frombuffer(self.columns[bit], dtype='i')
+                for bit in features
+            ]),
+            minlength=len(self.recipe_ids),
+        )
+        sizes = numpy.frombuffer(self.sizes, dtype='i')
+        shared[own] = 0
+        slots = numpy.flatnonzero((shared > 0) & (sizes > 0))
+        shared = shared[slots]
+        sizes = sizes[slots]
+        if metric == COSINE:
+            scores = shared / numpy.sqrt(sizes * len(features))
+        else:
+            scores = shared / (sizes + len(features) - shared)
+        recipe_ids = numpy.frombuffer(self.recipe_ids, dtype='q')[slots]
+
+        if len(slots) > limit:
+            # the limit best, and every recipe tied with the last one
+            # so that newer recipes win ties as in the fallback
+            cutoff = numpy.partition(scores, -limit)[-limit]
+            top = numpy.flatnonzero(scores >= cutoff)
+            scores = scores[top]
+            recipe_ids = recipe_ids[top]
+        order = numpy.lexsort((-recipe_ids, -scores))[:limit]
+
+        return [
+            (int(recipe_ids[i]), float(scores[i])) for i in order
+        ]
+
+    def _similar_python(self, features, own, limit, metric):
+        shared = Counter()
+        for bit in features:
+            shared.update(self.columns[bit])
+
+        scored = []
+        for slot, count in shared.items():
+            size = self.sizes[slot]
+            if not size or slot == own:
+                continue
+            if metric == COSINE:
+                score = count / math.sqrt(size * len(features))
+            else:
+                score = count / (size + len(features) - count)
+            scored.append((score, self.recipe_ids[slot]))
+
+        return [
+            (recipe_id, score)
+            for score, recipe_id in heapq.nlargest(limit, scored)
+        ]
+
+    def _bit(self, key):
+        bit = self.bits.get(key)
+        if bit is None:
+            bit = self.bits[key] = len(self.bits)
+            if key[0] == Change.INGREDIENT:
+                self.ingredient_bits |= 1 << bit
+
+        return bit
+
+    def _load(self, recipe_ids=None):
+        # (re)load the features of recipe_ids, or of every recipe
+
+        masks = defaultdict(int)
+        for kind, related in (
+            (Change.TAG, Recipe.tags),
+            (Change.INGREDIENT, Recipe.ingredients),
+        ):
+            target = related.field.related_model.__name__.lower()
+            rows = related.through.objects.filter(**{
+                'recipe__user_id': self.user_id,
+                'recipe__deleted_at__isnull': True,
+                f'{target}__deleted_at__isnull': True,
+            })
+            if recipe_ids is not None:
+                rows = rows.filter(recipe_id__in=recipe_ids)
+            for recipe_id, object_id in rows.values_list(
+                'recipe_id', f'{target}_id'
+            ).iterator():
+                masks[recipe_id] |= 1 << self._bit((kind, object_id))
+
+        for recipe_id in recipe_ids or ():
+            self.set_recipe(recipe_id, masks.pop(recipe_id, 0))
+        for recipe_id, mask in masks.items():
+            self.set_recipe(recipe_id, mask)
+        if len(self.recipe_ids) > 2 * len(self.masks) + 1024:
+            self.compact()
+
+    def _drop(self, key):
+        bit = self.bits.get(key)
+        if bit is None:
+            return
+        self.dropped.add(key)
+        self.ingredient_bits &= ~(1 << bit)
+        for slot in self.columns.pop(bit, ()):
+            if self.sizes[slot]:
+                recipe_id = self.recipe_ids[slot]
+                self.set_recipe(
+                    recipe_id,
+                    self.masks[recipe_id] & ~(1 << bit),
+                )
+
+
+# indexes of recently queried users, sized by their recipe count
+_indexes = LocalLRU(
+    settings.RECIPE_INDEX_MAX_USERS,
+    settings.RECIPE_INDEX_MAX_RECIPES,
+)
+_flight = SingleFlight()
+
+
+def _build(user_id):
+    index = RecipeIndex(user_id)
+    index.build()
+    _indexes.set(user_id, index, len(index), math.inf)
+
+    return index
+
+
+def _index(user_id):
+    index = _indexes.get(user_id, 0)
+    if index is None:
+        index = _flight.do(user_id, lambda: _build(user_id))
+
+    return index
+
+
+def find_by_pantry(user_id, ingredient_ids, max_missing=0, limit=None):
+    # see RecipeIndex.pantry
+
+    index = _index(user_id)
+    with index.lock:
+        index.refresh()
+        return index.pantry(ingredient_ids, max_missing, limit)
+
+
+def find_similar(user_id, recipe_id, limit, metric=JACCARD):
+    # see RecipeIndex.similar
+
+    index = _index(user_id)
+    with index.lock:
+        index.refresh()
+        return index.similar(recipe_id, limit, metric)
+
+
+def clear_indexes():
+    _indexes.clear()
@@ -0,0 +1,130 @@
+"""
+precomputed OpenAPI schema
+"""
+
+import hashlib
+import os
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from drf_spectacular.renderers import (
+    OpenApiJsonRenderer,
+    OpenApiYamlRenderer,
+)
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework import status
+
+# renderer format -> (renderer, file name)
+SCHEMA_FILES = {
+    'yaml': (OpenApiYamlRenderer, 'schema.yaml'),
+    'json': (OpenApiJsonRenderer, 'schema.json'),
+}
+
+# path -> (mtime, content, etag)
+_loaded = {}
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    # document SignedTokenAuthentication as http bearer auth
+
+    target_class = 'core.authentication.SignedTokenAuthentication'
+    name = 'accessToken'
+
+    def get_security_definition(self, auto_schema):
+        return {
+            'type': 'http',
+            'scheme': 'bearer',
+            'bearerFormat': 'JWT',
+        }
+
+
+def generate_schema():
+    # introspect every view and return {format: rendered bytes}
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+
+    return {
+        schema_format: renderer().render(schema, renderer_context={})
+        for schema_format, (renderer, _) in SCHEMA_FILES.items()
+    }
+
+
+def write_schema(directory):
+    # write every rendered format into directory
+    # each file is replaced atomically so a running server
+    # never reads a half written schema
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for schema_format, content in generate_schema().items():
+        path = os.path.join(directory, SCHEMA_FILES[schema_format][1])
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        paths.append(path)
+
+    return paths
+
+
+def load_schema(schema_format):
+    # return (content, etag) of the stored schema, or None
+    # files are read once and kept in memory until they change on disk
+
+    path = os.path.join(
+        settings.SCHEMA_DIR,
+        SCHEMA_FILES[schema_format][1],
+    )
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            content = f.read()
+        etag = '"{}"'.format(hashlib.sha256(content).hexdigest())
+        cached = _loaded[path] = (mtime, content, etag)
+
+    return cached[1], cached[2]
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    # serve the schema written by `manage.py build_schema`
+    #
+    # generating the document introspects every viewset and
+    # serializer, which is far too slow to do per request.
+    # the stored schema is served from memory with its content
+    # hash as ETag. live generation is only used with DEBUG on.
+
+    def _get_schema_response(self, request):
+        if settings.DEBUG:
+            return super()._get_schema_response(request)
+
+        renderer = request.accepted_renderer
+        stored = load_schema(renderer.format)
+        if stored is None:
+            return HttpResponse(
+                'Schema has not been built, run `manage.py build_schema`',
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content_type='text/plain',
+            )
+
+        content, etag = stored
+        # weak comparison: the compression middleware marks it W/
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age={}'.format(
+            settings.SCHEMA_CACHE_MAX_AGE
+        )
+
+        return response
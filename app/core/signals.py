@@ -0,0 +1,66 @@
+"""
+signal handlers for core models
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from core import invalidation
+from core.models import (
+    NOT_LOADED,
+    AuthToken,
+    ImageBlob,
+    ImageUpload,
+    Recipe,
+)
+from core.signed_tokens import revoke_access_tokens
+from core.uploads import remove_staging_file
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, created, **kwargs):
+    # cached profiles and lists follow every save of a user,
+    # whether through the api, the admin or soft_delete()
+
+    if not created:
+        invalidation.publish('user', instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_tokens_of_inactive_user(sender, instance, created, **kwargs):
+    # api tokens assume their user is active
+    # so deactivating a user revokes all of them
+
+    if not created and not instance.is_active:
+        AuthToken.objects.revoke_for_user(instance.pk)
+        revoke_access_tokens(instance.pk)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_tokens_of_deleted_user(sender, instance, **kwargs):
+    # revoke before the tokens are gone, so cached copies are dropped too
+
+    AuthToken.objects.revoke_for_user(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_of_deleted_recipe(sender, instance, **kwargs):
+    # hard deletes, e.g. by the purge, the admin or a user cascade,
+    # give up the recipe's reference to its image file
+
+    if instance._saved_image is not NOT_LOADED:
+        ImageBlob.objects.release([instance._saved_image])
+
+
+@receiver(post_delete, sender=ImageUpload)
+def remove_staging_file_of_deleted_upload(sender, instance, **kwargs):
+    # uploads also go with their recipe or user, e.g. in the purge
+
+    # the path is read now, the instance loses its id once deleted
+    path = instance.staging_path
+    transaction.on_commit(lambda: remove_staging_file(path))
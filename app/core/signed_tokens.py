@@ -0,0 +1,131 @@
+"""
+short-lived, HMAC-signed access tokens
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from core import invalidation
+
+# JWT compatible, always HS256
+HEADER = base64.urlsafe_b64encode(
+    b'{"alg":"HS256","typ":"JWT"}'
+).rstrip(b'=')
+
+# user id -> lowest token version still accepted
+# filled by revoke_access_tokens(), so the check costs a dict lookup
+_min_versions = {}
+
+
+class InvalidAccessToken(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def _sign(signing_input):
+    key = settings.ACCESS_TOKEN_SIGNING_KEY.encode()
+    return hmac.new(key, signing_input, hashlib.sha256).digest()
+
+
+def encode_access_token(user_id, version, is_staff=False, now=None):
+    # return a signed token for user_id that expires after
+    # ACCESS_TOKEN_TTL
+
+    now = time.time() if now is None else now
+    payload = {
+        'uid': user_id,
+        'ver': version,
+        'stf': is_staff,
+        'exp': int(now + settings.ACCESS_TOKEN_TTL.total_seconds()),
+    }
+    signing_input = HEADER + b'.' + _b64encode(
+        json.dumps(payload, separators=(',', ':')).encode()
+    )
+
+    return (signing_input + b'.' + _b64encode(_sign(signing_input))).decode()
+
+
+def decode_access_token(token, now=None):
+    # verify token and return its payload
+    # raises InvalidAccessToken for anything but a valid, current token
+
+    try:
+        header, payload, signature = token.encode().split(b'.')
+    except (UnicodeEncodeError, ValueError):
+        raise InvalidAccessToken('Malformed token.')
+    if header != HEADER:
+        raise InvalidAccessToken('Unsupported token header.')
+
+    try:
+        expected = _sign(header + b'.' + payload)
+        valid = hmac.compare_digest(expected, _b64decode(signature))
+        claims = json.loads(_b64decode(payload)) if valid else None
+    except (ValueError, TypeError):
+        raise InvalidAccessToken('Malformed token.')
+    if not valid:
+        raise InvalidAccessToken('Invalid signature.')
+
+    try:
+        user_id, version = claims['uid'], claims['ver']
+        expires = claims['exp']
+    except (KeyError, TypeError):
+        raise InvalidAccessToken('Malformed token.')
+
+    now = time.time() if now is None else now
+    if expires <= now:
+        raise InvalidAccessToken('Token has expired.')
+    if version < _min_versions.get(user_id, 0):
+        raise InvalidAccessToken('Token has been revoked.')
+
+    return claims
+
+
+def mark_revoked(user_id, version):
+    # reject tokens of user_id older than version in this process
+    _min_versions[user_id] = max(_min_versions.get(user_id, 0), version)
+
+
+def clear_revocations():
+    _min_versions.clear()
+
+
+def revoke_access_tokens(user_id):
+    # invalidate every access token issued to a user so far
+
+    users = get_user_model().objects.filter(pk=user_id)
+    users.update(token_version=F('token_version') + 1)
+    version = users.values_list('token_version', flat=True)[0]
+    mark_revoked(user_id, version)
+    invalidation.publish('access-revoked', f'{user_id}:{version}')
+    # the update above skips post_save, see core.signals
+    invalidation.publish('user', user_id)
+
+
+def _apply_revocations(keys):
+    for key in keys:
+        user_id, version = key.split(':')
+        mark_revoked(int(user_id), int(version))
+
+
+def reload_revocations():
+    # rebuild the revocations from the database after missed events
+
+    users = get_user_model().objects.filter(token_version__gt=0)
+    for user_id, version in users.values_list('pk', 'token_version'):
+        mark_revoked(user_id, version)
+
+
+invalidation.subscribe('access-revoked', _apply_revocations)
+invalidation.on_reset(reload_revocations)
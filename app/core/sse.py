@@ -0,0 +1,323 @@
+"""
+server-sent events stream of a user's recipe library changes
+"""
+
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import exceptions
+from core.authentication import ExpiringTokenAuthentication
+from core.events import (
+    ChangeEvent,
+    broker,
+)
+from core.models import Change
+from core.signed_tokens import (
+    InvalidAccessToken,
+    decode_access_token,
+)
+
+
+def _run_with_connection(fn, *args):
+    # outside django's request cycle, so close connections ourselves
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def database(fn, *args):
+    return await sync_to_async(_run_with_connection)(fn, *args)
+
+
+def changes_since(user_id, seq, limit):
+    return [
+        ChangeEvent(*row) for row in Change.objects.filter(
+            user_id=user_id,
+            seq__gt=seq,
+        ).order_by('seq').values_list(
+            'seq', 'kind', 'object_id', 'deleted'
+        )[:limit]
+    ]
+
+
+def format_event(event):
+    data = json.dumps(event._asdict(), separators=(',', ':'))
+    return f'id: {event.seq}\nevent: change\ndata: {data}\n\n'.encode()
+
+
+class Credentials:
+    # who a stream belongs to and until when
+
+    def __init__(self, user_id, expires, access_token=None, token_key=None):
+        self.user_id = user_id
+        self.expires = expires
+        self.access_token = access_token
+        self.token_key = token_key
+
+    async def still_valid(self):
+        # tokens can be revoked, and their user deactivated,
+        # before they expire
+
+        if self.access_token is not None:
+            try:
+                decode_access_token(self.access_token)
+            except InvalidAccessToken:
+                return False
+        if self.token_key is not None:
+            try:
+                await database(
+                    ExpiringTokenAuthentication().authenticate_credentials,
+                    self.token_key,
+                )
+            except exceptions.AuthenticationFailed:
+                return False
+
+        return True
+
+
+class EventStream:
+    # ASGI app streaming change events to one user's devices
+    #
+    # GET with `Authorization: Bearer <access token>` or
+    # `Token <key>`; browsers' EventSource can't set headers and
+    # pass ?access_token= instead. every change to a recipe, tag or
+    # ingredient is sent as
+    #
+    #   id: <seq>
+    #   event: change
+    #   data: {"seq":<seq>,"kind":"recipe","id":1,"deleted":false}
+    #
+    # seq is the delta sync token (see recipe.views.SyncView).
+    # with Last-Event-ID, or ?since=, missed changes are replayed
+    # from the change log first. a stream that falls behind, or sees
+    # a gap in the sequence, catches up the same way; without a
+    # starting point it sends `resync` and the client syncs instead.
+    # the stream ends with an `expired` event when its token expires
+    # or is revoked.
+    #
+    # streams are coroutines waiting on a queue, so idle ones cost a
+    # little memory and no thread, see `manage.py bench_sse`.
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            await self.respond(send, 405, 'Method not allowed.',
+                               [(b'allow', b'GET')])
+            return
+        try:
+            credentials = await self.authenticate(scope)
+        except exceptions.AuthenticationFailed as error:
+            await self.respond(send, 401, str(error.detail),
+                               [(b'www-authenticate', b'Bearer')])
+            return
+        if len(broker) >= settings.SSE_MAX_STREAMS:
+            await self.respond(send, 503, 'Too many streams.',
+                               [(b'retry-after', b'10')])
+            return
+
+        headers = dict(scope['headers'])
+        query = self.query(scope)
+        since = headers.get(b'last-event-id', b'').decode('latin-1') or \
+            query.get('since', '')
+        if since and not since.isdigit():
+            await self.respond(send, 400, 'Not a valid sync token.')
+            return
+
+        subscription = broker.subscribe(
+            credentials.user_id,
+            settings.SSE_QUEUE_SIZE,
+        )
+        stream = asyncio.ensure_future(self.stream(
+            send,
+            subscription,
+            credentials,
+            int(since) if since else None,
+        ))
+
+        async def watch():
+            # the client went away: end the stream
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            stream.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await stream
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watcher.cancel()
+            broker.unsubscribe(subscription)
+
+    def query(self, scope):
+        return dict(parse_qsl(scope.get('query_string', b'').decode()))
+
+    async def authenticate(self, scope):
+        headers = dict(scope['headers'])
+        auth = headers.get(b'authorization', b'').split()
+        if not auth:
+            token = self.query(scope).get('access_token')
+            if not token:
+                raise exceptions.AuthenticationFailed(
+                    'Authentication credentials were not provided.'
+                )
+            auth = [b'bearer', token.encode()]
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid header.')
+        keyword, token = auth[0].lower(), auth[1].decode('latin-1')
+
+        if keyword == b'bearer':
+            try:
+                claims = decode_access_token(token)
+            except InvalidAccessToken as error:
+                raise exceptions.AuthenticationFailed(str(error))
+            return Credentials(claims['uid'], claims['exp'], token)
+
+        if keyword == b'token':
+            user_id, expires_at, is_active = await database(
+                ExpiringTokenAuthentication().get_token,
+                token,
+            )
+            if not is_active:
+                raise exceptions.AuthenticationFailed(
+                    'User inactive or deleted.'
+                )
+            if expires_at.timestamp() <= time.time():
+                raise exceptions.AuthenticationFailed('Token has expired.')
+            return Credentials(user_id, expires_at.timestamp(),
+                               token_key=token)
+
+        raise exceptions.AuthenticationFailed('Unsupported authorization.')
+
+    async def respond(self, send, status, detail, headers=()):
+        body = json.dumps({'detail': detail}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                *headers,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def replay(self, user_id, seq):
+        # every change after seq, from the change log
+
+        events = []
+        while True:
+            page = await database(
+                changes_since,
+                user_id,
+                seq,
+                settings.SYNC_PAGE_SIZE,
+            )
+            events.extend(page)
+            if len(page) < settings.SYNC_PAGE_SIZE:
+                return events
+            seq = page[-1].seq
+
+    async def stream(self, send, subscription, credentials, last_seq):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # nginx would buffer the stream otherwise
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        body = f'retry: {settings.SSE_RETRY_MS}\n\n'.encode()
+        if last_seq is not None:
+            events = await self.replay(credentials.user_id, last_seq)
+            body += b''.join(map(format_event, events))
+            if events:
+                last_seq = events[-1].seq
+        await send({
+            'type': 'http.response.body',
+            'body': body,
+            'more_body': True,
+        })
+
+        # credentials are checked every SSE_KEEPALIVE, whether events
+        # are flowing or not, and a keepalive is sent if they aren't
+        check_at = time.monotonic() + settings.SSE_KEEPALIVE
+        while True:
+            timeout = min(
+                check_at - time.monotonic(),
+                credentials.expires - time.time(),
+            )
+            first = None
+            if timeout > 0:
+                try:
+                    first = await asyncio.wait_for(
+                        subscription.get(),
+                        timeout,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            if first is None or time.monotonic() >= check_at:
+                if credentials.expires <= time.time() or \
+                        not await credentials.still_valid():
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b'event: expired\ndata: {}\n\n',
+                    })
+                    return
+                check_at = time.monotonic() + settings.SSE_KEEPALIVE
+            if first is None:
+                await send({
+                    'type': 'http.response.body',
+                    'body': b': keepalive\n\n',
+                    'more_body': True,
+                })
+                continue
+
+            body = []
+            for event in sorted([first] + subscription.drain()):
+                if last_seq is not None and event.seq <= last_seq:
+                    continue
+                if subscription.overflowed and last_seq is None:
+                    # nothing to replay from, the client syncs itself
+                    subscription.overflowed = False
+                    body.append(b'event: resync\ndata: {}\n\n')
+                elif subscription.overflowed or (
+                    last_seq is not None and event.seq > last_seq + 1
+                ):
+                    # missed events: they are committed, because
+                    # the user's later change waited for them
+                    subscription.overflowed = False
+                    events = await self.replay(credentials.user_id, last_seq)
+                    body.extend(map(format_event, events))
+                    if events:
+                        last_seq = events[-1].seq
+                    continue
+                body.append(format_event(event))
+                last_seq = event.seq
+            if body:
+                await send({
+                    'type': 'http.response.body',
+                    'body': b''.join(body),
+                    'more_body': True,
+                })
+
+
+class EventStreamRouter:
+    # serves SSE_PATH with EventStream, everything else with django
+
+    def __init__(self, application):
+        self.application = application
+        self.events = EventStream()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == settings.SSE_PATH:
+            return await self.events(scope, receive, send)
+
+        return await self.application(scope, receive, send)
@@ -0,0 +1,101 @@
+"""
+content-addressed file storage
+"""
+
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.storage import (
+    FileSystemStorage,
+    default_storage,
+)
+from core.object_storage import ObjectStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # stores every file under the sha256 of its content
+    #
+    # the upload is hashed chunk by chunk while it is copied to a
+    # temporary file, so it is never held in memory as a whole.
+    # identical uploads end up as one file, shared by every row that
+    # refers to it; core.models.ImageBlob counts those references.
+
+    def get_available_name(self, name, max_length=None):
+        # the real name is only known once the content is hashed
+        # and an existing file with that name is the same file
+        return name
+
+    def content_name(self, name, digest):
+        # name of a file with sha256 digest uploaded as name
+
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+
+        return os.path.join(directory, digest + extension).replace('\\', '/')
+
+    def adopt(self, path, name, digest):
+        # move a finished local file into storage with one rename
+        # path must be on the same filesystem as the storage
+
+        name = self.content_name(name, digest)
+        target = self.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.unlink(path)
+        else:
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+            os.replace(path, target)
+
+        return name
+
+    def _save(self, name, content):
+        full_directory = self.path(os.path.dirname(name))
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=full_directory,
+            prefix='.upload-',
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            return self.adopt(tmp_path, name, digest.hexdigest())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def select_image_storage():
+    # storage for recipe images, picked by MEDIA_STORAGE
+    # and IMAGE_STORAGE_MODE
+
+    if settings.MEDIA_STORAGE == 'object':
+        return ObjectStorage()
+    if settings.IMAGE_STORAGE_MODE == 'content':
+        return ContentAddressedStorage()
+
+    return default_storage
+
+
+def adopt_file(storage, path, name, digest):
+    # move the local file at path into storage, return its stored name
+    # used for uploads assembled outside of the storage api
+
+    if hasattr(storage, 'adopt'):
+        return storage.adopt(path, name, digest)
+
+    name = storage.get_available_name(name)
+    target = storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if storage.file_permissions_mode is not None:
+        os.chmod(path, storage.file_permissions_mode)
+    os.replace(path, target)
+
+    return name.replace('\\', '/')
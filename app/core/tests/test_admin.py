@@ -2,10 +2,34 @@
 tests for django admin modification
 """
 
+from decimal import Decimal
+from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.test import Client
+from django.test import (
+    Client,
+    override_settings,
+)
+from core.admin import EstimatedCountPaginator
+from core.models import (
+    Change,
+    Recipe,
+    Tag,
+)
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('2.50'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
 
 
 class AdminSiteTests(TestCase):
@@ -54,3 +78,128 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+
+class RecipeAdminTests(TestCase):
+    # test the admin pages for recipes, tags and ingredients
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='123456'
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='123456',
+        )
+
+    def test_changelist_queries_bounded(self):
+        # test: the number of queries doesn't grow with the rows shown
+
+        url = reverse('admin:core_recipe_changelist')
+        create_recipe(self.user)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+
+        for i in range(10):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@example.com',
+                password='123456',
+            )
+            create_recipe(user)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+    def test_change_page_doesnt_list_every_tag(self):
+        # test: tags are picked by autocomplete, not a full select
+
+        recipe = create_recipe(self.user)
+        Tag.objects.create(user=self.user, name='Unlinked tag')
+
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[recipe.id])
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotContains(res, 'Unlinked tag')
+
+    def test_autocomplete_skips_deleted(self):
+        # test: soft-deleted tags can't be picked for a recipe
+
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Vegetarian').soft_delete()
+
+        res = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'veg',
+            'app_label': 'core',
+            'model_name': 'recipe',
+            'field_name': 'tags',
+        })
+
+        names = [item['text'] for item in res.json()['results']]
+        self.assertEqual(names, ['Vegan'])
+
+    def test_bulk_soft_delete(self):
+        # test: the delete action flags the selection in one update
+
+        recipes = [create_recipe(self.user) for _ in range(3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(
+                reverse('admin:core_recipe_changelist'),
+                {
+                    'action': 'soft_delete_selected',
+                    '_selected_action': [r.id for r in recipes[:2]],
+                }
+            )
+
+        updates = [
+            q for q in queries
+            if q['sql'].startswith('UPDATE "core_recipe"')
+        ]
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(
+            Change.objects.filter(deleted=True).count(),
+            2
+        )
+
+    def test_delete_view_soft_deletes(self):
+        # test: the delete button flags the row instead of removing it
+
+        recipe = create_recipe(self.user)
+        url = reverse('admin:core_recipe_delete', args=[recipe.id])
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertIsNotNone(Recipe.all_objects.get(id=recipe.id).deleted_at)
+        self.assertTrue(Change.objects.filter(
+            object_id=recipe.id,
+            deleted=True,
+        ).exists())
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    @patch('core.admin.estimate_count', return_value=5000000)
+    def test_estimated_count(self, patched_estimate):
+        # test: unfiltered big tables use the estimate, filtered ones count
+
+        create_recipe(self.user)
+
+        recipes = Recipe.all_objects.order_by('-id')
+        unfiltered = EstimatedCountPaginator(recipes, 100)
+        filtered = EstimatedCountPaginator(
+            recipes.filter(user=self.user),
+            100
+        )
+
+        self.assertEqual(unfiltered.count, 5000000)
+        self.assertEqual(filtered.count, 1)
@@ -2,11 +2,19 @@
 Test custom django management commands
 """
 
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.utils import timezone
+from core.models import AuthToken
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -34,3 +42,24 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 6)
 
         patched_check.assert_called_with(databases=['default'])
+
+
+class PurgeTokensCommandTests(TestCase):
+    # test purge_tokens command
+    def test_purge_tokens(self):
+        # test expired tokens are deleted and valid ones kept
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        AuthToken.objects.create(
+            user=user,
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        valid = AuthToken.objects.issue(user)
+        out = StringIO()
+
+        call_command('purge_tokens', batch_size=1, stdout=out)
+
+        self.assertIn('Deleted 1 expired tokens', out.getvalue())
+        self.assertTrue(AuthToken.objects.filter(key=valid.key).exists())
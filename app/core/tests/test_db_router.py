@@ -0,0 +1,101 @@
+"""
+tests for the read replica router
+"""
+
+from unittest.mock import patch
+from django.core.cache import (
+    cache,
+    caches,
+)
+from django.db.utils import OperationalError
+from django.test import (
+    SimpleTestCase,
+    override_settings,
+)
+from core.db_router import (
+    ReplicaRouter,
+    is_pinned,
+    pin_to_primary,
+    replica_pool,
+    replica_reads,
+)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+@patch('core.db_router.ReplicaPool.lag', return_value=0)
+class ReplicaRouterTests(SimpleTestCase):
+    # test routing reads to replicas
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        replica_pool.reset()
+        cache.clear()
+        caches['shared'].clear()
+
+    def test_reads_default_outside_replica_context(self, patched_lag):
+        # test: reads are not routed unless a view asked for it
+
+        self.assertIsNone(self.router.db_for_read(None))
+        patched_lag.assert_not_called()
+
+    def test_reads_round_robin_over_replicas(self, patched_lag):
+        # test: replica reads rotate over every healthy replica
+
+        with replica_reads():
+            chosen = {self.router.db_for_read(None) for _ in range(4)}
+
+        self.assertEqual(chosen, {'replica_0', 'replica_1'})
+
+    def test_writes_go_to_primary(self, patched_lag):
+        # test: writes always go to default
+
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_lagging_replica_dropped(self, patched_lag):
+        # test: a replica behind by too much is left out
+
+        patched_lag.side_effect = lambda alias: {
+            'replica_0': 0,
+            'replica_1': 100,
+        }[alias]
+
+        with replica_reads():
+            chosen = {self.router.db_for_read(None) for _ in range(4)}
+
+        self.assertEqual(chosen, {'replica_0'})
+
+    def test_unreachable_replicas_fall_back_to_primary(self, patched_lag):
+        # test: with no healthy replica reads go to default
+
+        patched_lag.side_effect = OperationalError
+
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(None))
+
+    def test_health_checked_once_per_interval(self, patched_lag):
+        # test: health checks are cached between requests
+
+        with replica_reads():
+            for _ in range(5):
+                self.router.db_for_read(None)
+
+        self.assertEqual(patched_lag.call_count, 2)
+
+    def test_migrations_only_on_primary(self, patched_lag):
+        # test: replicas get their schema through replication
+
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+
+    def test_pin_to_primary(self, patched_lag):
+        # test: pinned users are remembered
+
+        self.assertFalse(is_pinned(1))
+        pin_to_primary(1)
+
+        self.assertTrue(is_pinned(1))
+        self.assertFalse(is_pinned(2))
+        # other workers don't share the per-process cache
+        cache.clear()
+        self.assertTrue(is_pinned(1))
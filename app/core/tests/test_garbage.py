@@ -0,0 +1,214 @@
+"""
+tests for garbage collection of orphaned rows and files
+"""
+
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from core.garbage import (
+    collect_attrs,
+    collect_images,
+    collect_uploads,
+)
+from core.models import (
+    RECIPE_IMAGE_DIR,
+    Change,
+    ImageBlobManager,
+    ImageUpload,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from core.uploads import start_upload
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('2.50'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class GarbageCollectionTests(TestCase):
+    # test gc of tags, ingredients and image files
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.image_dir = os.path.join(self.media_root.name, RECIPE_IMAGE_DIR)
+        os.makedirs(self.image_dir)
+
+    def write_image(self, name, size=10):
+        path = os.path.join(self.image_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+        return path
+
+    def test_orphaned_tags_deleted(self):
+        # test: only tags no recipe links to are removed
+
+        used = Tag.objects.create(user=self.user, name='Vegan')
+        create_recipe(self.user).tags.add(used)
+        for name in ('a', 'b', 'c'):
+            Tag.objects.create(user=self.user, name=name)
+
+        deleted = collect_attrs(Tag, 'tags', 'tag', batch_size=2)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(list(Tag.all_objects.all()), [used])
+
+    def test_orphan_deletion_recorded(self):
+        # test: syncing clients learn that live orphans were deleted
+
+        live = Tag.objects.create(user=self.user, name='Vegan')
+        flagged = Tag.objects.create(user=self.user, name='Spicy')
+        flagged.soft_delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            collect_attrs(Tag, 'tags', 'tag', batch_size=10)
+
+        self.assertEqual(
+            list(Change.objects.values_list('kind', 'object_id', 'deleted')),
+            [(Change.TAG, live.id, True)]
+        )
+
+    def test_dry_run_keeps_rows(self):
+        # test: a dry run counts orphans without deleting them
+
+        Ingredient.objects.create(user=self.user, name='Kale')
+
+        found = collect_attrs(
+            Ingredient, 'ingredients', 'ingredient',
+            batch_size=10, dry_run=True
+        )
+
+        self.assertEqual(found, 1)
+        self.assertTrue(Ingredient.objects.exists())
+
+    def test_orphaned_images_deleted(self):
+        # test: unreferenced files go, referenced ones stay
+
+        create_recipe(self.user, image=f'{RECIPE_IMAGE_DIR}/kept.jpg')
+        kept = self.write_image('kept.jpg')
+        orphan = self.write_image('orphan.jpg', size=25)
+
+        found, reclaimed = collect_images(min_age=timedelta(0))
+
+        self.assertEqual((found, reclaimed), (1, 25))
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_image_adopted_meanwhile_kept(self):
+        # test: a file claimed after the references were read stays
+
+        path = self.write_image('adopted.jpg')
+        orphan = self.write_image('orphan.jpg')
+
+        def adopt():
+            # an identical upload commits while the directory is listed
+            create_recipe(
+                self.user,
+                image=f'{RECIPE_IMAGE_DIR}/adopted.jpg'
+            )
+            return set()
+
+        with patch('core.garbage._referenced_images', adopt), \
+                patch.object(ImageBlobManager, 'lock_files') as lock_files:
+            found, _ = collect_images(min_age=timedelta(0))
+
+        self.assertEqual(found, 1)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(orphan))
+        lock_files.assert_called_once_with(exclusive=True)
+
+    def test_recent_images_kept(self):
+        # test: files newer than min_age may be uploads in flight
+
+        path = self.write_image('new.jpg')
+
+        found, _ = collect_images(min_age=timedelta(hours=1))
+
+        self.assertEqual(found, 0)
+        self.assertTrue(os.path.exists(path))
+
+    def test_stale_uploads_dropped(self):
+        # test: abandoned uploads and their staged bytes are removed
+
+        recipe = create_recipe(self.user)
+        upload = start_upload(self.user.id, recipe, 'a.jpg', 100, 'ab' * 32)
+        ImageUpload.objects.filter(id=upload.id).update(
+            offset=40,
+            created=timezone.now() - timedelta(days=2),
+        )
+        start_upload(self.user.id, recipe, 'b.jpg', 100, 'cd' * 32)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            found, reclaimed = collect_uploads()
+
+        self.assertEqual((found, reclaimed), (1, 40))
+        self.assertEqual(ImageUpload.objects.count(), 1)
+        self.assertFalse(os.path.exists(upload.staging_path))
+
+    def test_orphaned_staging_files_removed(self):
+        # test: old staging files without an upload are swept up
+
+        recipe = create_recipe(self.user)
+        upload = start_upload(self.user.id, recipe, 'a.jpg', 100, 'ab' * 32)
+        directory = os.path.dirname(upload.staging_path)
+        old = time.time() - timedelta(days=2).total_seconds()
+        paths = {}
+        for name in ('orphan.part', 'chunk.part.1f', 'recent.part'):
+            paths[name] = os.path.join(directory, name)
+            with open(paths[name], 'wb') as f:
+                f.write(b'x' * 10)
+            if name != 'recent.part':
+                os.utime(paths[name], (old, old))
+        os.utime(upload.staging_path, (old, old))
+
+        found, reclaimed = collect_uploads()
+
+        self.assertEqual((found, reclaimed), (2, 20))
+        self.assertTrue(os.path.exists(upload.staging_path))
+        self.assertTrue(os.path.exists(paths['recent.part']))
+        self.assertFalse(os.path.exists(paths['orphan.part']))
+        self.assertFalse(os.path.exists(paths['chunk.part.1f']))
+
+    def test_command_dry_run(self):
+        # test: the command reports without deleting in dry-run mode
+
+        Tag.objects.create(user=self.user, name='Vegan')
+        path = self.write_image('orphan.jpg', size=2048)
+        out = StringIO()
+
+        call_command('gc_recipes', '--dry-run', '--min-age=0', stdout=out)
+
+        self.assertIn('tags: 1 would be deleted', out.getvalue())
+        self.assertIn('images: 1 would be deleted', out.getvalue())
+        self.assertIn('Reclaimed 2.0 KB (dry run)', out.getvalue())
+        self.assertTrue(Tag.objects.exists())
+        self.assertTrue(os.path.exists(path))
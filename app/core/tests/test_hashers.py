@@ -0,0 +1,174 @@
+"""
+tests for password hashers, the hash pool and rehash on login
+"""
+
+import threading
+from unittest.mock import patch
+from django.contrib.auth import (
+    authenticate,
+    get_user_model,
+)
+from django.contrib.auth.hashers import make_password
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.hashers import (
+    HashPool,
+    HashPoolBusy,
+)
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+ME_URL = reverse('user:me')
+
+
+def create_user(email='user@example.com', password='123456'):
+    return get_user_model().objects.create_user(email, password)
+
+
+class PasswordHashingTests(TestCase):
+    # test hashing and transparent rehash on login
+
+    def test_new_passwords_use_argon2(self):
+        # test: the preferred hasher is used for new users
+
+        user = create_user()
+
+        self.assertTrue(user.password.startswith('argon2$'))
+
+    def test_login_migrates_old_hash(self):
+        # test: a pbkdf2 hash is replaced by argon2 on login
+
+        user = create_user()
+        user.password = make_password('123456', hasher='pbkdf2_sha256')
+        user.save()
+
+        authenticated = authenticate(
+            username='user@example.com',
+            password='123456'
+        )
+
+        user.refresh_from_db()
+        self.assertEqual(authenticated, user)
+        self.assertTrue(user.password.startswith('argon2$'))
+
+    def test_login_applies_new_work_factor(self):
+        # test: changed argon2 parameters are applied on login
+
+        user = create_user()
+        params = {'argon2': {'time_cost': 3}}
+
+        with override_settings(PASSWORD_HASHER_PARAMS=params):
+            authenticate(username='user@example.com', password='123456')
+
+        user.refresh_from_db()
+        self.assertIn('t=3', user.password)
+
+    def test_wrong_password_not_rehashed(self):
+        # test: a failed login leaves the stored hash alone
+
+        user = create_user()
+        user.password = make_password('123456', hasher='pbkdf2_sha256')
+        user.save()
+        original = user.password
+
+        authenticated = authenticate(
+            username='user@example.com',
+            password='wrong'
+        )
+
+        user.refresh_from_db()
+        self.assertIsNone(authenticated)
+        self.assertEqual(user.password, original)
+
+    def test_unknown_user(self):
+        # test: unknown users can't authenticate
+
+        self.assertIsNone(
+            authenticate(username='nobody@example.com', password='123456')
+        )
+
+    @patch('core.backends.run_hashing', side_effect=HashPoolBusy)
+    def test_token_busy_pool(self, patched_run):
+        # test: a saturated hash pool asks the client to retry
+
+        create_user()
+        payload = {'email': 'user@example.com', 'password': '123456'}
+
+        res = APIClient().post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    @patch('core.models.run_hashing', side_effect=HashPoolBusy)
+    def test_signup_busy_pool(self, patched_run):
+        # test: signing up on a saturated pool is throttled, not an error
+
+        payload = {
+            'email': 'user@example.com',
+            'password': '123456',
+            'name': 'Test Name',
+        }
+
+        res = APIClient().post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_password_change_busy_pool(self):
+        # test: a throttled password change leaves the user as it was
+
+        user = create_user()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with patch('user.serializers.run_hashing',
+                   side_effect=HashPoolBusy):
+            res = client.patch(ME_URL, {'name': 'New', 'password': 'newpw1'})
+
+        user.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(user.name, '')
+        self.assertTrue(user.check_password('123456'))
+
+
+class HashPoolTests(SimpleTestCase):
+    # test the bounded hash pool
+
+    def test_run_returns_result(self):
+        # test: work runs on the pool and returns its result
+
+        pool = HashPool(workers=2, queue_size=0, timeout=1)
+
+        self.assertEqual(pool.run(lambda x: x * 2, 21), 42)
+        self.assertNotEqual(
+            pool.run(lambda: threading.current_thread().name),
+            threading.current_thread().name
+        )
+
+    def test_full_pool_raises(self):
+        # test: callers past the bound get HashPoolBusy
+
+        pool = HashPool(workers=1, queue_size=0, timeout=0.01)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=pool.run, args=(block,))
+        worker.start()
+        started.wait()
+
+        with self.assertRaises(HashPoolBusy):
+            pool.run(lambda: None)
+
+        release.set()
+        worker.join()
+        self.assertIsNone(pool.run(lambda: None))
@@ -0,0 +1,238 @@
+"""
+tests for the cache invalidation bus
+"""
+
+import json
+from collections import namedtuple
+from unittest.mock import (
+    Mock,
+    patch,
+)
+import psycopg2
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from core import signed_tokens
+from core.invalidation import (
+    MAX_PAYLOAD,
+    InvalidationBus,
+    bus,
+    decode_batches,
+    encode_batches,
+)
+from core.models import (
+    AuthToken,
+    token_cache_key,
+)
+
+Notify = namedtuple('Notify', ['channel', 'payload'])
+
+
+class FakeConnection:
+    # psycopg2 connection that has a batch of notifies on the first poll
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.notifies = []
+
+    def poll(self):
+        self.notifies.extend(
+            Notify('cache_invalidation', payload)
+            for payload in self.payloads
+        )
+        self.payloads = []
+
+
+class EncodingTests(SimpleTestCase):
+    # test NOTIFY payload batching
+
+    def test_batches_stay_below_limit(self):
+        # test: many keys are split into payloads postgres accepts
+
+        keys = {f'key-{n:05}' for n in range(3000)}
+
+        payloads = encode_batches('origin', {'recipes': keys, 'tags': {'1'}})
+
+        self.assertGreater(len(payloads), 1)
+        for payload in payloads:
+            self.assertLess(len(payload), MAX_PAYLOAD)
+        events = decode_batches(payloads)
+        self.assertEqual(events['recipes'], keys)
+        self.assertEqual(events['tags'], {'1'})
+
+    def test_decode_skips_own_and_malformed(self):
+        # test: a process ignores its own events and broken payloads
+
+        own = encode_batches('me', {'recipes': {'1'}})
+        other = encode_batches('other', {'recipes': {'2'}})
+
+        with self.assertLogs('core.invalidation', 'WARNING'):
+            events = decode_batches(
+                own + other + ['not json', json.dumps({'e': {}})],
+                skip_origin='me',
+            )
+
+        self.assertEqual(dict(events), {'recipes': {'2'}})
+
+
+class PublishTests(TestCase):
+    # test delivery to subscribers of this process
+
+    def setUp(self):
+        self.bus = InvalidationBus()
+        self.handler = Mock()
+        self.bus.subscribe('recipes', self.handler)
+
+    def test_published_on_commit(self):
+        # test: subscribers run once the transaction commits
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.bus.publish('recipes', 1)
+            self.handler.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        self.handler.assert_called_once_with({'1'})
+
+    def test_rolled_back_not_published(self):
+        # test: writes that are rolled back invalidate nothing
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.bus.publish('recipes', 1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.handler.assert_not_called()
+
+    def test_failing_handler_isolated(self):
+        # test: one broken subscriber doesn't stop the others
+
+        self.bus.subscribe('recipes', Mock(side_effect=ValueError))
+        other = Mock()
+        self.bus.subscribe('recipes', other)
+
+        with self.assertLogs('core.invalidation', 'ERROR'):
+            self.bus.apply({'recipes': {'1'}})
+
+        other.assert_called_once_with({'1'})
+
+
+class ListenerTests(SimpleTestCase):
+    # test the listener thread's loop without a database
+
+    def setUp(self):
+        self.bus = InvalidationBus()
+
+    def test_notifies_dispatched_per_topic(self):
+        # test: a batch of notifies is merged into one call per topic
+
+        handler = Mock(side_effect=lambda keys: self.bus.stop())
+        self.bus.subscribe('recipes', handler)
+        conn = FakeConnection(
+            encode_batches('other', {'recipes': {'1', '2'}}) +
+            encode_batches('other', {'recipes': {'2', '3'}}) +
+            encode_batches(self.bus.origin, {'recipes': {'4'}})
+        )
+
+        with patch('core.invalidation.select.select',
+                   return_value=([conn], [], [])):
+            self.bus._listen(conn)
+
+        handler.assert_called_once_with({'1', '2', '3'})
+
+    def test_reset_on_every_connect(self):
+        # test: reset handlers catch up at startup and after a reconnect
+
+        reset = Mock()
+        self.bus.on_reset(reset)
+        connections = iter([Mock(), Mock()])
+
+        def listen(conn):
+            if reset.call_count > 1:
+                self.bus.stop()
+            else:
+                raise psycopg2.OperationalError
+
+        with patch.object(self.bus, '_connect',
+                          side_effect=lambda: next(connections)), \
+                patch.object(self.bus, '_listen', side_effect=listen), \
+                self.assertLogs('core.invalidation', 'WARNING'):
+            self.bus._listen_loop()
+
+        self.assertEqual(reset.call_count, 2)
+
+
+class TokenInvalidationTests(TestCase):
+    # test the caches that follow invalidation events
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+
+    def tearDown(self):
+        signed_tokens.clear_revocations()
+
+    def test_revoked_token_forgotten(self):
+        # test: token revocations from other processes clear the cache
+
+        token = AuthToken.objects.issue(self.user)
+        cache.set(token_cache_key(token.key), 'cached')
+
+        bus.apply({'auth-token': {token.key}})
+
+        self.assertIsNone(cache.get(token_cache_key(token.key)))
+
+    def test_reset_forgets_only_tokens(self):
+        # test: after missed events cached tokens go, other entries stay
+
+        token = AuthToken.objects.issue(self.user)
+        cache.set(token_cache_key(token.key), 'cached')
+        cache.set('unrelated', 'kept')
+
+        bus.reset()
+
+        self.assertIsNone(cache.get(token_cache_key(token.key)))
+        self.assertEqual(cache.get('unrelated'), 'kept')
+
+    def test_revoke_publishes(self):
+        # test: revoking access tokens is announced to other processes
+
+        with patch('core.invalidation.publish') as patched_publish:
+            signed_tokens.revoke_access_tokens(self.user.pk)
+
+        patched_publish.assert_any_call(
+            'access-revoked',
+            f'{self.user.pk}:1',
+        )
+
+    def test_access_revocation_applied(self):
+        # test: access token revocations of other processes apply here
+
+        token = signed_tokens.encode_access_token(self.user.pk, 0)
+
+        bus.apply({'access-revoked': {f'{self.user.pk}:1'}})
+
+        with self.assertRaises(signed_tokens.InvalidAccessToken):
+            signed_tokens.decode_access_token(token)
+
+    def test_reload_revocations(self):
+        # test: after missed events revocations are read back from the db
+
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            token_version=2
+        )
+        token = signed_tokens.encode_access_token(self.user.pk, 1)
+
+        bus.reset()
+
+        with self.assertRaises(signed_tokens.InvalidAccessToken):
+            signed_tokens.decode_access_token(token)
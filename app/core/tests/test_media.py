@@ -0,0 +1,168 @@
+"""
+tests for authenticated media serving
+"""
+
+import tempfile
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.media import parse_range
+from core.models import Recipe
+
+IMAGE = bytes(range(256)) * 4
+
+
+def media_url(name):
+    return reverse('media', args=[name])
+
+
+class MediaViewTests(TestCase):
+    # test serving recipe images
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(IMAGE))
+        self.url = media_url(self.recipe.image.name)
+
+    def test_image_url_points_at_view(self):
+        # test: storage urls resolve to the media view
+
+        self.assertEqual(self.recipe.image.url, self.url)
+
+    def test_owner_gets_file(self):
+        # test: the owner receives the file with long-lived caching
+
+        res = self.client.get(self.url, HTTP_ACCEPT='image/jpeg')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), IMAGE)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+    def test_other_user_refused(self):
+        # test: images of other users' recipes are not found
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_anonymous_refused(self):
+        # test: authentication is required
+
+        res = APIClient().get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_not_modified(self):
+        # test: a matching ETag is answered with 304
+
+        etag = self.client.get(self.url)['ETag']
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        weak = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(weak.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_request(self):
+        # test: a byte range is answered with 206 and only those bytes
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), IMAGE[10:20])
+        self.assertEqual(res['Content-Range'], f'bytes 10-19/{len(IMAGE)}')
+
+    def test_unsatisfiable_range(self):
+        # test: ranges past the end are refused with 416
+
+        res = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(res['Content-Range'], f'bytes */{len(IMAGE)}')
+
+    @override_settings(
+        MEDIA_DELIVERY='x-accel-redirect',
+        MEDIA_ACCEL_PREFIX='/protected-media/',
+    )
+    def test_x_accel_redirect(self):
+        # test: nginx is told which internal location to send
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected-media/{self.recipe.image.name}'
+        )
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_DELIVERY='x-sendfile')
+    def test_x_sendfile(self):
+        # test: apache/lighttpd get the file path
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res['X-Sendfile'], self.recipe.image.path)
+
+
+class ParseRangeTests(SimpleTestCase):
+    # test Range header parsing
+
+    def test_ranges(self):
+        # test: explicit, open ended and suffix ranges
+
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+
+    def test_ignored_ranges(self):
+        # test: malformed and multiple ranges fall back to the whole file
+
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+
+    def test_unsatisfiable(self):
+        # test: ranges outside the file raise ValueError
+
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=9-5', 100)
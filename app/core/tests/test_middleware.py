@@ -0,0 +1,171 @@
+"""
+tests for custom middleware
+"""
+
+import gzip
+import zlib
+from unittest.mock import patch
+from django.core.cache import caches
+from django.http import (
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from core.compression import (
+    GzipCodec,
+    negotiate,
+)
+from core.middleware import CompressionMiddleware
+
+BODY = b'{"title": "Sample recipe"}' * 200
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    # test compression middleware
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        caches['shared'].clear()
+
+    def get(self, response, accept='gzip'):
+        # run a request with the given Accept-Encoding through middleware
+
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept)
+        middleware = CompressionMiddleware(lambda req: response)
+        return middleware(request)
+
+    def test_gzip_response(self):
+        # test: gzip is applied when it is the only accepted encoding
+
+        res = self.get(HttpResponse(BODY))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), BODY)
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_small_response_not_compressed(self):
+        # test: responses below the threshold are left alone
+
+        res = self.get(HttpResponse(b'tiny'))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, b'tiny')
+
+    def test_no_accepted_encoding(self):
+        # test: nothing is compressed for identity-only clients
+
+        res = self.get(HttpResponse(BODY), accept='identity')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, BODY)
+
+    def test_images_not_compressed(self):
+        # test: already compressed media and partial content pass through
+
+        image = self.get(HttpResponse(BODY, content_type='image/jpeg'))
+        partial = self.get(HttpResponse(BODY, status=206))
+
+        self.assertFalse(image.has_header('Content-Encoding'))
+        self.assertFalse(partial.has_header('Content-Encoding'))
+
+    def test_streaming_response(self):
+        # test: streaming bodies are compressed chunk by chunk
+
+        response = StreamingHttpResponse(iter([BODY, BODY]))
+        res = self.get(response)
+        content = b''.join(res.streaming_content)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertEqual(zlib.decompress(content, 31), BODY * 2)
+
+    def test_cacheable_variant_reused(self):
+        # test: a cacheable response is only compressed once
+
+        response = HttpResponse(BODY)
+        response['ETag'] = '"v1"'
+        self.get(response)
+
+        with patch.object(GzipCodec, 'compress') as compress:
+            again = HttpResponse(BODY)
+            again['ETag'] = '"v1"'
+            res = self.get(again)
+
+        compress.assert_not_called()
+        self.assertEqual(gzip.decompress(res.content), BODY)
+        self.assertEqual(res['ETag'], 'W/"v1"')
+
+    def test_shared_etag_different_bodies(self):
+        # test: responses sharing an ETag keep their own bodies
+
+        response = HttpResponse(BODY)
+        response['ETag'] = '"v1"'
+        self.get(response)
+
+        other = HttpResponse(BODY[::-1])
+        other['ETag'] = '"v1"'
+        res = self.get(other)
+
+        self.assertEqual(gzip.decompress(res.content), BODY[::-1])
+
+    def test_private_response_not_cached(self):
+        # test: private responses are compressed on every request
+
+        response = HttpResponse(BODY)
+        response['ETag'] = '"v1"'
+        response['Cache-Control'] = 'private'
+        self.get(response)
+
+        other = HttpResponse(BODY[::-1])
+        other['ETag'] = '"v1"'
+        other['Cache-Control'] = 'private'
+        res = self.get(other)
+
+        self.assertEqual(gzip.decompress(res.content), BODY[::-1])
+
+    def test_negotiate_preference_and_q_values(self):
+        # test: server preference wins unless the client refuses it
+
+        preference = ['br', 'zstd', 'gzip']
+
+        self.assertEqual(negotiate('gzip, br', preference), 'br')
+        self.assertEqual(negotiate('gzip, br;q=0', preference), 'gzip')
+        self.assertEqual(negotiate('*', preference), 'br')
+        self.assertIsNone(negotiate('identity', preference))
+
+
+class ApiFastPathMiddlewareTests(TestCase):
+    # test the split middleware stack
+
+    def test_api_skips_site_middleware(self):
+        # test: api routes run without session and auth middleware
+
+        res = self.client.get('/api/recipe/recipes/')
+
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertFalse(res.has_header('X-Frame-Options'))
+
+    def test_api_keeps_api_middleware(self):
+        # test: API_MIDDLEWARE still applies, e.g. APPEND_SLASH
+
+        res = self.client.get('/api/recipe/recipes')
+
+        self.assertEqual(res.status_code, 301)
+        self.assertEqual(res['Location'], '/api/recipe/recipes/')
+
+    def test_admin_keeps_full_stack(self):
+        # test: other routes go through all of MIDDLEWARE
+
+        res = self.client.get('/admin/login/')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertEqual(res['X-Frame-Options'], 'DENY')
@@ -3,11 +3,14 @@ tests for models
 """
 
 from unittest.mock import patch
+from datetime import timedelta
 from decimal import Decimal
 from django.test import TestCase
 # use this to get the reference to custom models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from core import models
+from core.authentication import TokenPrincipal
 
 
 def create_user(email='user@example.com', password='123456'):
@@ -108,3 +111,45 @@ class ModelTests(TestCase):
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+    def test_issue_token(self):
+        # test: issued tokens expire after TOKEN_TTL
+
+        user = create_user()
+        token = models.AuthToken.objects.issue(user)
+
+        self.assertEqual(len(token.key), 40)
+        self.assertFalse(token.is_expired)
+
+    def test_purge_expired_tokens(self):
+        # test: only expired tokens are purged, across batches
+
+        user = create_user()
+        past = timezone.now() - timedelta(days=1)
+        for _ in range(5):
+            models.AuthToken.objects.create(user=user, expires_at=past)
+        valid = models.AuthToken.objects.issue(user)
+
+        deleted = models.AuthToken.objects.purge_expired(batch_size=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(
+            list(models.AuthToken.objects.values_list('key', flat=True)),
+            [valid.key]
+        )
+
+    def test_token_principal_loads_user_lazily(self):
+        # test: the principal only queries the user when needed
+
+        user = create_user()
+        principal = TokenPrincipal(user.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(principal.id, user.id)
+            self.assertTrue(principal.is_active)
+            self.assertTrue(principal.is_authenticated)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(principal.email, user.email)
+            self.assertFalse(principal.is_staff)
+        self.assertEqual(principal.get_full_user(), user)
@@ -0,0 +1,161 @@
+"""
+tests for the object storage backend, against the local stand-in
+"""
+
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+from urllib.parse import (
+    parse_qs,
+    urlsplit,
+)
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe
+from core.object_storage import (
+    LocalObjectClient,
+    ObjectStorage,
+)
+
+
+def local_storage(root, part_size=1024):
+    return ObjectStorage({
+        'CLIENT': 'local',
+        'BUCKET': 'media',
+        'LOCAL_ROOT': root,
+        'SECRET_KEY': 'secret',
+        'PART_SIZE': part_size,
+        'PRESIGN_SECONDS': 300,
+    })
+
+
+class ObjectStorageTests(SimpleTestCase):
+    # test the storage api on top of an object client
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.storage = local_storage(self.root.name)
+
+    def test_small_file_single_put(self):
+        # test: files below one part are sent with a single put
+
+        with patch.object(
+            LocalObjectClient,
+            'start_multipart',
+            wraps=self.storage.client.start_multipart,
+        ) as patched_start:
+            name = self.storage.save('uploads/a.jpg', ContentFile(b'image'))
+
+        patched_start.assert_not_called()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 5)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'image')
+
+    def test_large_file_multipart(self):
+        # test: larger files are streamed as a multipart upload
+
+        data = bytes(range(256)) * 20
+        client = self.storage.client
+
+        with patch.object(
+            LocalObjectClient,
+            'upload_part',
+            wraps=client.upload_part,
+        ) as patched_part:
+            name = self.storage.save('uploads/b.jpg', ContentFile(data))
+
+        self.assertGreater(patched_part.call_count, 1)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), data)
+
+    def test_delete_and_listdir(self):
+        # test: objects can be listed and deleted
+
+        self.storage.save('uploads/recipe/a.jpg', ContentFile(b'a'))
+        self.storage.save('uploads/recipe/b.jpg', ContentFile(b'b'))
+
+        self.storage.delete('uploads/recipe/a.jpg')
+
+        self.assertEqual(
+            self.storage.listdir('uploads'),
+            (['recipe'], [])
+        )
+        self.assertEqual(
+            self.storage.listdir('uploads/recipe'),
+            ([], ['b.jpg'])
+        )
+
+    def test_presigned_url(self):
+        # test: presigned urls name the object and expire
+
+        url = self.storage.presigned_url('uploads/a.jpg', expires_in=60)
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        client = self.storage.client
+
+        self.assertEqual(parts.path, '/media/uploads/a.jpg')
+        self.assertTrue(client.verify_presigned(
+            'uploads/a.jpg',
+            query['Expires'][0],
+            query['Signature'][0],
+        ))
+        self.assertFalse(client.verify_presigned(
+            'uploads/other.jpg',
+            query['Expires'][0],
+            query['Signature'][0],
+        ))
+        self.assertFalse(client.verify_presigned(
+            'uploads/a.jpg',
+            query['Expires'][0],
+            query['Signature'][0],
+            now=int(query['Expires'][0]) + 1,
+        ))
+
+
+class ObjectMediaTests(TestCase):
+    # test serving images kept in object storage
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        storage_patch = patch.object(
+            Recipe._meta.get_field('image'),
+            'storage',
+            local_storage(self.root.name),
+        )
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        self.recipe.image.save('photo.jpg', ContentFile(b'image'))
+
+    def test_media_redirects_to_presigned_url(self):
+        # test: the owner is sent straight to the object store
+
+        url = reverse('media', args=[self.recipe.image.name])
+
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_302_FOUND)
+        self.assertIn('Signature=', res['Location'])
+        self.assertIn(self.recipe.image.name, res['Location'])
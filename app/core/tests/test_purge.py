@@ -0,0 +1,173 @@
+"""
+tests for soft-delete and the purge job
+"""
+
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from core.signed_tokens import clear_revocations
+from core.purge import (
+    purge_deleted,
+    schedule_purge,
+)
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, '123456')
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('2.50'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class SoftDeleteTests(TestCase):
+    # test soft-delete flags
+
+    def setUp(self):
+        self.user = create_user()
+
+    def tearDown(self):
+        clear_revocations()
+
+    def test_soft_deleted_recipe_hidden(self):
+        # test: soft-deleted recipes disappear from the default manager
+
+        recipe = create_recipe(self.user)
+        recipe.soft_delete()
+
+        self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        self.assertTrue(Recipe.all_objects.filter(id=recipe.id).exists())
+
+    def test_soft_deleted_tag_hidden_from_recipe(self):
+        # test: related managers skip soft-deleted rows
+
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        tag.soft_delete()
+
+        self.assertEqual(recipe.tags.count(), 0)
+
+    def test_user_soft_delete(self):
+        # test: deleting a user flags everything they own
+
+        create_recipe(self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Kale')
+
+        self.user.soft_delete()
+
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        for model in (Recipe, Tag, Ingredient):
+            self.assertFalse(model.objects.exists())
+            self.assertTrue(model.all_objects.exists())
+
+
+class PurgeTests(TestCase):
+    # test the batched purge
+
+    def setUp(self):
+        self.user = create_user()
+
+    def tearDown(self):
+        clear_revocations()
+
+    def test_purge_deletes_only_flagged_rows(self):
+        # test: flagged rows and their links go, live ones stay
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        live = create_recipe(self.user)
+        live.tags.add(tag)
+        for _ in range(5):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(tag)
+            recipe.soft_delete()
+
+        deleted = purge_deleted(batch_size=2)
+
+        self.assertEqual(deleted['recipes'], 5)
+        self.assertEqual(list(Recipe.all_objects.all()), [live])
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+
+    def test_purge_removes_tag_links(self):
+        # test: purging a tag unlinks it from live recipes
+
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        tag.soft_delete()
+
+        purge_deleted()
+
+        self.assertFalse(Tag.all_objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_purge_deleted_user(self):
+        # test: a deleted user goes once their data is gone
+
+        create_recipe(self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+        other = create_user('other@example.com')
+        self.user.soft_delete()
+
+        deleted = purge_deleted()
+
+        self.assertEqual(deleted['users'], 1)
+        self.assertEqual(list(get_user_model().objects.all()), [other])
+
+    def test_purge_removes_image_file(self):
+        # test: images of purged recipes are removed from MEDIA_ROOT
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            recipe = create_recipe(self.user)
+            recipe.image.save('sample.jpg', ContentFile(b'image'))
+            path = recipe.image.path
+            recipe.soft_delete()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                purge_deleted()
+
+            self.assertFalse(os.path.exists(path))
+
+    def test_purge_command(self):
+        # test: the command reports what it deleted
+
+        create_recipe(self.user).soft_delete()
+        out = StringIO()
+
+        call_command('purge_deleted', stdout=out)
+
+        self.assertIn('recipes: 1 deleted', out.getvalue())
+
+    @override_settings(PURGE_IN_BACKGROUND=True)
+    @patch('core.purge.purge_worker.schedule')
+    def test_schedule_purge_on_commit(self, patched_schedule):
+        # test: the background purge is woken after commit
+
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_purge()
+
+        patched_schedule.assert_called_once()
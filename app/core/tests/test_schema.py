@@ -0,0 +1,114 @@
+"""
+tests for the precomputed OpenAPI schema
+"""
+
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import (
+    SimpleTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaTests(SimpleTestCase):
+    # test building and serving the stored schema
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            SCHEMA_DIR=self.tmp_dir.name
+        )
+        self.settings_override.enable()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def build(self):
+        call_command('build_schema', stdout=StringIO())
+
+    def test_build_schema_writes_files(self):
+        # test: the command writes yaml and json schemas
+
+        self.build()
+
+        for name in ['schema.yaml', 'schema.json']:
+            path = os.path.join(self.tmp_dir.name, name)
+            self.assertTrue(os.path.exists(path))
+
+    def test_serves_stored_schema(self):
+        # test: the stored schema is served without regenerating it
+
+        self.build()
+
+        with patch('core.schema.SpectacularAPIView._get_schema_response') \
+                as patched_live:
+            res = self.client.get(SCHEMA_URL)
+
+        patched_live.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'openapi', res.content)
+        self.assertTrue(res.has_header('ETag'))
+
+    def test_serves_json_format(self):
+        # test: json is served from its own stored file
+
+        self.build()
+
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('openapi', res.json())
+
+    def test_etag_not_modified(self):
+        # test: a matching If-None-Match returns 304
+
+        self.build()
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_weak_etag_and_lists_match(self):
+        # test: the W/ etag of a compressed response, lists and *
+        # are all matched
+
+        self.build()
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        for header in (f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header):
+                res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(
+                    res.status_code,
+                    status.HTTP_304_NOT_MODIFIED
+                )
+
+    def test_missing_schema(self):
+        # test: without a stored schema the view is unavailable
+
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    @override_settings(DEBUG=True)
+    def test_debug_generates_live(self):
+        # test: DEBUG falls back to live generation
+
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.has_header('ETag'))
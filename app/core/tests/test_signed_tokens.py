@@ -0,0 +1,92 @@
+"""
+tests for signed access tokens
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from core import signed_tokens
+from core.signed_tokens import (
+    InvalidAccessToken,
+    clear_revocations,
+    decode_access_token,
+    encode_access_token,
+    revoke_access_tokens,
+)
+
+
+class SignedTokenTests(SimpleTestCase):
+    # test encoding and verifying access tokens
+
+    def tearDown(self):
+        clear_revocations()
+
+    def test_round_trip(self):
+        # test: a fresh token decodes to its claims
+
+        token = encode_access_token(7, 3, is_staff=True)
+        claims = decode_access_token(token)
+
+        self.assertEqual(claims['uid'], 7)
+        self.assertEqual(claims['ver'], 3)
+        self.assertTrue(claims['stf'])
+
+    def test_tampered_payload_rejected(self):
+        # test: changing the payload breaks the signature
+
+        header, payload, signature = encode_access_token(7, 0).split('.')
+        other_payload = encode_access_token(8, 0).split('.')[1]
+
+        with self.assertRaises(InvalidAccessToken):
+            decode_access_token(f'{header}.{other_payload}.{signature}')
+
+    def test_expired_token_rejected(self):
+        # test: tokens stop working after ACCESS_TOKEN_TTL
+
+        token = encode_access_token(7, 0, now=1000)
+
+        with self.assertRaises(InvalidAccessToken):
+            decode_access_token(token, now=1000 + 60 * 60)
+
+    def test_malformed_token_rejected(self):
+        # test: garbage never gets past decoding
+
+        for token in ['', 'abc', 'a.b.c', 'a.b.c.d']:
+            with self.assertRaises(InvalidAccessToken):
+                decode_access_token(token)
+
+    def test_old_versions_rejected_after_revocation(self):
+        # test: a revoked version is refused, newer ones are accepted
+
+        old = encode_access_token(7, 0)
+        signed_tokens.mark_revoked(7, 1)
+
+        with self.assertRaises(InvalidAccessToken):
+            decode_access_token(old)
+        decode_access_token(encode_access_token(7, 1))
+        decode_access_token(encode_access_token(8, 0))
+
+
+class RevokeAccessTokensTests(TestCase):
+    # test revoking access tokens of a user
+
+    def tearDown(self):
+        clear_revocations()
+
+    def test_revoke_bumps_version(self):
+        # test: revoking bumps the stored version and rejects old tokens
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        token = encode_access_token(user.id, user.token_version)
+
+        revoke_access_tokens(user.id)
+
+        user.refresh_from_db()
+        self.assertEqual(user.token_version, 1)
+        with self.assertRaises(InvalidAccessToken):
+            decode_access_token(token)
@@ -0,0 +1,238 @@
+"""
+tests for the change event stream
+"""
+
+import asyncio
+from unittest.mock import patch
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from core.events import (
+    ChangeEvent,
+    broker,
+)
+from core.models import (
+    AuthToken,
+    Change,
+)
+from core.signed_tokens import encode_access_token
+from core.sse import (
+    EventStream,
+    EventStreamRouter,
+    database,
+)
+
+
+def stream_scope(user_id=None, headers=(), method='GET', path='/'):
+    headers = list(headers)
+    if user_id is not None:
+        token = encode_access_token(user_id, 0)
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': headers,
+    }
+
+
+async def open_stream(scope):
+    communicator = ApplicationCommunicator(EventStream(), scope)
+    await communicator.send_input({'type': 'http.request', 'body': b''})
+    start = await communicator.receive_output()
+
+    return communicator, start
+
+
+async def close_stream(communicator):
+    await communicator.send_input({'type': 'http.disconnect'})
+    await communicator.wait()
+
+
+async def next_body(communicator):
+    return (await communicator.receive_output())['body']
+
+
+class EventStreamTests(SimpleTestCase):
+    # test streaming without the database
+
+    async def test_requires_authentication(self):
+        # test: anonymous streams are refused
+
+        communicator, start = await open_stream(stream_scope())
+
+        self.assertEqual(start['status'], 401)
+        await communicator.wait()
+
+    async def test_streams_published_events(self):
+        # test: events of the user are sent, other users' are not
+
+        communicator, start = await open_stream(stream_scope(1))
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'),
+            start['headers']
+        )
+        self.assertIn(b'retry:', await next_body(communicator))
+
+        broker.publish(2, [ChangeEvent(1, 'tag', 3, False)])
+        broker.publish(1, [ChangeEvent(7, 'recipe', 5, True)])
+        body = await next_body(communicator)
+
+        self.assertEqual(
+            body,
+            b'id: 7\nevent: change\n'
+            b'data: {"seq":7,"kind":"recipe","id":5,"deleted":true}\n\n'
+        )
+        await close_stream(communicator)
+        self.assertEqual(len(broker), 0)
+
+    async def test_resync_after_overflow(self):
+        # test: a stream that fell behind without a token asks to sync
+
+        with self.settings(SSE_QUEUE_SIZE=1):
+            communicator, _ = await open_stream(stream_scope(1))
+            await next_body(communicator)
+            broker.publish(1, [
+                ChangeEvent(seq, 'recipe', 1, False) for seq in (1, 2, 3)
+            ])
+            body = await next_body(communicator)
+
+        self.assertIn(b'event: resync', body)
+        await close_stream(communicator)
+
+    async def test_router(self):
+        # test: only SSE_PATH goes to the stream
+
+        async def django_app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 204})
+
+        router = EventStreamRouter(django_app)
+        communicator = ApplicationCommunicator(
+            router,
+            stream_scope(path='/api/recipe/recipes/'),
+        )
+        await communicator.send_input({'type': 'http.request'})
+
+        self.assertEqual((await communicator.receive_output())['status'], 204)
+
+
+# the test database connection must stay open, as with the test client
+@patch('core.sse.close_old_connections')
+class EventStreamReplayTests(TestCase):
+    # test catching up from the change log
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        Change.objects.record(self.user.id, Change.RECIPE, [10, 11, 12])
+
+    async def test_replay_from_last_event_id(self, patched_close):
+        # test: a reconnecting client gets the changes it missed
+
+        communicator, _ = await open_stream(stream_scope(
+            self.user.id,
+            [(b'last-event-id', b'1')],
+        ))
+        body = await next_body(communicator)
+
+        self.assertNotIn(b'id: 1\n', body)
+        self.assertIn(b'id: 2\n', body)
+        self.assertIn(b'id: 3\n', body)
+        await close_stream(communicator)
+
+    async def test_gap_replayed(self, patched_close):
+        # test: an event after a gap fetches the missing ones
+
+        communicator, _ = await open_stream(stream_scope(self.user.id))
+        await next_body(communicator)
+        broker.publish(self.user.id, [ChangeEvent(1, 'recipe', 10, False)])
+        await next_body(communicator)
+
+        broker.publish(self.user.id, [ChangeEvent(3, 'recipe', 12, False)])
+        body = await next_body(communicator)
+
+        self.assertIn(b'id: 2\n', body)
+        self.assertIn(b'id: 3\n', body)
+        await close_stream(communicator)
+
+    async def test_revoked_token_ends_stream(self, patched_close):
+        # test: an api token revoked mid-stream ends it at a keepalive
+
+        token = await database(AuthToken.objects.issue, self.user)
+        with self.settings(SSE_KEEPALIVE=0.01):
+            communicator, start = await open_stream(stream_scope(headers=[
+                (b'authorization', f'Token {token.key}'.encode()),
+            ]))
+            await next_body(communicator)
+            self.assertEqual(
+                await next_body(communicator),
+                b': keepalive\n\n'
+            )
+
+            await database(AuthToken.objects.revoke_for_user, self.user.id)
+            # the revocation may land after the next keepalive started
+            for _ in range(3):
+                body = await next_body(communicator)
+                if body != b': keepalive\n\n':
+                    break
+
+        self.assertEqual(start['status'], 200)
+        self.assertIn(b'event: expired', body)
+        await communicator.wait()
+
+    async def test_busy_stream_rechecked(self, patched_close):
+        # test: a stream kept busy by events still notices a revocation
+
+        token = await database(AuthToken.objects.issue, self.user)
+        with self.settings(SSE_KEEPALIVE=0.05):
+            communicator, _ = await open_stream(stream_scope(headers=[
+                (b'authorization', f'Token {token.key}'.encode()),
+            ]))
+            await next_body(communicator)
+            await database(AuthToken.objects.revoke_for_user, self.user.id)
+
+            for seq in range(1, 100):
+                broker.publish(self.user.id, [
+                    ChangeEvent(seq, 'recipe', 10, False),
+                ])
+                body = await next_body(communicator)
+                if b'event: expired' in body:
+                    break
+                await asyncio.sleep(0.01)
+
+        self.assertIn(b'event: expired', body)
+        self.assertLess(seq, 99)
+        await communicator.wait()
+
+
+class ChangePublishingTests(TestCase):
+    # test that recorded changes reach the broker
+
+    def test_record_publishes_on_commit(self):
+        # test: committed changes are handed to open streams
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = broker.subscribe(user.id, 10, loop)
+        self.addCleanup(broker.unsubscribe, subscription)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Change.objects.record(user.id, Change.RECIPE, [4])
+        loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(
+            subscription.drain(),
+            [ChangeEvent(1, 'recipe', 4, False)]
+        )
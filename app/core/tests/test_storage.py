@@ -0,0 +1,178 @@
+"""
+tests for content-addressed image storage
+"""
+
+import hashlib
+import os
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from core.models import (
+    ImageBlob,
+    ImageBlobManager,
+    Recipe,
+)
+from core.purge import purge_deleted
+from core.storage import ContentAddressedStorage
+
+
+def create_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('2.50'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    # test naming files by their content
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.storage = ContentAddressedStorage(location=self.media_root.name)
+
+    def test_name_is_content_hash(self):
+        # test: files are stored under the sha256 of their content
+
+        content = b'x' * (ContentFile.DEFAULT_CHUNK_SIZE * 2 + 7)
+
+        name = self.storage.save('uploads/a.JPG', ContentFile(content))
+
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(name, f'uploads/{digest}.jpg')
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_identical_uploads_share_file(self):
+        # test: uploading the same bytes twice stores one file
+
+        first = self.storage.save('uploads/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('uploads/b.jpg', ContentFile(b'image'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            os.listdir(os.path.join(self.media_root.name, 'uploads')),
+            [os.path.basename(first)]
+        )
+
+
+class ImageRefcountTests(TestCase):
+    # test reference counting of shared images
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, recipe, content=b'image'):
+        recipe.image.save('photo.jpg', ContentFile(content))
+
+        return recipe.image.path
+
+    def test_shared_image_counted(self):
+        # test: each recipe using a file holds one reference
+
+        first = create_recipe(self.user)
+        second = create_recipe(self.user)
+        self.upload(first)
+        self.upload(second)
+
+        blob = ImageBlob.objects.get(name=first.image.name)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+    def test_purge_keeps_shared_file(self):
+        # test: the file is only deleted with its last recipe
+
+        first = create_recipe(self.user)
+        second = create_recipe(self.user)
+        path = self.upload(first)
+        self.upload(second)
+
+        first.soft_delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            purge_deleted()
+        self.assertTrue(os.path.exists(path))
+
+        second.soft_delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            purge_deleted()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_replaced_image_released(self):
+        # test: replacing an image drops the old file
+
+        recipe = create_recipe(self.user)
+        old_path = self.upload(recipe, b'old')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_path = self.upload(recipe, b'new')
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+        self.assertEqual(
+            list(ImageBlob.objects.values_list('name', flat=True)),
+            [recipe.image.name]
+        )
+
+    def test_reloaded_recipe_tracks_image(self):
+        # test: recipes loaded from the database know their stored image
+
+        recipe = create_recipe(self.user)
+        self.upload(recipe)
+
+        reloaded = Recipe.objects.get(id=recipe.id)
+        reloaded.image = None
+        reloaded.save()
+
+        self.assertEqual(ImageBlob.objects.count(), 0)
+
+    def test_hard_delete_releases_image(self):
+        # test: deleting a recipe outright drops its reference too
+
+        first = create_recipe(self.user)
+        second = create_recipe(self.user)
+        path = self.upload(first)
+        self.upload(second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.all_objects.get(id=first.id).delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get().refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_file_deleted_under_exclusive_lock(self):
+        # test: unused files are only removed holding the lock writers share
+
+        recipe = create_recipe(self.user)
+        self.upload(recipe)
+
+        with patch.object(ImageBlobManager, 'lock_files') as lock_files:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+
+        lock_files.assert_called_once_with(exclusive=True)
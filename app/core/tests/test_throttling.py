@@ -0,0 +1,182 @@
+"""
+tests for token bucket throttling and request coalescing
+"""
+
+import threading
+from unittest.mock import Mock
+from django.core.cache import cache
+from django.test import (
+    SimpleTestCase,
+    override_settings,
+)
+from core.singleflight import SingleFlight
+from core.throttling import (
+    ScopedTokenBucketThrottle,
+    TokenBucketThrottle,
+    UserTokenBucketThrottle,
+    parse_rate,
+)
+
+RATES = {
+    'REST_FRAMEWORK': {
+        'DEFAULT_THROTTLE_RATES': {'user': '3/min', 'recipe-list': '2/min'},
+    },
+}
+
+
+def make_request(user_id):
+    # return a stand-in authenticated request
+
+    return Mock(user=Mock(pk=user_id, is_authenticated=True), META={})
+
+
+class TokenBucketThrottleTests(SimpleTestCase):
+    # test token bucket throttle
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        self.settings_override = override_settings(**RATES)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def allow(self, throttle_class, user_id=1, view=None):
+        throttle = throttle_class()
+        throttle.timer = lambda: self.now
+        allowed = throttle.allow_request(make_request(user_id), view)
+
+        return allowed, throttle
+
+    def test_parse_rate(self):
+        # test: capacity and refill per second
+
+        self.assertEqual(parse_rate('120/min'), (120, 2.0))
+        self.assertEqual(parse_rate('10/s'), (10, 10.0))
+
+    def test_burst_then_throttled(self):
+        # test: capacity requests pass, the next one waits
+
+        for _ in range(3):
+            allowed, _ = self.allow(UserTokenBucketThrottle)
+            self.assertTrue(allowed)
+
+        allowed, throttle = self.allow(UserTokenBucketThrottle)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20.0)
+
+    def test_refill(self):
+        # test: tokens come back at the configured rate
+
+        for _ in range(3):
+            self.allow(UserTokenBucketThrottle)
+
+        self.now += 20
+        self.assertTrue(self.allow(UserTokenBucketThrottle)[0])
+        self.assertFalse(self.allow(UserTokenBucketThrottle)[0])
+
+    def test_bucket_never_exceeds_capacity(self):
+        # test: idling does not save up more than a full bucket
+
+        self.allow(UserTokenBucketThrottle)
+        self.now += 50
+
+        results = [self.allow(UserTokenBucketThrottle)[0] for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+
+    def test_buckets_per_user(self):
+        # test: users do not share buckets
+
+        for _ in range(3):
+            self.allow(UserTokenBucketThrottle, user_id=1)
+
+        self.assertFalse(self.allow(UserTokenBucketThrottle, user_id=1)[0])
+        self.assertTrue(self.allow(UserTokenBucketThrottle, user_id=2)[0])
+
+    def test_scoped_per_action(self):
+        # test: scoped buckets only apply to the listed actions
+
+        list_view = Mock(throttle_scope={'list': 'recipe-list'}, action='list')
+        detail_view = Mock(
+            throttle_scope={'list': 'recipe-list'},
+            action='retrieve',
+        )
+
+        for _ in range(2):
+            self.assertTrue(
+                self.allow(ScopedTokenBucketThrottle, view=list_view)[0]
+            )
+        self.assertFalse(
+            self.allow(ScopedTokenBucketThrottle, view=list_view)[0]
+        )
+        self.assertTrue(
+            self.allow(ScopedTokenBucketThrottle, view=detail_view)[0]
+        )
+
+    def test_no_scope_not_throttled(self):
+        # test: a throttle without scope lets everything through
+
+        self.assertTrue(self.allow(TokenBucketThrottle)[0])
+
+
+class SingleFlightTests(SimpleTestCase):
+    # test request coalescing
+
+    def test_concurrent_calls_share_result(self):
+        # test: callers arriving during a call reuse its result
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return ['recipe']
+
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do('key', slow))
+        )
+        leader.start()
+        started.wait()
+        followers = [
+            threading.Thread(
+                target=lambda: results.append(flight.do('key', slow))
+            )
+            for _ in range(3)
+        ]
+        for follower in followers:
+            follower.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['recipe']] * 4)
+
+    def test_sequential_calls_run_again(self):
+        # test: nothing is cached once a call finished
+
+        flight = SingleFlight()
+        calls = []
+
+        flight.do('key', lambda: calls.append(1))
+        flight.do('key', lambda: calls.append(1))
+
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_raised(self):
+        # test: the exception reaches the caller and the key is freed
+
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', fail)
+        self.assertEqual(flight.do('key', lambda: 1), 1)
@@ -0,0 +1,180 @@
+"""
+tests for the two-tier cache
+"""
+
+from unittest.mock import (
+    Mock,
+    patch,
+)
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core import invalidation
+from core.tiered_cache import (
+    LocalLRU,
+    TieredCache,
+    clear_caches,
+    should_refresh,
+)
+
+
+class LocalLRUTests(SimpleTestCase):
+    # test the in-process tier
+
+    def test_evicts_least_recently_used(self):
+        # test: past max_entries the least recently used entry goes
+
+        lru = LocalLRU(max_entries=2, max_bytes=1000)
+        lru.set('a', 1, 10, expires=100)
+        lru.set('b', 2, 10, expires=100)
+        lru.get('a', now=0)
+
+        lru.set('c', 3, 10, expires=100)
+
+        self.assertEqual(lru.get('a', now=0), 1)
+        self.assertIsNone(lru.get('b', now=0))
+        self.assertEqual(lru.evictions, 1)
+
+    def test_size_accounting(self):
+        # test: entries are evicted to stay within max_bytes
+
+        lru = LocalLRU(max_entries=10, max_bytes=100)
+        lru.set('a', 1, 60, expires=100)
+        lru.set('b', 2, 60, expires=100)
+        lru.set('c', 3, 500, expires=100)
+
+        self.assertIsNone(lru.get('a', now=0))
+        self.assertIsNone(lru.get('c', now=0))
+        self.assertEqual(lru.size, 60)
+
+    def test_expiry(self):
+        # test: expired entries are dropped when read
+
+        lru = LocalLRU(max_entries=10, max_bytes=100)
+        lru.set('a', 1, 10, expires=100)
+
+        self.assertEqual(lru.get('a', now=99), 1)
+        self.assertIsNone(lru.get('a', now=100))
+        self.assertEqual(lru.expirations, 1)
+        self.assertEqual(lru.size, 0)
+
+
+class ShouldRefreshTests(SimpleTestCase):
+    # test probabilistic early expiration
+
+    @patch('core.tiered_cache.random.random', return_value=0.5)
+    def test_refresh_near_expiry(self, patched_random):
+        # test: slow values are refreshed earlier than fast ones
+
+        self.assertFalse(should_refresh(0.01, 100, 90, beta=1))
+        self.assertTrue(should_refresh(20, 100, 90, beta=1))
+        self.assertTrue(should_refresh(0, 100, 100, beta=1))
+
+
+class TieredCacheTests(TestCase):
+    # test lookups through both tiers
+
+    def setUp(self):
+        clear_caches()
+        self.cache = TieredCache('test', ttl=60)
+        self.compute = Mock(return_value={'value': 1})
+
+    def test_computed_once(self):
+        # test: a value is computed once and then served from L1
+
+        for _ in range(3):
+            value = self.cache.get_or_set(1, 'key', self.compute)
+
+        self.assertEqual(value, {'value': 1})
+        self.compute.assert_called_once()
+        stats = self.cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['l1_hits'], 2)
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+        self.assertGreater(stats['l1_bytes'], 0)
+
+    def test_shared_through_l2(self):
+        # test: another process finds the value in L2
+
+        self.cache.get_or_set(1, 'key', self.compute)
+        other = TieredCache('test', ttl=60)
+
+        value = other.get_or_set(1, 'key', self.compute)
+
+        self.assertEqual(value, {'value': 1})
+        self.compute.assert_called_once()
+        self.assertEqual(other.stats()['l2_hits'], 1)
+
+    def test_invalidate(self):
+        # test: a new generation recomputes in every process
+
+        other = TieredCache('test', ttl=60)
+        self.cache.get_or_set(1, 'key', self.compute)
+        other.get_or_set(1, 'key', self.compute)
+
+        self.cache.invalidate(['1'])
+        other.forget(['1'])
+        self.cache.get_or_set(1, 'key', self.compute)
+        other.get_or_set(1, 'key', self.compute)
+
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_changed_within(self):
+        # test: the age of the last invalidation can be asked for
+
+        self.cache.invalidate(['1'])
+
+        self.assertTrue(self.cache.changed_within(1, 60))
+        self.assertFalse(self.cache.changed_within(1, 0))
+
+    def test_early_refresh(self):
+        # test: entries picked for early refresh are recomputed
+
+        self.cache.get_or_set(1, 'key', self.compute)
+        self.cache.l1.clear()
+
+        with patch('core.tiered_cache.should_refresh', return_value=True):
+            self.cache.get_or_set(1, 'key', self.compute)
+
+        self.assertEqual(self.compute.call_count, 2)
+        self.assertEqual(self.cache.stats()['early_refreshes'], 1)
+
+    def test_invalidated_by_topic(self):
+        # test: publishing a topic invalidates the scope on commit
+
+        cache = TieredCache('topic-test', ttl=60, topics=['test-topic'])
+        cache.get_or_set(1, 'key', self.compute)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidation.publish('test-topic', 1)
+        cache.get_or_set(1, 'key', self.compute)
+        cache.get_or_set(2, 'key', self.compute)
+
+        self.assertEqual(self.compute.call_count, 3)
+
+
+class CacheStatsViewTests(TestCase):
+    # test the stats endpoint
+
+    def test_admin_only(self):
+        # test: staff see stats, other users don't
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(reverse('cache-stats'))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        res = client.get(reverse('cache-stats'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('recipe-list', res.data['caches'])
@@ -0,0 +1,133 @@
+"""
+token bucket throttling
+"""
+
+import time
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    # '120/min' -> (capacity 120, refill 2 tokens per second)
+
+    num, period = rate.split('/')
+    capacity = int(num)
+    seconds = PERIODS[period[0]]
+
+    return capacity, capacity / seconds
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # token bucket kept in two atomic cache counters
+    #
+    # DRF's SimpleRateThrottle stores a list of request timestamps
+    # per client and rewrites it on every request.
+    # here a bucket is the time it was started plus the number of
+    # tokens used since, which is bumped with cache.incr.
+    # the bucket holds at most `capacity` tokens and refills at
+    # capacity / period, so rates read the same as DRF's,
+    # e.g. '120/min' allows bursts of 120 and 2 requests a second.
+
+    cache = default_cache
+    timer = time.time
+    cache_format = 'bucket_%(scope)s_%(ident)s'
+    scope = None
+
+    def get_rate(self, scope):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[scope]
+        except KeyError:
+            msg = f'No default throttle rate set for "{scope}" scope'
+            raise ImproperlyConfigured(msg)
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+        self.scope = scope
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        capacity, refill = parse_rate(self.get_rate(scope))
+        return self.take(key, capacity, refill)
+
+    def take(self, key, capacity, refill):
+        # take one token from the bucket at key
+
+        now = self.timer()
+        # an idle bucket is full again after this long,
+        # so it can simply expire
+        timeout = int(capacity / refill) + 1
+        start_key, used_key = f'{key}_start', f'{key}_used'
+
+        self.cache.add(start_key, now, timeout)
+        self.cache.add(used_key, 0, timeout)
+        start = self.cache.get(start_key, now)
+        try:
+            used = self.cache.incr(used_key)
+        except ValueError:
+            # expired between add and incr
+            self.cache.set(used_key, 1, timeout)
+            used = 1
+
+        earned = capacity + (now - start) * refill
+        if used > earned:
+            self.cache.decr(used_key)
+            self.wait_time = (used - earned) / refill
+            return False
+
+        # never keep more than `capacity` tokens around:
+        # burn the ones earned while the bucket was already full
+        overflow = int(earned - used + 1 - capacity)
+        if overflow > 0:
+            self.cache.incr(used_key, overflow)
+
+        self.cache.touch(start_key, timeout)
+        self.cache.touch(used_key, timeout)
+
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_time', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    # limit each user, or each anonymous client ip, across all views
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class ScopedTokenBucketThrottle(UserTokenBucketThrottle):
+    # limit each user per view scope
+    #
+    # views set `throttle_scope` to a scope name,
+    # or to a dict of {action: scope} to limit single actions only
+
+    scope = None
+
+    def get_scope(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if isinstance(scope, dict):
+            scope = scope.get(getattr(view, 'action', None))
+
+        return scope
@@ -0,0 +1,276 @@
+"""
+two-tier cache: a bounded in-process LRU in front of a shared cache
+"""
+
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from collections import (
+    Counter,
+    OrderedDict,
+)
+from django.conf import settings
+from django.core.cache import caches
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework import (
+    permissions,
+    views,
+)
+from rest_framework.response import Response
+from core import invalidation
+from core.singleflight import SingleFlight
+
+# every TieredCache by name, for stats()
+registry = {}
+
+
+class LocalLRU:
+    # bounded in-process LRU whose entries expire
+    #
+    # an entry counts its pickled size against max_bytes; the least
+    # recently used entries are evicted once either limit is passed.
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        # return the value of key, or None when missing or expired
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires = entry
+            if expires <= now:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+
+        return value
+
+    def set(self, key, value, size, expires):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expires)
+            self.size += size
+            while len(self._entries) > self.max_entries or \
+                    self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[1]
+
+
+def should_refresh(delta, expires, now, beta):
+    # probabilistic early expiration ("XFetch")
+    #
+    # each reader recomputes a little before expiry with a probability
+    # that grows as expiry nears and with how long the value took to
+    # compute (delta), so one request refreshes a hot key while the
+    # others are still served the cached value.
+
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+class TieredCache:
+    # values cached per process (L1) and in a shared cache (L2)
+    #
+    # values belong to a scope, usually a user id. L2 keys contain
+    # the scope's generation, a token kept in L2: the time it started
+    # and random bytes. a write to the scope publishes one of the
+    # invalidation topics; on commit the writing process replaces the
+    # generation, which strands the old L2 entries, and every process
+    # forgets its L1 copy of the generation. L1 entries are keyed by
+    # generation too, so values computed from data that was already
+    # stale can't be served.
+    #
+    # L1 entries live L1_TTL seconds at most, which bounds staleness
+    # when invalidations are not delivered. L2 entries are refreshed
+    # early, see should_refresh(), and concurrent misses in a process
+    # share one computation.
+
+    def __init__(self, name, ttl, topics=(), l1_ttl=None,
+                 max_entries=None, max_bytes=None):
+        options = settings.TIERED_CACHE
+        self.name = name
+        self.ttl = ttl
+        self.l1_ttl = min(l1_ttl or options['L1_TTL'], ttl)
+        self.beta = options['BETA']
+        self.l1 = LocalLRU(
+            max_entries or options['L1_MAX_ENTRIES'],
+            max_bytes or options['L1_MAX_BYTES'],
+        )
+        self.counts = Counter()
+        self._flight = SingleFlight()
+
+        for topic in topics:
+            invalidation.on_publish(topic, self.invalidate)
+            invalidation.subscribe(topic, self.forget)
+        invalidation.on_reset(self.l1.clear)
+        registry[name] = self
+
+    @property
+    def l2(self):
+        return caches[settings.TIERED_CACHE['L2']]
+
+    def _generation_key(self, scope):
+        return f'{self.name}:gen:{scope}'
+
+    def _new_generation(self, now):
+        # started in whole milliseconds
+        return f'{int(now * 1000)}:{os.urandom(6).hex()}'
+
+    def _generation(self, scope, now):
+        # generation of scope, agreed on through L2
+
+        generation = self.l1.get((scope,), now)
+        if generation is None:
+            key = self._generation_key(scope)
+            generation = self.l2.get(key)
+            if generation is None:
+                self.l2.add(key, self._new_generation(now), None)
+                generation = self.l2.get(key)
+            self.l1.set((scope,), generation, 0, now + self.l1_ttl)
+
+        return generation
+
+    def changed_within(self, scope, seconds):
+        # whether scope's generation started less than seconds ago
+
+        now = time.time()
+        generation = self._generation(str(scope), now)
+        started, colon, _ = generation.partition(':')
+        if not colon:
+            # a generation from before they carried their start
+            return False
+
+        return now - int(started) / 1000 < seconds
+
+    def get_or_set(self, scope, key, compute):
+        # return the cached value of key, computing it when needed
+        # None is never cached
+
+        # scopes arrive from invalidation events as strings
+        scope = str(scope)
+        now = time.time()
+        generation = self._generation(scope, now)
+        value = self.l1.get((scope, generation, key), now)
+        if value is not None:
+            self.counts['l1_hits'] += 1
+            return value
+
+        l2_key = f'{self.name}:{scope}:{generation}:{key}'
+        data = self.l2.get(l2_key)
+        if data is not None:
+            value, delta, expires = pickle.loads(data)
+            if not should_refresh(delta, expires, now, self.beta):
+                self.counts['l2_hits'] += 1
+                self.l1.set(
+                    (scope, generation, key), value, len(data),
+                    min(now + self.l1_ttl, expires),
+                )
+                return value
+            self.counts['early_refreshes'] += 1
+        else:
+            self.counts['misses'] += 1
+
+        return self._flight.do(l2_key, lambda: self._compute(
+            (scope, generation, key), l2_key, compute,
+        ))
+
+    def _compute(self, l1_key, l2_key, compute):
+        start = time.time()
+        value = compute()
+        now = time.time()
+        expires = now + self.ttl
+        data = pickle.dumps(
+            (value, now - start, expires),
+            pickle.HIGHEST_PROTOCOL,
+        )
+        self.l2.set(l2_key, data, self.ttl)
+        self.l1.set(l1_key, value, len(data), now + self.l1_ttl)
+
+        return value
+
+    def invalidate(self, scopes):
+        # start new generations, in the process that wrote
+
+        now = time.time()
+        for scope in map(str, scopes):
+            self.l2.set(
+                self._generation_key(scope),
+                self._new_generation(now),
+                None,
+            )
+            self.l1.delete((scope,))
+
+    def forget(self, scopes):
+        # drop the generations this process knows, in every process
+        for scope in map(str, scopes):
+            self.l1.delete((scope,))
+
+    def stats(self):
+        counts = self.counts.copy()
+        lookups = counts['l1_hits'] + counts['l2_hits'] + \
+            counts['misses'] + counts['early_refreshes']
+        hits = counts['l1_hits'] + counts['l2_hits']
+
+        return {
+            **counts,
+            'hit_ratio': hits / lookups if lookups else None,
+            'l1_entries': len(self.l1),
+            'l1_bytes': self.l1.size,
+            'l1_evictions': self.l1.evictions,
+            'l1_expirations': self.l1.expirations,
+        }
+
+
+def clear_caches():
+    # empty every tiered cache, L2 entirely
+
+    for tiered in registry.values():
+        tiered.l1.clear()
+    caches[settings.TIERED_CACHE['L2']].clear()
+
+
+class CacheStatsView(views.APIView):
+    # hit ratios and evictions of this process' tiered caches
+
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    def get(self, request):
+        return Response({
+            'pid': os.getpid(),
+            'caches': {
+                name: tiered.stats() for name, tiered in registry.items()
+            },
+        })
@@ -0,0 +1,206 @@
+"""
+resumable, chunked recipe image uploads
+"""
+
+import hashlib
+import os
+import shutil
+import uuid
+from django.db import transaction
+from PIL import (
+    Image,
+    ImageFile,
+)
+from core.models import (
+    ImageBlob,
+    ImageUpload,
+    Recipe,
+)
+from core.storage import adopt_file
+
+# bytes copied per read/write while handling chunks
+COPY_SIZE = 64 * 1024
+# image headers have to be within this many bytes from the start
+HEADER_LIMIT = 1024 * 1024
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+class UploadFinished(Exception):
+    # the upload was completed or discarded meanwhile
+
+    def __init__(self):
+        super().__init__('Upload is already finished.')
+
+
+class OffsetMismatch(Exception):
+    # the client resumed from the wrong place
+    # offset is where the upload actually stands
+
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}.')
+        self.offset = offset
+
+
+def is_image_filename(filename):
+    extension = os.path.splitext(filename)[1].lower()
+
+    return extension in Image.registered_extensions()
+
+
+def start_upload(user_id, recipe, filename, size, sha256):
+    # create an upload session and its empty staging file
+
+    upload = ImageUpload.objects.create(
+        user_id=user_id,
+        recipe=recipe,
+        filename=filename,
+        size=size,
+        sha256=sha256.lower(),
+    )
+    os.makedirs(os.path.dirname(upload.staging_path), exist_ok=True)
+    open(upload.staging_path, 'xb').close()
+
+    return upload
+
+
+def append_chunk(upload_id, offset, stream, length):
+    # write length bytes read from stream at offset of the staging file
+    # return the upload with its new offset
+    #
+    # the body is first read into a file of its own, so a slow client
+    # doesn't hold the row lock. the lock then serialises chunks of one
+    # upload while the chunk is appended. bytes are synced to disk
+    # before the offset moves, so after a crash or a dropped connection
+    # the client can resume from the stored offset.
+
+    upload = ImageUpload.objects.filter(id=upload_id).first()
+    if upload is None:
+        raise UploadFinished()
+    if offset != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    if offset + length > upload.size:
+        raise InvalidUpload('Chunk runs past the declared size.')
+
+    chunk_path = f'{upload.staging_path}.{uuid.uuid4().hex}'
+    try:
+        written = 0
+        with open(chunk_path, 'xb') as chunk:
+            while written < length:
+                data = stream.read(min(COPY_SIZE, length - written))
+                if not data:
+                    break
+                chunk.write(data)
+                written += len(data)
+
+        with transaction.atomic():
+            upload = ImageUpload.objects.select_for_update().filter(
+                id=upload_id
+            ).first()
+            if upload is None:
+                raise UploadFinished()
+            if offset != upload.offset:
+                # another request wrote this chunk meanwhile
+                raise OffsetMismatch(upload.offset)
+
+            with open(chunk_path, 'rb') as chunk, \
+                    open(upload.staging_path, 'r+b') as f:
+                # drop bytes of an earlier write that never got recorded
+                f.truncate(offset)
+                f.seek(offset)
+                shutil.copyfileobj(chunk, f, COPY_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
+
+            upload.offset += written
+            upload.save(update_fields=['offset'])
+    finally:
+        try:
+            os.unlink(chunk_path)
+        except FileNotFoundError:
+            pass
+
+    return upload
+
+
+def _inspect(path):
+    # read the staging file once
+    # return (sha256 hex digest, image format or None)
+
+    digest = hashlib.sha256()
+    parser = ImageFile.Parser()
+    parsed = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(COPY_SIZE), b''):
+            digest.update(data)
+            # the header is all that's needed to identify the image,
+            # the pixel data isn't decoded
+            if parser.image is None and parsed < HEADER_LIMIT:
+                parsed += len(data)
+                try:
+                    parser.feed(data)
+                except (OSError, SyntaxError):
+                    parsed = HEADER_LIMIT
+
+    return digest.hexdigest(), getattr(parser.image, 'format', None)
+
+
+def finish_upload(upload):
+    # check the assembled file and make it the recipe's image
+    # return the updated recipe
+    #
+    # the row lock makes concurrent or repeated completions wait for
+    # the first one, which leaves no upload behind for them
+
+    field = Recipe._meta.get_field('image')
+    with transaction.atomic():
+        upload = ImageUpload.objects.select_for_update().filter(
+            id=upload.id
+        ).first()
+        if upload is None:
+            raise UploadFinished()
+        if upload.offset != upload.size:
+            raise OffsetMismatch(upload.offset)
+
+        digest, image_format = _inspect(upload.staging_path)
+        if digest != upload.sha256:
+            error = 'Checksum does not match the uploaded data.'
+        elif image_format is None:
+            error = 'Upload is not a valid image.'
+        else:
+            recipe = Recipe.objects.select_for_update().get(
+                id=upload.recipe_id
+            )
+            ImageBlob.objects.lock_files()
+            name = field.generate_filename(recipe, upload.filename)
+            recipe.image = adopt_file(
+                field.storage,
+                upload.staging_path,
+                name,
+                digest,
+            )
+            recipe.save(update_fields=['image'])
+            upload.delete()
+            return recipe
+
+        discard_upload(upload)
+
+    raise InvalidUpload(error)
+
+
+def discard_upload(upload):
+    # remove an upload session
+    # its staging file goes once the deletion is committed
+
+    upload.delete()
+
+
+def remove_staging_file(path):
+    # unlink what was staged for a deleted upload, if anything is left
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,131 @@
+"""
+read-only fast path for recipe serializers
+"""
+
+from rest_framework import serializers as drf_serializers
+from core.models import Recipe
+from recipe import serializers
+
+
+class CompiledRecipeReader:
+    # read-only, precompiled version of a recipe serializer
+    #
+    # ModelSerializer deep copies its declared fields every time
+    # it is instantiated and walks the generic to_representation
+    # for every field of every row.
+    # here the field layout is worked out once, at import time,
+    # and rows are pulled with values() plus one query per
+    # nested many-to-many field, so a list costs a constant
+    # number of queries and no model instances are built.
+    # writes still go through the regular serializers.
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.scalar_fields = []
+        self.image_fields = []
+        self.related_fields = []
+        self.layout = []
+
+        fields = serializer_class().fields
+        for name, field in fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, drf_serializers.ListSerializer):
+                self.related_fields.append(
+                    (name, self._related_columns(field.child))
+                )
+            elif isinstance(field, drf_serializers.FileField):
+                self.scalar_fields.append(name)
+                self.image_fields.append(name)
+            else:
+                self.scalar_fields.append(name)
+            self.layout.append((name, field))
+
+    def _related_columns(self, child):
+        # nested serializers are flattened into their plain field names
+
+        return [
+            name for name, field in child.fields.items()
+            if not field.write_only
+        ]
+
+    def _related_rows(self, name, columns, recipe_ids):
+        # fetch {recipe_id: [{...}, ...]} for one many-to-many field
+
+        m2m = Recipe._meta.get_field(name)
+        source = m2m.m2m_field_name()
+        target = m2m.m2m_reverse_field_name()
+        lookups = [f'{target}__{column}' for column in columns]
+        rows = m2m.remote_field.through.objects.filter(
+            **{
+                f'{source}__in': recipe_ids,
+                # soft-deleted tags and ingredients are hidden
+                f'{target}__deleted_at__isnull': True,
+            }
+        ).order_by('pk').values_list(f'{source}_id', *lookups)
+
+        related = {recipe_id: [] for recipe_id in recipe_ids}
+        for row in rows:
+            related[row[0]].append(dict(zip(columns, row[1:])))
+
+        return related
+
+    def _image_url(self, name, request):
+        # mirrors FileField.to_representation for a stored file name
+
+        if not name:
+            return None
+        url = Recipe._meta.get_field('image').storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+
+        return url
+
+    @property
+    def field_names(self):
+        return [name for name, _ in self.layout]
+
+    def serialize(self, queryset, request=None, fields=None):
+        # return a list of plain dicts for every recipe in queryset
+        # fields, a sparse fieldset, limits them to those names and
+        # id; related fields left out are not queried
+
+        layout = self.layout
+        if fields is not None:
+            layout = [
+                (name, field) for name, field in layout
+                if name == 'id' or name in fields
+            ]
+        names = {name for name, _ in layout}
+        rows = list(queryset.values(*(
+            name for name in self.scalar_fields
+            if name == 'id' or name in names
+        )))
+        recipe_ids = [row['id'] for row in rows]
+        related = {
+            name: self._related_rows(name, columns, recipe_ids)
+            for name, columns in self.related_fields
+            if name in names
+        } if recipe_ids else {}
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, field in layout:
+                if name in related:
+                    item[name] = related[name][row['id']]
+                elif name in self.image_fields:
+                    item[name] = self._image_url(row[name], request)
+                elif row[name] is None:
+                    item[name] = None
+                else:
+                    item[name] = field.to_representation(row[name])
+            data.append(item)
+
+        return data
+
+
+recipe_reader = CompiledRecipeReader(serializers.RecipeSerializer)
+recipe_detail_reader = CompiledRecipeReader(
+    serializers.RecipeDetailSerializer
+)
@@ -2,12 +2,17 @@
 serializers for recipe apis
 """
 
+from django.conf import settings
+from django.core.validators import RegexValidator
 from rest_framework import serializers
 from core.models import (
+    Change,
+    ImageUpload,
     Recipe,
     Tag,
     Ingredient
 )
+from core.uploads import is_image_filename
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -57,9 +62,11 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
         for tag in tags:
             tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
+                user_id=auth_user.id,
                 **tag,
             )
+            if created:
+                Change.objects.record(auth_user.id, Change.TAG, [tag_obj.id])
             recipe.tags.add(tag_obj)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
@@ -68,9 +75,15 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
         for ing in ingredients:
             ing_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
+                user_id=auth_user.id,
                 **ing
             )
+            if created:
+                Change.objects.record(
+                    auth_user.id,
+                    Change.INGREDIENT,
+                    [ing_obj.id],
+                )
             recipe.ingredients.add(ing_obj)
 
     def create(self, validated_data):
@@ -89,6 +102,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self._get_or_create_tags(tags, recipe)
         self._get_or_create_ingredients(ingredients, recipe)
+        Change.objects.record(recipe.user_id, Change.RECIPE, [recipe.id])
 
         return recipe
 
@@ -111,6 +125,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
 
         instance.save()
+        Change.objects.record(instance.user_id, Change.RECIPE, [instance.id])
         return instance
 
 
@@ -125,6 +140,30 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
 
 
+class PantryRecipeSerializer(RecipeSerializer):
+    # serializer for recipes found by a pantry query
+
+    missing = serializers.IntegerField(
+        read_only=True,
+        help_text='Ingredients of the recipe not in the pantry.'
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['missing']
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    # serializer for recipes similar to another one
+
+    similarity = serializers.FloatField(
+        read_only=True,
+        help_text='Overlap of the tags and ingredients, from 0 to 1.'
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     # serializer for uploading images for recipes.
 
@@ -133,3 +172,97 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    # serializer for resumable image upload sessions
+
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'filename', 'size', 'sha256', 'offset']
+        read_only_fields = ['id', 'offset']
+        extra_kwargs = {
+            'sha256': {
+                'validators': [RegexValidator(
+                    r'^[0-9a-fA-F]{64}$',
+                    'Must be a hex encoded sha256 digest.',
+                )],
+            },
+        }
+
+    def validate_filename(self, value):
+        if not is_image_filename(value):
+            raise serializers.ValidationError('Not an image file name.')
+
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.'
+            )
+
+        return value
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    # details of several recipes, see recipe.views.RecipeViewSet
+
+    results = RecipeDetailSerializer(many=True)
+    not_found = serializers.ListField(
+        child=serializers.IntegerField(),
+        help_text='Requested ids that are not recipes of the user.'
+    )
+
+
+class ShoppingListRequestSerializer(serializers.Serializer):
+    # recipes to build a shopping list for
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.SHOPPING_LIST_MAX_RECIPES,
+    )
+
+
+class ShoppingListIngredientSerializer(serializers.Serializer):
+    # one ingredient of a shopping list
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        help_text='Recipes using the ingredient.'
+    )
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    # ingredients of several recipes, see recipe.views.RecipeViewSet
+
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    ingredients = ShoppingListIngredientSerializer(many=True)
+    total_price = serializers.DecimalField(max_digits=9, decimal_places=2)
+    total_time_minutes = serializers.IntegerField()
+
+
+class SyncDeletedSerializer(serializers.Serializer):
+    # ids of objects deleted since the sync token
+
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncSerializer(serializers.Serializer):
+    # changes since a sync token, see recipe.views.SyncView
+
+    token = serializers.CharField(
+        help_text='Pass as since to get the changes after these.'
+    )
+    more = serializers.BooleanField(
+        help_text='More changes are waiting, sync again with token.'
+    )
+    recipes = RecipeDetailSerializer(many=True)
+    tags = TagSerializer(many=True)
+    ingredients = IngredientSerializer(many=True)
+    deleted = SyncDeletedSerializer()
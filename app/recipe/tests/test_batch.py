@@ -0,0 +1,142 @@
+"""
+tests for fetching several recipes at once
+"""
+
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    Ingredient,
+    Recipe,
+    Tag,
+)
+from core.tiered_cache import clear_caches
+from recipe.serializers import RecipeDetailSerializer
+
+BATCH_URL = reverse('recipe:recipe-batch')
+
+
+def recipe_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class RecipeBatchTests(TestCase):
+    # test the batch detail endpoint
+
+    def setUp(self):
+        clear_caches()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.recipes = []
+        for n in range(5):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {n}',
+                time_minutes=10,
+                price=Decimal('2.00'),
+            )
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+            self.recipes.append(recipe)
+
+    def batch(self, ids, **params):
+        params['ids'] = ','.join(str(recipe_id) for recipe_id in ids)
+        return self.client.get(BATCH_URL, params)
+
+    def test_order_and_not_found(self):
+        # test: recipes come in the order asked, missing ids reported
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        foreign = Recipe.objects.create(
+            user=other,
+            title='Secret',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        first, second = self.recipes[3], self.recipes[1]
+
+        res = self.batch([first.id, foreign.id, second.id, 9999, first.id])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']],
+            [first.id, second.id]
+        )
+        self.assertEqual(res.data['not_found'], [foreign.id, 9999])
+        self.assertEqual(
+            res.data['results'][0],
+            RecipeDetailSerializer(first).data
+        )
+
+    def test_constant_queries(self):
+        # test: more ids don't mean more queries
+
+        with CaptureQueriesContext(connection) as few:
+            self.batch([recipe.id for recipe in self.recipes[:2]])
+        clear_caches()
+        with CaptureQueriesContext(connection) as many:
+            self.batch([recipe.id for recipe in self.recipes])
+
+        self.assertEqual(len(few), len(many))
+
+    def test_sparse_fieldset(self):
+        # test: fields limits the output, and the related queries
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.batch([self.recipes[0].id], fields='title,tags')
+
+        self.assertEqual(
+            res.data['results'],
+            [{
+                'id': self.recipes[0].id,
+                'title': 'Recipe 0',
+                'tags': [{'id': self.recipes[0].tags.get().id,
+                          'name': 'Vegan'}],
+            }]
+        )
+        self.assertFalse(any(
+            'core_recipe_ingredients' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_cached_until_changed(self):
+        # test: a repeated batch is cached, a write shows up at once
+
+        recipe = self.recipes[0]
+        self.batch([recipe.id])
+        with self.assertNumQueries(0):
+            self.batch([recipe.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(recipe_url(recipe.id), {'title': 'Renamed'})
+        res = self.batch([recipe.id])
+
+        self.assertEqual(res.data['results'][0]['title'], 'Renamed')
+
+    def test_invalid_params(self):
+        # test: ids are required and bounded, fields must exist
+
+        self.assertEqual(
+            self.client.get(BATCH_URL).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        with self.settings(RECIPE_BATCH_MAX_IDS=2):
+            res = self.batch([1, 2, 3])
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.batch([1], fields='title,secret')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
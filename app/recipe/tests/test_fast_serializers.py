@@ -0,0 +1,124 @@
+"""
+parity tests for the precompiled recipe readers
+"""
+
+import json
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.serializers import (
+    RecipeSerializer,
+    RecipeDetailSerializer,
+)
+from recipe.fast_serializers import (
+    recipe_reader,
+    recipe_detail_reader,
+)
+
+
+def create_recipe(user, **params):
+    # create and return a sample recipe
+
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'Sample description',
+        'link': 'http://example.com/recipe.pdf',
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def as_json(data):
+    # compare the rendered json, not python types
+
+    return json.loads(json.dumps(data))
+
+
+class CompiledRecipeReaderTests(TestCase):
+    # test: the fast path emits the same json as the serializers
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456',
+        )
+        self.request = APIRequestFactory().get('/')
+
+        self.recipe_one = create_recipe(user=self.user, price=Decimal('5'))
+        self.recipe_two = create_recipe(
+            user=self.user,
+            title='Another recipe',
+            link='',
+            image='uploads/recipe/sample.jpg',
+        )
+        create_recipe(user=self.user, title='No tags or ingredients')
+
+        for name in ['Vegan', 'Dinner']:
+            tag = Tag.objects.create(user=self.user, name=name)
+            self.recipe_one.tags.add(tag)
+            self.recipe_two.tags.add(tag)
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.recipe_two.ingredients.add(ingredient)
+
+    def test_list_parity(self):
+        # test: list output matches RecipeSerializer
+
+        recipes = Recipe.objects.all().order_by('-id')
+        expected = RecipeSerializer(recipes, many=True).data
+
+        self.assertEqual(
+            as_json(recipe_reader.serialize(recipes)),
+            as_json(expected),
+        )
+
+    def test_detail_parity(self):
+        # test: detail output matches RecipeDetailSerializer
+
+        recipes = Recipe.objects.all().order_by('-id')
+        context = {'request': self.request}
+        expected = RecipeDetailSerializer(
+            recipes,
+            many=True,
+            context=context,
+        ).data
+
+        data = recipe_detail_reader.serialize(recipes, request=self.request)
+        self.assertEqual(as_json(data), as_json(expected))
+
+    def test_filtered_queryset_parity(self):
+        # test: filtered, distinct querysets keep their order and content
+
+        recipes = Recipe.objects.filter(
+            tags__name__in=['Vegan', 'Dinner']
+        ).order_by('-id').distinct()
+        expected = RecipeSerializer(recipes, many=True).data
+
+        self.assertEqual(
+            as_json(recipe_reader.serialize(recipes)),
+            as_json(expected),
+        )
+
+    def test_empty_queryset(self):
+        # test: an empty queryset gives an empty list
+
+        recipes = Recipe.objects.none()
+
+        self.assertEqual(recipe_reader.serialize(recipes), [])
+
+    def test_constant_number_of_queries(self):
+        # test: one query for recipes and one per nested field
+
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+        with self.assertNumQueries(3):
+            recipe_reader.serialize(Recipe.objects.all())
@@ -0,0 +1,175 @@
+"""
+tests for pantry queries
+"""
+
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    Change,
+    Ingredient,
+    Recipe,
+)
+from core.recipe_index import (
+    RecipeIndex,
+    clear_indexes,
+)
+
+PANTRY_URL = reverse('recipe:recipe-pantry')
+
+
+def recipe_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def ingredient_url(ingredient_id):
+    return reverse('recipe:ingredient-detail', args=[ingredient_id])
+
+
+class PantryTests(TestCase):
+    # test recipes found by the ingredients at hand
+
+    def setUp(self):
+        clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Rice', 'Egg', 'Leek', 'Salt')
+        }
+        self.fried_rice = self.create_recipe('Fried rice', 'Rice', 'Egg')
+        self.omelette = self.create_recipe('Omelette', 'Egg', 'Salt')
+        self.soup = self.create_recipe('Soup', 'Leek', 'Salt', 'Rice')
+
+    def create_recipe(self, title, *ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title=title,
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        recipe.ingredients.set(
+            [self.ingredients[name] for name in ingredients]
+        )
+        Change.objects.record(self.user.id, Change.RECIPE, [recipe.id])
+
+        return recipe
+
+    def pantry(self, *names, **params):
+        params['ingredients'] = ','.join(
+            str(self.ingredients[name].id) for name in names
+        )
+        res = self.client.get(PANTRY_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [(recipe['title'], recipe['missing']) for recipe in res.data]
+
+    def test_subset(self):
+        # test: only recipes made entirely of the pantry are returned
+
+        self.assertEqual(
+            self.pantry('Rice', 'Egg', 'Salt'),
+            [('Omelette', 0), ('Fried rice', 0)]
+        )
+
+    def test_ranked_by_missing(self):
+        # test: recipes missing fewer ingredients come first
+
+        self.assertEqual(
+            self.pantry('Rice', 'Egg', max_missing=2),
+            [('Fried rice', 0), ('Omelette', 1), ('Soup', 2)]
+        )
+        self.assertEqual(
+            self.pantry('Rice', 'Egg', max_missing=2, limit=1),
+            [('Fried rice', 0)]
+        )
+
+    def test_follows_changes(self):
+        # test: writes through the api are seen by the next query
+
+        self.pantry('Rice', 'Egg')
+        self.client.patch(
+            recipe_url(self.omelette.id),
+            {'ingredients': [{'name': 'Egg'}]},
+            format='json'
+        )
+        self.client.delete(recipe_url(self.fried_rice.id))
+
+        self.assertEqual(self.pantry('Rice', 'Egg'), [('Omelette', 0)])
+
+    def test_deleted_ingredient(self):
+        # test: a deleted ingredient no longer counts as missing
+
+        self.pantry('Egg')
+        self.client.delete(ingredient_url(self.ingredients['Salt'].id))
+
+        self.assertEqual(
+            self.pantry('Egg'),
+            [('Omelette', 0)]
+        )
+
+    def test_other_users_recipes(self):
+        # test: only the user's own recipes are searched
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.pantry('Rice', 'Egg', 'Leek', 'Salt'), [])
+
+    def test_invalid_params(self):
+        # test: the ingredients are required and numbers are checked
+
+        res = self.client.get(PANTRY_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(PANTRY_URL, {
+            'ingredients': '1',
+            'max_missing': '-1',
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeIndexTests(TestCase):
+    # test the bitset index directly
+
+    def test_rebuild_after_many_changes(self):
+        # test: a long backlog of changes rebuilds the index
+
+        user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        rice = Ingredient.objects.create(user=user, name='Rice')
+        index = RecipeIndex(user.id)
+        index.build()
+        recipes = []
+        for n in range(3):
+            recipe = Recipe.objects.create(
+                user=user,
+                title=f'Recipe {n}',
+                time_minutes=10,
+                price=Decimal('2.00'),
+            )
+            recipe.ingredients.add(rice)
+            Change.objects.record(user.id, Change.RECIPE, [recipe.id])
+            recipes.append(recipe.id)
+
+        with self.settings(RECIPE_INDEX_REBUILD_AFTER=2):
+            with self.assertNumQueries(4):
+                index.refresh()
+
+        self.assertEqual(index.seq, 3)
+        self.assertEqual(
+            index.pantry([rice.id]),
+            [(recipe_id, 0) for recipe_id in reversed(recipes)]
+        )
@@ -4,24 +4,40 @@ tests for recipe apis
 
 import tempfile
 import os
+from unittest.mock import patch
 from PIL import Image  # Pillow
 from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from core.db_router import (
+    ReplicaRouter,
+    start_replica_reads,
+)
+from core.signed_tokens import (
+    clear_revocations,
+    encode_access_token,
+)
 from core.models import (
+    AuthToken,
     Recipe,
     Tag,
     Ingredient,
 )
+from core.tiered_cache import clear_caches
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
+from recipe.views import recipe_list_cache
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def detail_url(recipe_id):
@@ -79,6 +95,7 @@ class PrivateRecipeAPITests(TestCase):
     # test: authenticated api requests
 
     def setUp(self):
+        clear_caches()
         self.client = APIClient()
         self.user = create_user(email='user@example.com', password='123456')
         self.client.force_authenticate(self.user)
@@ -115,6 +132,31 @@ class PrivateRecipeAPITests(TestCase):
         self.assertTrue(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_recipe_list_cached_until_write(self):
+        # test: lists are cached, and a write through the api or to a
+        # tag shows up in the next list
+
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            self.client.get(RECIPES_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(recipe.id), {'title': 'New'})
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['title'], 'New')
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('recipe:tag-detail', args=[tag.id]),
+                {'name': 'Vegetarian'},
+            )
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Vegetarian')
+
     def test_get_recipe_detail(self):
         # test: get recipe detail
 
@@ -478,6 +520,162 @@ class PrivateRecipeAPITests(TestCase):
         self.assertNotIn(serializer_three.data, res.data)
 
 
+class SignedTokenRecipeAPITests(TestCase):
+    # test: recipe api with signed access tokens
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        self.user = create_user(email='user@example.com', password='123456')
+        self.client = APIClient()
+        access = encode_access_token(self.user.id, self.user.token_version)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_list_without_auth_queries(self):
+        # test: authenticating adds no query to listing recipes
+
+        create_recipe(user=self.user)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
+    def test_create_recipe(self):
+        # test: recipes and tags are created for the token's user
+
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 5,
+            'price': Decimal('1.50'),
+            'tags': [{'name': 'Quick'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(recipe.tags.get().user, self.user)
+
+
+class LazyUserRecipeAPITests(TestCase):
+    # test: recipe reads with token auth never load the user
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        self.user = create_user(email='user@example.com', password='123456')
+        token = AuthToken.objects.issue(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def tearDown(self):
+        clear_revocations()
+
+    def test_read_paths_skip_user_table(self):
+        # test: list and detail don't load the user, is_active comes
+        # joined to the token
+
+        recipe = create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            list_res = self.client.get(RECIPES_URL)
+            detail_res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(list_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(detail_res.status_code, status.HTTP_200_OK)
+        for query in queries.captured_queries:
+            self.assertNotIn('FROM "core_user"', query['sql'])
+
+    def test_deactivated_user_rejected(self):
+        # test: deactivating a user revokes their tokens
+
+        self.client.get(RECIPES_URL)  # caches the token
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@patch('recipe.views.start_replica_reads', wraps=start_replica_reads)
+class ReplicaRoutingTests(TestCase):
+    # test: which recipe requests may read from a replica
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='123456')
+        self.client.force_authenticate(self.user)
+
+    def test_list_reads_from_replica(self, patched_start):
+        # test: listing recipes asks for replica reads
+
+        self.client.get(RECIPES_URL)
+
+        patched_start.assert_called_once()
+
+    def test_cached_lists_after_change_read_on_primary(self,
+                                                       patched_start):
+        # test: lists shared through the cache come from a replica,
+        # unless they changed more recently than a replica may lag
+
+        routed = []
+        router = ReplicaRouter()
+
+        def serialize(queryset, **kwargs):
+            routed.append(router.db_for_read(Recipe))
+            return []
+
+        with patch('recipe.views.recipe_reader.serialize', serialize), \
+                patch('recipe.views.recipe_detail_reader.serialize',
+                      serialize), \
+                patch('core.db_router.replica_pool.choose',
+                      return_value='replica_0'):
+            recipe_list_cache.invalidate([self.user.id])
+            self.client.get(RECIPES_URL)
+            self.client.get(BATCH_URL, {'ids': '1'})
+            with self.settings(REPLICA_MAX_LAG_SECONDS=0):
+                self.client.get(RECIPES_URL, {'tags': '1'})
+                self.client.get(BATCH_URL, {'ids': '2'})
+
+        self.assertEqual(patched_start.call_count, 4)
+        self.assertEqual(routed, [None, None, 'replica_0', 'replica_0'])
+
+    def test_read_after_write_stays_on_primary(self, patched_start):
+        # test: a user who just wrote reads from the primary
+
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 5,
+            'price': Decimal('1.50'),
+        }
+        res = self.client.post(RECIPES_URL, payload)
+        self.client.get(detail_url(res.data['id']))
+
+        patched_start.assert_not_called()
+
+    def test_other_users_not_pinned(self, patched_start):
+        # test: one user's write does not pin another user
+
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 5,
+            'price': Decimal('1.50'),
+        }
+        self.client.post(RECIPES_URL, payload)
+        other_client = APIClient()
+        other_client.force_authenticate(
+            create_user(email='other@example.com', password='123456')
+        )
+        other_client.get(RECIPES_URL)
+
+        patched_start.assert_called_once()
+
+
 class ImageUploadTests(TestCase):
     # tests for image upload api
 
@@ -0,0 +1,110 @@
+"""
+tests for shopping lists
+"""
+
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    Ingredient,
+    Recipe,
+)
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+class ShoppingListTests(TestCase):
+    # test combining the ingredients of several recipes
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.leek = Ingredient.objects.create(user=self.user, name='Leek')
+        self.curry = self.create_recipe('Curry', '4.50', 30,
+                                        self.rice, self.leek)
+        self.risotto = self.create_recipe('Risotto', '6.00', 40, self.rice)
+        self.toast = self.create_recipe('Toast', '1.25', 5)
+
+    def create_recipe(self, title, price, time_minutes, *ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title=title,
+            time_minutes=time_minutes,
+            price=Decimal(price),
+        )
+        recipe.ingredients.set(ingredients)
+
+        return recipe
+
+    def shopping_list(self, *recipes):
+        return self.client.post(
+            SHOPPING_LIST_URL,
+            {'recipes': [recipe.id for recipe in recipes]},
+            format='json'
+        )
+
+    def test_combined_ingredients(self):
+        # test: each ingredient is listed once, in a single query
+
+        with self.assertNumQueries(1):
+            res = self.shopping_list(self.curry, self.risotto, self.toast)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['ingredients'], [
+            {'id': self.leek.id, 'name': 'Leek',
+             'recipes': [self.curry.id]},
+            {'id': self.rice.id, 'name': 'Rice',
+             'recipes': [self.curry.id, self.risotto.id]},
+        ])
+        self.assertEqual(res.data['total_price'], '11.75')
+        self.assertEqual(res.data['total_time_minutes'], 75)
+
+    def test_deleted_ingredient_left_out(self):
+        # test: soft-deleted ingredients are not on the list
+
+        self.leek.soft_delete()
+
+        res = self.shopping_list(self.curry, self.curry)
+
+        self.assertEqual(res.data['recipes'], [self.curry.id])
+        self.assertEqual(
+            [item['name'] for item in res.data['ingredients']],
+            ['Rice']
+        )
+
+    def test_other_users_recipe_refused(self):
+        # test: every recipe must belong to the user
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        recipe = Recipe.objects.create(
+            user=other,
+            title='Secret',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+
+        res = self.shopping_list(self.curry, recipe)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['recipes'],
+            [f'Recipe {recipe.id} not found.']
+        )
+
+    def test_empty_list_refused(self):
+        # test: at least one recipe is required
+
+        res = self.shopping_list()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
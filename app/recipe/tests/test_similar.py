@@ -0,0 +1,181 @@
+"""
+tests for similar recipes
+"""
+
+from decimal import Decimal
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    Change,
+    Ingredient,
+    Recipe,
+    Tag,
+)
+from core.recipe_index import (
+    COSINE,
+    RecipeIndex,
+    clear_indexes,
+)
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def recipe_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class SimilarApiTests(TestCase):
+    # test the similar recipes of a recipe
+
+    def setUp(self):
+        clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.curry = self.create_recipe('Curry', ['Spicy'], ['Rice', 'Leek'])
+        self.risotto = self.create_recipe('Risotto', [], ['Rice', 'Leek'])
+        self.chili = self.create_recipe('Chili', ['Spicy'], ['Beans'])
+        self.create_recipe('Cake', ['Sweet'], ['Flour'])
+
+    def create_recipe(self, title, tags, ingredients):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title=title,
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        recipe.tags.set([
+            Tag.objects.get_or_create(user=self.user, name=name)[0]
+            for name in tags
+        ])
+        recipe.ingredients.set([
+            Ingredient.objects.get_or_create(user=self.user, name=name)[0]
+            for name in ingredients
+        ])
+        Change.objects.record(self.user.id, Change.RECIPE, [recipe.id])
+
+        return recipe
+
+    def similar(self, recipe, **params):
+        res = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return [
+            (item['title'], round(item['similarity'], 3))
+            for item in res.data
+        ]
+
+    def test_ranked_by_jaccard(self):
+        # test: recipes sharing tags or ingredients, most similar first
+
+        self.assertEqual(
+            self.similar(self.curry),
+            [('Risotto', 0.667), ('Chili', 0.25)]
+        )
+        self.assertEqual(
+            self.similar(self.curry, limit=1),
+            [('Risotto', 0.667)]
+        )
+
+    def test_cosine(self):
+        # test: cosine similarity can be asked for
+
+        self.assertEqual(
+            self.similar(self.curry, metric='cosine'),
+            [('Risotto', 0.816), ('Chili', 0.408)]
+        )
+
+    def test_follows_changes(self):
+        # test: a recipe edited through the api is compared anew
+
+        self.similar(self.curry)
+        self.client.patch(
+            recipe_url(self.chili.id),
+            {'ingredients': [{'name': 'Rice'}, {'name': 'Leek'}]},
+            format='json'
+        )
+        self.client.delete(recipe_url(self.risotto.id))
+
+        self.assertEqual(self.similar(self.curry), [('Chili', 1.0)])
+
+    def test_other_users_recipe(self):
+        # test: recipes of other users are not found
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(similar_url(self.curry.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_metric(self):
+        # test: unknown metrics are refused
+
+        res = self.client.get(similar_url(self.curry.id), {'metric': 'l2'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeIndexSimilarityTests(SimpleTestCase):
+    # test similarity on an index filled by hand
+
+    def setUp(self):
+        self.index = RecipeIndex(user_id=1)
+        for recipe_id, features in enumerate([
+            'abc', 'abd', 'ab', 'cde', 'xyz', 'abc',
+        ], start=1):
+            self.set_recipe(recipe_id, features)
+
+    def set_recipe(self, recipe_id, features):
+        mask = 0
+        for feature in features:
+            mask |= 1 << self.index._bit((Change.TAG, feature))
+        self.index.set_recipe(recipe_id, mask)
+
+    def test_python_fallback_agrees(self):
+        # test: without numpy the same recipes and scores are returned
+
+        for metric in ('jaccard', COSINE):
+            with self.subTest(metric=metric):
+                expected = self.index.similar(1, 3, metric)
+                with patch('core.recipe_index.numpy', None):
+                    self.assertEqual(
+                        self.index.similar(1, 3, metric),
+                        expected
+                    )
+                self.assertEqual(
+                    [recipe_id for recipe_id, _ in expected],
+                    [6, 3, 2]
+                )
+
+    def test_updates_and_compaction(self):
+        # test: replaced rows are forgotten, also once compacted
+
+        self.set_recipe(6, 'xyz')
+        self.set_recipe(2, '')
+
+        self.assertEqual(
+            [recipe_id for recipe_id, _ in self.index.similar(1, 5)],
+            [3, 4]
+        )
+        self.index.compact()
+        self.assertEqual(len(self.index.recipe_ids), 5)
+        self.assertEqual(
+            [recipe_id for recipe_id, _ in self.index.similar(5, 5)],
+            [6]
+        )
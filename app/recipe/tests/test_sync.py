@@ -0,0 +1,158 @@
+"""
+tests for the delta sync api
+"""
+
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    Change,
+    Recipe,
+)
+
+SYNC_URL = reverse('recipe:sync')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def recipe_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def tag_url(tag_id):
+    return reverse('recipe:tag-detail', args=[tag_id])
+
+
+class ChangeLogTests(TestCase):
+    # test recording changes
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+
+    def test_latest_change_kept(self):
+        # test: each object keeps one row with the newest sequence
+
+        Change.objects.record(self.user.id, Change.RECIPE, [1, 2])
+        Change.objects.record(self.user.id, Change.RECIPE, [1], deleted=True)
+
+        changes = Change.objects.filter(user=self.user).order_by('seq')
+        self.assertEqual(
+            list(changes.values_list('object_id', 'seq', 'deleted')),
+            [(2, 2, False), (1, 3, True)]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.change_seq, 3)
+
+
+class SyncApiTests(TestCase):
+    # test syncing through the api
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': Decimal('5.00'),
+            'tags': [{'name': 'Spicy'}],
+            'ingredients': [{'name': 'Rice'}],
+        }, format='json')
+        self.recipe = Recipe.objects.get(id=res.data['id'])
+
+    def sync(self, since=None):
+        params = {} if since is None else {'since': since}
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def test_full_sync(self):
+        # test: without a token every object is returned
+
+        data = self.sync()
+
+        self.assertEqual([r['title'] for r in data['recipes']], ['Curry'])
+        self.assertEqual([t['name'] for t in data['tags']], ['Spicy'])
+        self.assertEqual([i['name'] for i in data['ingredients']], ['Rice'])
+        self.assertFalse(data['more'])
+
+    def test_changes_since_token(self):
+        # test: only objects changed after the token are returned
+
+        token = self.sync()['token']
+        other = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        Change.objects.record(self.user.id, Change.RECIPE, [other.id])
+        self.client.patch(recipe_url(self.recipe.id), {'title': 'Red curry'})
+
+        data = self.sync(token)
+
+        self.assertEqual(
+            [r['title'] for r in data['recipes']],
+            ['Red curry', 'Soup']
+        )
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(self.sync(data['token'])['recipes'], [])
+
+    def test_tombstones(self):
+        # test: deleted objects are returned as ids
+
+        token = self.sync()['token']
+        tag = self.recipe.tags.get()
+        self.client.delete(recipe_url(self.recipe.id))
+        self.client.delete(tag_url(tag.id))
+
+        data = self.sync(token)
+
+        self.assertEqual(data['recipes'], [])
+        self.assertEqual(data['deleted']['recipes'], [self.recipe.id])
+        self.assertEqual(data['deleted']['tags'], [tag.id])
+
+    def test_other_users_changes(self):
+        # test: a sync only sees the user's own changes
+
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        Change.objects.record(other.id, Change.RECIPE, [self.recipe.id])
+        token = self.sync()['token']
+
+        self.assertEqual(self.sync(token)['recipes'], [])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_paged(self):
+        # test: large syncs are split, more tells the client to go on
+
+        first = self.sync()
+        second = self.sync(first['token'])
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        synced = len(first['recipes']) + len(first['tags']) + \
+            len(first['ingredients']) + len(second['recipes']) + \
+            len(second['tags']) + len(second['ingredients'])
+        self.assertEqual(synced, 3)
+
+    def test_invalid_token(self):
+        # test: tokens that aren't sequence numbers are refused
+
+        res = self.client.get(SYNC_URL, {'since': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,250 @@
+"""
+tests for resumable image uploads
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from decimal import Decimal
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import (
+    ImageUpload,
+    Recipe,
+)
+from core.purge import purge_deleted
+from core.uploads import (
+    UploadFinished,
+    finish_upload,
+)
+from recipe.views import CHUNK_CONTENT_TYPE
+
+
+def uploads_url(recipe_id):
+    return reverse('recipe:recipe-create-upload', args=[recipe_id])
+
+
+def upload_url(recipe_id, upload_id):
+    return reverse('recipe:recipe-upload-chunk', args=[recipe_id, upload_id])
+
+
+def complete_url(recipe_id, upload_id):
+    return reverse(
+        'recipe:recipe-finish-upload',
+        args=[recipe_id, upload_id]
+    )
+
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(buffer, format='JPEG')
+
+    return buffer.getvalue()
+
+
+class ResumableUploadTests(TestCase):
+    # test the chunked upload protocol
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            '123456'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=10,
+            price=Decimal('2.50'),
+        )
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = jpeg_bytes()
+
+    def start(self, data=None):
+        data = self.data if data is None else data
+        res = self.client.post(uploads_url(self.recipe.id), {
+            'filename': 'photo.jpg',
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        return res.data['id']
+
+    def send(self, upload_id, offset, chunk):
+        return self.client.generic(
+            'PATCH',
+            upload_url(self.recipe.id, upload_id),
+            chunk,
+            content_type=CHUNK_CONTENT_TYPE,
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_in_chunks(self):
+        # test: chunks are assembled and become the recipe image
+
+        upload_id = self.start()
+        middle = len(self.data) // 2
+
+        first = self.send(upload_id, 0, self.data[:middle])
+        second = self.send(upload_id, middle, self.data[middle:])
+        res = self.client.post(complete_url(self.recipe.id, upload_id))
+
+        self.assertEqual(first['Upload-Offset'], str(middle))
+        self.assertEqual(second.data['offset'], len(self.data))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(
+            os.path.basename(self.recipe.image.name),
+            f'{digest}.jpg'
+        )
+        with open(self.recipe.image.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_resume_reports_offset(self):
+        # test: a chunk at the wrong offset is refused with the real one
+
+        upload_id = self.start()
+        self.send(upload_id, 0, self.data[:10])
+
+        res = self.send(upload_id, 20, self.data[20:30])
+        status_res = self.client.get(upload_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res['Upload-Offset'], '10')
+        self.assertEqual(status_res.data['offset'], 10)
+
+    def test_incomplete_upload_not_finished(self):
+        # test: completing before every byte arrived is refused
+
+        upload_id = self.start()
+        self.send(upload_id, 0, self.data[:10])
+
+        res = self.client.post(complete_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_checksum_mismatch(self):
+        # test: corrupted data is rejected and the upload dropped
+
+        upload_id = self.start()
+        corrupted = b'\0' + self.data[1:]
+        self.send(upload_id, 0, corrupted)
+        staging_path = ImageUpload.objects.get(id=upload_id).staging_path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(complete_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(staging_path))
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_not_an_image(self):
+        # test: data that isn't an image can't become the recipe image
+
+        data = b'not an image' * 100
+        upload_id = self.start(data)
+        self.send(upload_id, 0, data)
+
+        res = self.client.post(complete_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_past_size(self):
+        # test: chunks can't grow the file past its declared size
+
+        upload_id = self.start()
+
+        res = self.send(upload_id, 0, self.data + b'extra')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_content_type(self):
+        # test: chunks must be sent as raw bytes
+
+        upload_id = self.start()
+
+        res = self.client.patch(
+            upload_url(self.recipe.id, upload_id),
+            {'data': 'x'},
+            HTTP_UPLOAD_OFFSET='0',
+        )
+
+        self.assertEqual(
+            res.status_code,
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    def test_other_users_upload(self):
+        # test: uploads are only visible to their owner
+
+        upload_id = self.start()
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            '123456'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(upload_url(self.recipe.id, upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_finished_twice(self):
+        # test: a second completion of the same upload is a conflict
+
+        upload_id = self.start()
+        self.send(upload_id, 0, self.data)
+        upload = ImageUpload.objects.get(id=upload_id)
+
+        finish_upload(upload)
+
+        with self.assertRaises(UploadFinished):
+            finish_upload(upload)
+        res = self.send(upload_id, len(self.data), b'')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_chunk_files_removed(self):
+        # test: only the staging file is left once a chunk is written
+
+        upload_id = self.start()
+        self.send(upload_id, 0, self.data[:10])
+
+        self.assertEqual(
+            os.listdir(os.path.dirname(
+                ImageUpload.objects.get(id=upload_id).staging_path
+            )),
+            [f'{upload_id}.part']
+        )
+
+    def test_purged_recipe_drops_staging_file(self):
+        # test: uploads deleted with their recipe leave no file behind
+
+        upload_id = self.start()
+        self.send(upload_id, 0, self.data[:10])
+        staging_path = ImageUpload.objects.get(id=upload_id).staging_path
+
+        self.recipe.soft_delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            purge_deleted()
+
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(staging_path))
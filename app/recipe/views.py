@@ -2,6 +2,14 @@
 views for recipe api
 """
 
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import (
+    FilteredRelation,
+    Q,
+)
+from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -12,17 +20,101 @@ from rest_framework import (
     viewsets,
     mixins,
     status,
+    views,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import (
+    ParseError,
+    UnsupportedMediaType,
+    ValidationError,
+)
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (
+    IsAuthenticated,
+    SAFE_METHODS,
+)
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from core import uploads
 from core.models import (
+    Change,
+    ImageUpload,
     Recipe,
     Tag,
     Ingredient,
 )
+from core.db_router import (
+    is_pinned,
+    pin_to_primary,
+    primary_reads,
+    start_replica_reads,
+    stop_replica_reads,
+)
+from core.purge import schedule_purge
+from core.recipe_index import (
+    COSINE,
+    JACCARD,
+    find_by_pantry,
+    find_similar,
+)
+from core.tiered_cache import TieredCache
+from core.throttling import (
+    ScopedTokenBucketThrottle,
+    UserTokenBucketThrottle,
+)
 from recipe import serializers
+from recipe.fast_serializers import (
+    recipe_detail_reader,
+    recipe_reader,
+)
+
+# list responses per user, until the user's recipes, tags or
+# ingredients change. identical requests running at the same time
+# share one query
+recipe_list_cache = TieredCache(
+    'recipe-list',
+    ttl=settings.RECIPE_LIST_CACHE_SECONDS,
+    topics=['recipes', 'tags', 'ingredients', 'user'],
+)
+
+# content type of an upload chunk, as in the tus protocol
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+UPLOAD_ID_PARAMETER = OpenApiParameter(
+    'upload_id',
+    OpenApiTypes.UUID,
+    OpenApiParameter.PATH,
+)
+
+
+class ReplicaReadMixin:
+    # serve safe read actions from a read replica
+    # a user who just wrote stays on the primary for
+    # REPLICA_PIN_SECONDS so they always read their own writes
+
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        # authentication above always runs against the primary
+        if self.action in self.replica_actions and \
+                not is_pinned(request.user.id):
+            self._replica_token = start_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            stop_replica_reads(token)
+            self._replica_token = None
+
+        if request.method not in SAFE_METHODS and \
+                response.status_code < 400 and \
+                request.user.is_authenticated:
+            pin_to_primary(request.user.id)
+
+        return super().finalize_response(request, response, *args, **kwargs)
 
 
 @extend_schema_view(
@@ -41,7 +133,7 @@ from recipe import serializers
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     # view for managing recipe api
 
     serializer_class = serializers.RecipeDetailSerializer
@@ -50,8 +142,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
     # the following two lines
     # will require the user to be authenticated
     # in order to interact with recipe api
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, ScopedTokenBucketThrottle]
+    throttle_scope = {'list': 'recipe-list', 'batch': 'recipe-list'}
+    replica_actions = ('list', 'retrieve', 'batch')
 
     def _params_to_ints(self, queries):
         # convert a list of strings to integers
@@ -74,7 +172,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         # not self.queryset.filter
         return queryset.filter(
-            user=self.request.user
+            user_id=self.request.user.id
         ).order_by('-id').distinct()
 
     def get_serializer_class(self):
@@ -84,15 +182,332 @@ class RecipeViewSet(viewsets.ModelViewSet):
             # notice there's no () at the end
             # ...RecipeSerializer()
             return serializers.RecipeSerializer
-        elif self.action == 'upload_image':
+        elif self.action == 'pantry':
+            return serializers.PantryRecipeSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'shopping_list':
+            return serializers.ShoppingListRequestSerializer
+        elif self.action in ('upload_image', 'finish_upload'):
             return serializers.RecipeImageSerializer
+        elif self.action in ('create_upload', 'upload_chunk'):
+            return serializers.ImageUploadSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        # list recipes through the precompiled read-only serializer
+        # it emits the same json as RecipeSerializer
+        # without building a model instance per row
+
+        def serialize():
+            queryset = self.filter_queryset(self.get_queryset())
+            return recipe_reader.serialize(queryset, request=request)
+
+        return self._cached_response(serialize)
+
+    def _cached_response(self, compute):
+        # serve compute() through recipe_list_cache
+        #
+        # misses are read from a replica like the rest of the request,
+        # unless the user's recipes changed within
+        # REPLICA_MAX_LAG_SECONDS. the value is shared with every worker
+        # for the cache's ttl, and a lagging replica could still miss
+        # that change. users pinned by their own writes read the
+        # primary anyway.
+
+        user_id = self.request.user.id
+
+        def compute_value():
+            # asked once the generation the value is stored under
+            # is known, so a write meanwhile sends it to the primary
+            if not recipe_list_cache.changed_within(
+                user_id,
+                settings.REPLICA_MAX_LAG_SECONDS,
+            ):
+                return compute()
+            with primary_reads():
+                return compute()
+
+        return Response(recipe_list_cache.get_or_set(
+            user_id,
+            self.request.get_full_path(),
+            compute_value,
+        ))
+
     def perform_create(self, serializer):
         # create a new recipe
 
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    def perform_destroy(self, instance):
+        # flag the recipe as deleted and return straight away
+        # the rows and image are removed by the background purge
+
+        instance.soft_delete()
+        Change.objects.record(
+            instance.user_id,
+            Change.RECIPE,
+            [instance.id],
+            deleted=True,
+        )
+        schedule_purge()
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                required=True,
+                description='Comma-separated list of ingredient ids at hand'
+            ),
+            OpenApiParameter(
+                'max_missing',
+                OpenApiTypes.INT,
+                description='Ingredients a recipe may miss, 0 by default'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Recipes to return, '
+                            f'{settings.PANTRY_MAX_RESULTS} at most'
+            ),
+        ],
+        responses=serializers.PantryRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=False, url_path='pantry')
+    def pantry(self, request):
+        # recipes that can be cooked from the given ingredients, or
+        # with up to max_missing more, fewest missing first
+        # answered from the in-memory index of core.recipe_index
+
+        params = request.query_params
+        try:
+            ingredient_ids = self._params_to_ints(params['ingredients'])
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'ingredients': 'A comma-separated list of ids is required.'}
+            )
+        max_missing = self._int_param('max_missing', 0)
+        limit = min(
+            self._int_param('limit', settings.PANTRY_MAX_RESULTS),
+            settings.PANTRY_MAX_RESULTS,
+        )
+
+        found = find_by_pantry(
+            request.user.id,
+            ingredient_ids,
+            max_missing,
+            limit,
+        )
+
+        return Response(self._ranked(found, 'missing'))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'metric',
+                OpenApiTypes.STR,
+                enum=[JACCARD, COSINE],
+                description=f'Similarity measure, {JACCARD} by default'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Recipes to return, '
+                            f'{settings.SIMILAR_MAX_RESULTS} at most'
+            ),
+        ],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        # the user's recipes sharing the most tags and ingredients
+        # with this one, answered from core.recipe_index
+
+        recipe = self.get_object()
+        metric = request.query_params.get('metric') or JACCARD
+        if metric not in (JACCARD, COSINE):
+            raise ValidationError(
+                {'metric': f'Must be {JACCARD} or {COSINE}.'}
+            )
+        limit = min(
+            self._int_param('limit', 10),
+            settings.SIMILAR_MAX_RESULTS,
+        )
+
+        found = find_similar(request.user.id, recipe.id, limit, metric)
+
+        return Response(self._ranked(found, 'similarity'))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ids',
+                OpenApiTypes.STR,
+                required=True,
+                description='Comma-separated list of recipe ids, '
+                            f'{settings.RECIPE_BATCH_MAX_IDS} at most'
+            ),
+            OpenApiParameter(
+                'fields',
+                OpenApiTypes.STR,
+                description='Comma-separated list of the fields to return, '
+                            'id is always included'
+            ),
+        ],
+        responses=serializers.RecipeBatchSerializer,
+    )
+    @action(methods=['GET'], detail=False, url_path='batch')
+    def batch(self, request):
+        # recipe details of several ids, in the order asked for
+        #
+        # the same data as the detail view in a constant number of
+        # queries, whatever the number of ids, through the compiled
+        # reader. responses are cached like lists.
+
+        try:
+            recipe_ids = list(dict.fromkeys(
+                self._params_to_ints(request.query_params['ids'])
+            ))
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'ids': 'A comma-separated list of ids is required.'}
+            )
+        if len(recipe_ids) > settings.RECIPE_BATCH_MAX_IDS:
+            raise ValidationError(
+                {'ids': f'At most {settings.RECIPE_BATCH_MAX_IDS} ids.'}
+            )
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = fields.split(',')
+            unknown = sorted(
+                set(fields) - set(recipe_detail_reader.field_names)
+            )
+            if unknown:
+                raise ValidationError(
+                    {'fields': f'Unknown fields: {", ".join(unknown)}.'}
+                )
+
+        def serialize():
+            recipes = {
+                recipe['id']: recipe
+                for recipe in recipe_detail_reader.serialize(
+                    self.queryset.filter(
+                        user_id=request.user.id,
+                        id__in=recipe_ids,
+                    ),
+                    request=request,
+                    fields=fields or None,
+                )
+            }
+            return {
+                'results': [
+                    recipes[recipe_id] for recipe_id in recipe_ids
+                    if recipe_id in recipes
+                ],
+                'not_found': [
+                    recipe_id for recipe_id in recipe_ids
+                    if recipe_id not in recipes
+                ],
+            }
+
+        return self._cached_response(serialize)
+
+    @extend_schema(responses=serializers.ShoppingListSerializer)
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        # the ingredients of several recipes, each once with the
+        # recipes using it, and the recipes' total price and time
+        #
+        # one query: the recipes left joined to their live
+        # ingredients. every id must be a live recipe of the user.
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = sorted(set(serializer.validated_data['recipes']))
+
+        rows = self.queryset.filter(
+            user_id=request.user.id,
+            id__in=recipe_ids,
+        ).annotate(
+            live_ingredients=FilteredRelation(
+                'ingredients',
+                condition=Q(ingredients__deleted_at__isnull=True),
+            ),
+        ).order_by(
+            'live_ingredients__name',
+            'live_ingredients__id',
+            'id',
+        ).values_list(
+            'id',
+            'price',
+            'time_minutes',
+            'live_ingredients__id',
+            'live_ingredients__name',
+        )
+
+        recipes = {}
+        ingredients = defaultdict(list)
+        names = {}
+        for recipe_id, price, time_minutes, ingredient_id, name in rows:
+            recipes[recipe_id] = (price, time_minutes)
+            if ingredient_id is not None:
+                names[ingredient_id] = name
+                ingredients[ingredient_id].append(recipe_id)
+        missing = [
+            recipe_id for recipe_id in recipe_ids
+            if recipe_id not in recipes
+        ]
+        if missing:
+            raise ValidationError({'recipes': [
+                f'Recipe {recipe_id} not found.' for recipe_id in missing
+            ]})
+
+        return Response(serializers.ShoppingListSerializer({
+            'recipes': recipe_ids,
+            'ingredients': [
+                {'id': ingredient_id, 'name': names[ingredient_id],
+                 'recipes': used_by}
+                for ingredient_id, used_by in ingredients.items()
+            ],
+            'total_price': sum(
+                (price for price, _ in recipes.values()),
+                Decimal('0.00'),
+            ),
+            'total_time_minutes': sum(
+                time_minutes for _, time_minutes in recipes.values()
+            ),
+        }).data)
+
+    def _ranked(self, found, score):
+        # list data of the recipes in found, [(id, score)], in order
+
+        recipes = {
+            recipe['id']: recipe for recipe in recipe_reader.serialize(
+                self.queryset.filter(
+                    user_id=self.request.user.id,
+                    id__in=[recipe_id for recipe_id, _ in found],
+                ),
+                request=self.request,
+            )
+        }
+        data = []
+        # a recipe deleted since the index caught up is skipped
+        for recipe_id, value in found:
+            if recipe_id in recipes:
+                data.append(dict(recipes[recipe_id], **{score: value}))
+
+        return data
+
+    def _int_param(self, name, default):
+        value = self.request.query_params.get(name, '')
+        if not value:
+            return default
+        if not value.isdigit():
+            raise ValidationError({name: 'Must be a whole number.'})
+
+        return int(value)
 
     # detail would be equal to recipe id
     @action(methods=['POST'], detail=True, url_path='upload-image')
@@ -104,10 +519,133 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            Change.objects.record(recipe.user_id, Change.RECIPE, [recipe.id])
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # resumable uploads for large images:
+    #   POST   uploads/               {filename, size, sha256} opens one
+    #   PATCH  uploads/<id>/          appends the body at Upload-Offset
+    #   GET    uploads/<id>/          returns the offset to resume from
+    #   POST   uploads/<id>/complete/ checks the sha256, sets the image
+    #   DELETE uploads/<id>/          abandons the upload
+    @action(methods=['POST'], detail=True, url_path='uploads')
+    def create_upload(self, request, pk=None):
+        # open a resumable image upload
+
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = uploads.start_upload(
+            request.user.id,
+            recipe,
+            **serializer.validated_data
+        )
+
+        return self._upload_response(upload, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        methods=['PATCH'],
+        request={CHUNK_CONTENT_TYPE: OpenApiTypes.BINARY},
+        parameters=[
+            OpenApiParameter(
+                'Upload-Offset',
+                OpenApiTypes.INT,
+                OpenApiParameter.HEADER,
+                required=True,
+                description='Offset the chunk is written at'
+            )
+        ]
+    )
+    @extend_schema(parameters=[UPLOAD_ID_PARAMETER])
+    @action(
+        methods=['GET', 'PATCH', 'DELETE'],
+        detail=True,
+        url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})',
+    )
+    def upload_chunk(self, request, pk=None, upload_id=None):
+        # report, extend or abandon an upload
+
+        upload = self._get_upload(upload_id)
+        if request.method == 'GET':
+            return self._upload_response(upload)
+        if request.method == 'DELETE':
+            uploads.discard_upload(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.content_type != CHUNK_CONTENT_TYPE:
+            raise UnsupportedMediaType(request.content_type)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            raise ParseError('Upload-Offset and Content-Length are required.')
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise ValidationError('Chunks are limited to {} bytes.'.format(
+                settings.UPLOAD_CHUNK_MAX_SIZE
+            ))
+
+        try:
+            # the body is streamed to disk, never read into memory whole
+            upload = uploads.append_chunk(upload.id, offset, request, length)
+        except uploads.UploadFinished as error:
+            return Response(
+                {'detail': str(error)},
+                status=status.HTTP_409_CONFLICT
+            )
+        except uploads.OffsetMismatch as error:
+            return self._upload_response(error, status.HTTP_409_CONFLICT)
+        except uploads.InvalidUpload as error:
+            raise ValidationError(str(error))
+
+        return self._upload_response(upload)
+
+    @extend_schema(parameters=[UPLOAD_ID_PARAMETER])
+    @action(
+        methods=['POST'],
+        detail=True,
+        url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/complete',
+    )
+    def finish_upload(self, request, pk=None, upload_id=None):
+        # turn a fully uploaded file into the recipe image
+
+        upload = self._get_upload(upload_id)
+        try:
+            recipe = uploads.finish_upload(upload)
+        except uploads.UploadFinished as error:
+            return Response(
+                {'detail': str(error)},
+                status=status.HTTP_409_CONFLICT
+            )
+        except uploads.OffsetMismatch as error:
+            return self._upload_response(error, status.HTTP_409_CONFLICT)
+        except uploads.InvalidUpload as error:
+            raise ValidationError(str(error))
+        Change.objects.record(recipe.user_id, Change.RECIPE, [recipe.id])
+
+        return Response(self.get_serializer(recipe).data)
+
+    def _get_upload(self, upload_id):
+        return get_object_or_404(
+            ImageUpload,
+            id=upload_id,
+            recipe=self.get_object(),
+            user_id=self.request.user.id,
+        )
+
+    def _upload_response(self, upload, status_code=status.HTTP_200_OK):
+        # upload may be an OffsetMismatch, which only knows the offset
+
+        if isinstance(upload, ImageUpload):
+            data = self.get_serializer(upload).data
+        else:
+            data = {'offset': upload.offset, 'detail': str(upload)}
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = upload.offset
+
+        return response
+
 
 # manually updates the documentation
 # because some are not generated
@@ -123,14 +661,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(ReplicaReadMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     # base viewset for recipe attributes
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle]
 
     def get_queryset(self):
         # filter queryset to authenticated user
@@ -140,11 +683,36 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
         )
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(
+                recipe__isnull=False,
+                recipe__deleted_at__isnull=True,
+            )
         return queryset.filter(
-            user=self.request.user
+            user_id=self.request.user.id
         ).order_by('-name').distinct()
 
+    def perform_update(self, serializer):
+        # save and log the change for sync
+
+        instance = serializer.save()
+        Change.objects.record(
+            instance.user_id,
+            self.change_kind,
+            [instance.id],
+        )
+
+    def perform_destroy(self, instance):
+        # soft delete, see RecipeViewSet.perform_destroy
+
+        instance.soft_delete()
+        Change.objects.record(
+            instance.user_id,
+            self.change_kind,
+            [instance.id],
+            deleted=True,
+        )
+        schedule_purge()
+
 
 # DestroyModelMixin handles deletion of tags
 # UpdateModelMixin handls update of tags
@@ -153,6 +721,7 @@ class TagViewSet(BaseRecipeAttrViewSet):
 
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    change_kind = Change.TAG
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
@@ -160,3 +729,88 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+    change_kind = Change.INGREDIENT
+
+
+class SyncView(views.APIView):
+    # delta sync for offline clients
+    #
+    # the change log holds the latest change of each object, numbered
+    # by the user's change sequence. a client sends the token of its
+    # last sync and gets the objects changed since, and the ids of the
+    # ones deleted, in one pass over change_user_seq_idx. no since
+    # means a full sync. at most SYNC_PAGE_SIZE changes are returned;
+    # with more=true the client syncs again with the new token.
+
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle]
+
+    kinds = {
+        Change.RECIPE: ('recipes', Recipe.objects.prefetch_related(
+            'tags', 'ingredients',
+        )),
+        Change.TAG: ('tags', Tag.objects.all()),
+        Change.INGREDIENT: ('ingredients', Ingredient.objects.all()),
+    }
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.STR,
+                description='Token of the last sync, empty for everything'
+            )
+        ],
+        responses=serializers.SyncSerializer,
+    )
+    def get(self, request):
+        since = request.query_params.get('since') or '0'
+        if not since.isdigit():
+            raise ValidationError({'since': 'Not a valid sync token.'})
+
+        limit = settings.SYNC_PAGE_SIZE
+        changes = list(
+            Change.objects.filter(
+                user_id=request.user.id,
+                seq__gt=int(since),
+            ).order_by('seq').values_list(
+                'seq', 'kind', 'object_id', 'deleted'
+            )[:limit + 1]
+        )
+        more = len(changes) > limit
+        changes = changes[:limit]
+
+        changed = {kind: [] for kind in self.kinds}
+        deleted = {name: [] for name, _ in self.kinds.values()}
+        for _, kind, object_id, is_deleted in changes:
+            if is_deleted:
+                deleted[self.kinds[kind][0]].append(object_id)
+            else:
+                changed[kind].append(object_id)
+
+        data = {
+            'token': str(changes[-1][0]) if changes else since,
+            'more': more,
+            'deleted': deleted,
+        }
+        for kind, (name, queryset) in self.kinds.items():
+            objects = list(queryset.filter(
+                user_id=request.user.id,
+                id__in=changed[kind],
+            ).order_by('id')) if changed[kind] else []
+            data[name] = objects
+            # changed, then deleted before the log caught up
+            found = {obj.id for obj in objects}
+            deleted[name].extend(
+                object_id for object_id in changed[kind]
+                if object_id not in found
+            )
+
+        return Response(serializers.SyncSerializer(
+            data,
+            context={'request': request},
+        ).data)
@@ -7,7 +7,14 @@ from django.contrib.auth import (
     authenticate,
 )
 from django.utils.translation import gettext as _
-from rest_framework import serializers
+from rest_framework import (
+    exceptions,
+    serializers,
+)
+from core.hashers import (
+    HashPoolBusy,
+    run_hashing,
+)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,7 +27,11 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # create and return a new user with encrypted password
-        return get_user_model().objects.create_user(**validated_data)
+        try:
+            return get_user_model().objects.create_user(**validated_data)
+        except HashPoolBusy:
+            # every hashing slot is taken, ask the client to retry
+            raise exceptions.Throttled(wait=1)
 
     # instance: model instance that's going to be updated
     # validated_data: data that got passed in
@@ -28,12 +39,14 @@ class UserSerializer(serializers.ModelSerializer):
         # update and return the user
 
         # update password is optional
+        # it is hashed first, so a busy pool changes nothing
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
-
         if password:
-            user.set_password(password)
-            user.save()
+            try:
+                run_hashing(instance.set_password, password)
+            except HashPoolBusy:
+                raise exceptions.Throttled(wait=1)
+        user = super().update(instance, validated_data)
 
         return user
 
@@ -50,11 +63,15 @@ class AuthTokenSerializer(serializers.Serializer):
         # validate and authenticate the user
         email = attributes.get('email')
         password = attributes.get('password')
-        user = authenticate(
-            request=self.context.get('request'),
-            username=email,
-            password=password
-        )
+        try:
+            user = authenticate(
+                request=self.context.get('request'),
+                username=email,
+                password=password
+            )
+        except HashPoolBusy:
+            # every hashing slot is taken, ask the client to retry
+            raise exceptions.Throttled(wait=1)
 
         if not user:
             msg = _('Cannot authenticate user with provided credentials')
@@ -62,3 +79,15 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attributes['user'] = user
         return attributes
+
+
+class IssuedTokenSerializer(serializers.Serializer):
+    # serializer for a newly issued expiring token
+    token = serializers.CharField(read_only=True)
+    expires_at = serializers.DateTimeField(read_only=True)
+
+
+class AccessTokenSerializer(serializers.Serializer):
+    # serializer for a signed access token
+    access = serializers.CharField(read_only=True)
+    expires_at = serializers.DateTimeField(read_only=True)
@@ -2,16 +2,29 @@
 tests for user api
 """
 
+from datetime import timedelta
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
+from core.models import (
+    AuthToken,
+    token_cache_key,
+)
+from core.signed_tokens import clear_revocations
+from core.tiered_cache import clear_caches
+from user.views import user_cache
 
 # url endpoints
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+TOKEN_ROTATE_URL = reverse('user:token-rotate')
+TOKEN_REVOKE_URL = reverse('user:token-revoke')
+TOKEN_ACCESS_URL = reverse('user:token-access')
 
 
 def create_user(**params):
@@ -123,6 +136,7 @@ class PublicUserApiTests(TestCase):
 class PrivateUserApiTests(TestCase):
     # authenticated tests (signed in)
     def setUp(self):
+        clear_caches()
         self.user = create_user(
             email='test@example.com',
             password='123456',
@@ -131,6 +145,9 @@ class PrivateUserApiTests(TestCase):
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
 
+    def tearDown(self):
+        clear_revocations()
+
     def test_retrieve_profile_success(self):
         # test the retrieval of profile for logged in user
         res = self.client.get(ME_URL)
@@ -147,6 +164,15 @@ class PrivateUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_delete_user(self):
+        # test: deleting the account deactivates it straight away
+        res = self.client.delete(ME_URL)
+
+        self.user.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+
     def test_update_user_profile(self):
         # test: update user profile for the logged in user
         payload = {
@@ -160,3 +186,144 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_profile_cached_until_update(self):
+        # test: profiles are served from cache until the user changes
+        self.client.get(ME_URL)
+        hits = user_cache.counts['l1_hits']
+
+        self.client.get(ME_URL)
+
+        self.assertEqual(user_cache.counts['l1_hits'], hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(ME_URL, {'name': 'Updated Name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'Updated Name')
+
+    def test_profile_follows_saves_elsewhere(self):
+        # test: saving the user outside the api, e.g. in the admin,
+        # drops the cached profile as well
+
+        self.client.get(ME_URL)
+        user = get_user_model().objects.get(pk=self.user.pk)
+        user.name = 'Renamed by admin'
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        # force_authenticate hands views the very object it was given
+        self.client.force_authenticate(user)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'Renamed by admin')
+
+
+class TokenApiTests(TestCase):
+    # test expiring tokens, rotation and revocation
+
+    def setUp(self):
+        self.user = create_user(email='test@example.com', password='123456')
+        self.client = APIClient()
+
+    def tearDown(self):
+        clear_revocations()
+
+    def login(self):
+        # log in and return the issued token key
+        payload = {'email': 'test@example.com', 'password': '123456'}
+        return self.client.post(TOKEN_URL, payload).data['token']
+
+    def authenticate(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+
+    def test_token_expires(self):
+        # test: issued tokens carry an expiry and stop working after it
+        key = self.login()
+        self.authenticate(key)
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+        expired = AuthToken.objects.create(
+            user=self.user,
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.authenticate(expired.key)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_deactivated_user_refused(self):
+        # test: a user deactivated without signals loses access once
+        # the cached token lookup runs out
+        key = self.login()
+        self.authenticate(key)
+        self.client.get(ME_URL)  # caches the token
+
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+        cache.delete(token_cache_key(key))
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_login_gets_own_token(self):
+        # test: logging in twice gives two tokens
+        self.assertNotEqual(self.login(), self.login())
+        self.assertEqual(AuthToken.objects.filter(user=self.user).count(), 2)
+
+    def test_rotate_token(self):
+        # test: rotating replaces the token used for the request
+        old_key = self.login()
+        self.authenticate(old_key)
+
+        res = self.client.post(TOKEN_ROTATE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], old_key)
+        self.assertFalse(AuthToken.objects.filter(key=old_key).exists())
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        self.authenticate(res.data['token'])
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+    def test_revoke_all_tokens(self):
+        # test: revoking logs the user out on every device
+        other_key = self.login()
+        key = self.login()
+        self.authenticate(other_key)
+        self.client.get(ME_URL)  # caches the token
+        self.authenticate(key)
+
+        res = self.client.post(TOKEN_REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AuthToken.objects.filter(user=self.user).exists())
+        self.authenticate(other_key)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_access_token(self):
+        # test: a refresh token can be traded for a signed access token
+        self.authenticate(self.login())
+
+        res = self.client.post(TOKEN_ACCESS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {res.data["access"]}'
+        )
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_revoke_invalidates_access_tokens(self):
+        # test: revoking also rejects access tokens already handed out
+        key = self.login()
+        self.authenticate(key)
+        access = self.client.post(TOKEN_ACCESS_URL).data['access']
+
+        self.client.post(TOKEN_REVOKE_URL)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
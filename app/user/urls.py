@@ -10,5 +10,20 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path(
+        'token/rotate/',
+        views.RotateTokenView.as_view(),
+        name='token-rotate'
+    ),
+    path(
+        'token/access/',
+        views.AccessTokenView.as_view(),
+        name='token-access'
+    ),
+    path(
+        'token/revoke/',
+        views.RevokeTokensView.as_view(),
+        name='token-revoke'
+    ),
     path('me/', views.ManageUserView.as_view(), name='me'),
 ]
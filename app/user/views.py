@@ -2,15 +2,55 @@
 views for the user api
 """
 
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema
+from rest_framework import (
+    generics,
+    permissions,
+    status,
+    views,
+)
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core.authentication import (
+    ExpiringTokenAuthentication,
+    SignedTokenAuthentication,
+    TokenPrincipal,
+)
+from core.models import AuthToken
+from core.purge import schedule_purge
+from core.signed_tokens import (
+    encode_access_token,
+    revoke_access_tokens,
+)
+from core.tiered_cache import TieredCache
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    IssuedTokenSerializer,
+    AccessTokenSerializer,
+)
+
+# profile responses, until the user changes
+user_cache = TieredCache(
+    'user',
+    ttl=settings.USER_CACHE_SECONDS,
+    topics=['user'],
 )
 
 
+def token_response(token):
+    # response body for a newly issued token
+
+    return Response(IssuedTokenSerializer({
+        'token': token.key,
+        'expires_at': token.expires_at,
+    }).data)
+
+
 class CreateUserView(generics.CreateAPIView):
     # create a new user in the system
     serializer_class = UserSerializer
@@ -24,18 +64,104 @@ class CreateTokenView(ObtainAuthToken):
 
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES  # optional
 
+    @extend_schema(responses=IssuedTokenSerializer)
+    def post(self, request, *args, **kwargs):
+        # every login gets its own expiring token
+        # instead of the one permanent token per user
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = AuthToken.objects.issue(serializer.validated_data['user'])
+
+        return token_response(token)
+
+
+class RotateTokenView(views.APIView):
+    # swap the token used for this request for a fresh one
+
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses=IssuedTokenSerializer)
+    def post(self, request):
+        with transaction.atomic():
+            token = AuthToken.objects.issue(request.user)
+            AuthToken.objects.revoke([request.auth])
+
+        return token_response(token)
+
+
+class AccessTokenView(views.APIView):
+    # trade a database-backed token for a short-lived signed access token
+    # the AuthToken acts as the long-lived refresh token
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses=AccessTokenSerializer)
+    def post(self, request):
+        user = request.user.get_full_user()
+        access = encode_access_token(
+            user.id,
+            user.token_version,
+            is_staff=user.is_staff,
+        )
+
+        return Response(AccessTokenSerializer({
+            'access': access,
+            'expires_at': timezone.now() + settings.ACCESS_TOKEN_TTL,
+        }).data)
+
+
+class RevokeTokensView(views.APIView):
+    # revoke every token of the authenticated user, on every device
+
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request):
+        AuthToken.objects.revoke_for_user(request.user.id)
+        revoke_access_tokens(request.user.id)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     # manage the authenticated user
 
     serializer_class = UserSerializer
 
     # who is this user?
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        SignedTokenAuthentication,
+        ExpiringTokenAuthentication,
+    ]
 
     # what is this user allowed to do?
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         # retrieve and return the authenticated user
-        return self.request.user
+        # token authentication gives a TokenPrincipal
+        # that only loads the full user on request
+        user = self.request.user
+        if isinstance(user, TokenPrincipal):
+            return user.get_full_user()
+
+        return user
+
+    def retrieve(self, request, *args, **kwargs):
+        # cached profiles don't load the user at all
+
+        def serialize():
+            return dict(self.get_serializer(self.get_object()).data)
+
+        return Response(
+            user_cache.get_or_set(request.user.id, 'profile', serialize)
+        )
+
+    def perform_destroy(self, instance):
+        # deactivate the account and flag everything it owns as deleted
+        # the data itself is removed by the background purge
+        instance.soft_delete()
+        schedule_purge()